@@ -17,7 +17,7 @@ const API_MOCK_SCENARIO: MockScenario =
 const API_MOCK_DELAY_MS = Number(process.env.EXPO_PUBLIC_API_MOCK_DELAY_MS ?? 350);
 
 export type MenuItem = { id: string; name: string; price: number; available: boolean };
-export type OrderStatus = "QUEUED" | "IN_PROGRESS" | "READY" | "COMPLETED" | "CANCELLED";
+export type OrderStatus = "PENDING_PAYMENT" | "QUEUED" | "IN_PROGRESS" | "READY" | "COMPLETED" | "CANCELLED";
 export type OrderResp = { order_id: string; status: OrderStatus; eta_minutes: number };
 export type OrderDetails = {
   order_id: string;
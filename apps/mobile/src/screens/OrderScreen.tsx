@@ -8,7 +8,7 @@ import { apiGetOrder, type OrderStatus } from "../lib/api";
 
 type Props = NativeStackScreenProps<RootStackParamList, "Order">;
 
-const steps: OrderStatus[] = ["QUEUED", "IN_PROGRESS", "READY", "COMPLETED", "CANCELLED"];
+const steps: OrderStatus[] = ["PENDING_PAYMENT", "QUEUED", "IN_PROGRESS", "READY", "COMPLETED", "CANCELLED"];
 const terminalStates: OrderStatus[] = ["READY", "COMPLETED", "CANCELLED"];
 const NOTIFICATION_WS_URL =
   process.env.EXPO_PUBLIC_NOTIFICATION_WS_URL || "ws://localhost:8005/ws";
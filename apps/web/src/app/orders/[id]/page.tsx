@@ -7,6 +7,7 @@ import { getMyOrders, getOrder, getOrderSlipUrl, markOrderSlipPrinted, type Orde
 import { getToken } from "@/lib/storage";
 
 const steps: OrderStatus[] = [
+  "PENDING_PAYMENT",
   "QUEUED",
   "IN_PROGRESS",
   "READY",
@@ -47,6 +47,7 @@ export interface MenuItem {
 }
 
 export type OrderStatus =
+  | "PENDING_PAYMENT"
   | "QUEUED"
   | "IN_PROGRESS"
   | "READY"
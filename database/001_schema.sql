@@ -111,6 +111,20 @@ CREATE TABLE IF NOT EXISTS stock_reservations (
     UNIQUE(order_id, item_id)
 );
 
+CREATE TABLE IF NOT EXISTS stock_shards (
+    item_id TEXT PRIMARY KEY REFERENCES menu_items(id) ON DELETE CASCADE,
+    bucket_count INTEGER NOT NULL CHECK (bucket_count > 1),
+    synced_total INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS stock_buckets (
+    item_id TEXT NOT NULL REFERENCES stock_shards(item_id) ON DELETE CASCADE,
+    bucket_no INTEGER NOT NULL CHECK (bucket_no >= 0),
+    qty INTEGER NOT NULL CHECK (qty >= 0),
+    PRIMARY KEY (item_id, bucket_no)
+);
+
 CREATE TABLE IF NOT EXISTS order_idempotency (
     id BIGSERIAL PRIMARY KEY,
     student_id TEXT NOT NULL REFERENCES students(student_id) ON DELETE CASCADE,
@@ -159,6 +173,7 @@ CREATE TABLE IF NOT EXISTS event_outbox (
     published_at TIMESTAMPTZ,
     attempts INTEGER NOT NULL DEFAULT 0,
     last_error TEXT,
+    locked_until TIMESTAMPTZ,
     created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
 );
 
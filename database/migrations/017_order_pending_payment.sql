@@ -0,0 +1,16 @@
+-- ORDER_PIPELINE_MODE=async stores orders as PENDING_PAYMENT until the payment stage runs.
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1
+        FROM pg_constraint
+        WHERE conname = 'chk_orders_status_valid'
+          AND pg_get_constraintdef(oid) LIKE '%PENDING_PAYMENT%'
+    ) THEN
+        ALTER TABLE orders DROP CONSTRAINT IF EXISTS chk_orders_status_valid;
+        ALTER TABLE orders
+            ADD CONSTRAINT chk_orders_status_valid
+            CHECK (status IN ('PENDING_PAYMENT', 'QUEUED', 'IN_PROGRESS', 'READY', 'COMPLETED', 'CANCELLED'));
+    END IF;
+END
+$$;
@@ -0,0 +1,15 @@
+-- Hot-item stock sharding: a sharded item's stock lives in stock_buckets and
+-- menu_items.stock_quantity is a mirror the stock-service rebalancer keeps in sync.
+CREATE TABLE IF NOT EXISTS stock_shards (
+    item_id TEXT PRIMARY KEY REFERENCES menu_items(id) ON DELETE CASCADE,
+    bucket_count INTEGER NOT NULL CHECK (bucket_count > 1),
+    synced_total INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS stock_buckets (
+    item_id TEXT NOT NULL REFERENCES stock_shards(item_id) ON DELETE CASCADE,
+    bucket_no INTEGER NOT NULL CHECK (bucket_no >= 0),
+    qty INTEGER NOT NULL CHECK (qty >= 0),
+    PRIMARY KEY (item_id, bucket_no)
+);
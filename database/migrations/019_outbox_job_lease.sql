@@ -0,0 +1,4 @@
+-- Payment-stage jobs are leased: a worker sets locked_until while it calls
+-- payment and stock without holding a row lock, and a failed attempt pushes
+-- locked_until out as its retry backoff.
+ALTER TABLE event_outbox ADD COLUMN IF NOT EXISTS locked_until TIMESTAMPTZ;
@@ -32,6 +32,8 @@ setup_one() {
   source "${venv_path}/bin/activate"
   python -m pip install --upgrade pip
   pip install -r "${requirements}"
+  # Modules shared between services (services/shared) are importable like in the images.
+  echo "${SERVICES_DIR}/shared" > "$(python -c 'import sysconfig; print(sysconfig.get_paths()["purelib"])')/cafeteria-shared.pth"
   deactivate
 
   echo "Done: ${service_name}"
@@ -310,7 +310,7 @@ def verify_token(authorization: str | None = Header(default=None)):
         metrics["verify_failed_total"] += 1
         raise HTTPException(status_code=401, detail="Invalid token payload")
 
-    return {"valid": True, "student_id": student_id, "role": role}
+    return {"valid": True, "student_id": student_id, "role": role, "exp": claims.get("exp")}
 
 
 @app.post("/refresh")
@@ -4,12 +4,15 @@ import random
 import threading
 import time
 from datetime import datetime, timedelta, timezone
+from typing import Any
 
 import pika
 import psycopg
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 
+import rabbit_publisher
+
 app = FastAPI()
 
 chaos_state = {"enabled": False, "mode": "error"}
@@ -31,12 +34,6 @@ def _db_conn():
     )
 
 
-def _rabbit_params() -> pika.ConnectionParameters:
-    host = os.getenv("RABBITMQ_HOST", "rabbitmq")
-    port = int(os.getenv("RABBITMQ_PORT", "5672"))
-    return pika.ConnectionParameters(host=host, port=port)
-
-
 class ChaosRequest(BaseModel):
     enabled: bool
     mode: str = "error"
@@ -101,17 +98,7 @@ def _publish_status(
         "pickup_counter": pickup_counter,
         "ready_until": ready_until.isoformat() if ready_until else None,
     }
-
-    connection = pika.BlockingConnection(_rabbit_params())
-    channel = connection.channel()
-    channel.queue_declare(queue="order.status", durable=True)
-    channel.basic_publish(
-        exchange="",
-        routing_key="order.status",
-        body=json.dumps(payload),
-        properties=pika.BasicProperties(delivery_mode=2),
-    )
-    connection.close()
+    rabbit_publisher.publish_queue("order.status", payload)
 
 
 def _set_order_status(order_id: str, from_status: str, to_status: str, eta_minutes: int) -> dict | None:
@@ -198,7 +185,7 @@ def _process_message(body: bytes) -> None:
 def _worker_loop(worker_name: str) -> None:
     while worker_state["running"]:
         try:
-            connection = pika.BlockingConnection(_rabbit_params())
+            connection = pika.BlockingConnection(rabbit_publisher.connection_params())
             channel = connection.channel()
             channel.queue_declare(queue="kitchen.jobs", durable=True)
             channel.basic_qos(prefetch_count=_prefetch_count())
@@ -234,6 +221,7 @@ def on_startup():
 @app.on_event("shutdown")
 def on_shutdown():
     worker_state["running"] = False
+    rabbit_publisher.close_all()
 
 
 @app.get("/health")
@@ -250,7 +238,7 @@ def health():
         raise HTTPException(status_code=503, detail=f"database unavailable: {exc}")
 
     try:
-        connection = pika.BlockingConnection(_rabbit_params())
+        connection = pika.BlockingConnection(rabbit_publisher.connection_params())
         connection.close()
     except Exception as exc:
         raise HTTPException(status_code=503, detail=f"rabbitmq unavailable: {exc}")
@@ -263,6 +251,8 @@ def get_metrics():
     return {
         "orders_processed_total": metrics["orders_processed_total"],
         "failures_total": metrics["failures_total"],
+        "rabbit_connections_opened_total": rabbit_publisher.metrics["connections_opened_total"],
+        "rabbit_publish_retries_total": rabbit_publisher.metrics["publish_retries_total"],
     }
 
 
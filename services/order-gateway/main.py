@@ -1,27 +1,43 @@
+import asyncio
+import bisect
+import functools
+import hashlib
+import heapq
 import json
+import logging
+import math
 import os
 import threading
 import time
 import uuid
 from base64 import b64encode
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
 from datetime import date, datetime, time as dt_time, timedelta, timezone
 from html import escape
 from io import BytesIO
-from typing import Any
+from typing import Any, AsyncIterator, Iterator
 from zoneinfo import ZoneInfo
 
+import anyio
 import httpx
 import pika
 import psycopg
 import qrcode
 import qrcode.image.svg
 import redis
+import redis.asyncio
 from fastapi import Cookie, FastAPI, Header, HTTPException, Query, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import HTMLResponse, JSONResponse
+from psycopg_pool import AsyncConnectionPool, ConnectionPool, PoolTimeout, TooManyRequests
 from pydantic import BaseModel, Field
 
+import rabbit_publisher
+
 app = FastAPI()
+logger = logging.getLogger("order-gateway")
 _cors_origins = [x.strip() for x in os.getenv("CORS_ALLOWED_ORIGINS", "http://localhost:3000").split(",") if x.strip()]
 app.add_middleware(
     CORSMiddleware,
@@ -39,15 +55,105 @@ metrics: dict[str, float] = {
     "latency_count": 0,
     "outbox_published_total": 0,
     "outbox_publish_failed_total": 0,
+    "payment_stage_completed_total": 0,
+    "payment_stage_retries_total": 0,
+    "payment_stage_cancelled_total": 0,
+    "payment_stage_refund_failed_total": 0,
+    "stock_release_failed_total": 0,
+    "db_pool_acquire_timeouts_total": 0,
+    "auth_cache_hits_total": 0,
+    "auth_cache_misses_total": 0,
+    "menu_l1_hits_total": 0,
+    "menu_l1_misses_total": 0,
+    "menu_l2_hits_total": 0,
+    "menu_not_modified_total": 0,
+    "menu_coalesced_total": 0,
+    "menu_background_refreshes_total": 0,
+    "menu_prewarms_total": 0,
+    "cache_events_received_total": 0,
+    "cache_bus_reconnects_total": 0,
+    "price_catalog_loads_total": 0,
+    "price_catalog_fallback_lookups_total": 0,
+    "orders_admitted_total": 0,
+    "orders_queued_total": 0,
+    "orders_shed_queue_full_total": 0,
+    "orders_shed_wait_timeout_total": 0,
+    "orders_shed_kitchen_backlog_total": 0,
+    "orders_rate_limited_total": 0,
+    "rate_limit_local_fallback_total": 0,
+    "idempotency_claims_total": 0,
+    "idempotency_follower_waits_total": 0,
+    "idempotency_claim_unavailable_total": 0,
+    "idempotency_cache_hits_total": 0,
+    "idempotency_db_lookups_total": 0,
+    "idempotency_index_backfills_total": 0,
+    "idempotency_duplicates_blocked_total": 0,
+    "redis_failures_total": 0,
+    "menu_schedule_builds_total": 0,
 }
 latency_samples_ms: list[float] = []
+# (monotonic time, ms) per finished order; admission only looks at the recent window.
+admission_latency_samples: deque[tuple[float, float]] = deque(maxlen=20000)
+db_acquire_samples_ms: list[float] = []
+cache_event_lag_samples_ms: list[float] = []
 service_started_at = time.time()
 
 chaos_state = {"enabled": False, "mode": "error"}
 outbox_worker_state = {"running": True}
 cache_worker_state = {"running": True}
+CACHE_EVENTS_EXCHANGE = "cache.events"
+REPLICA_ID = uuid.uuid4().hex[:12]
+cache_bus_state: dict[str, Any] = {"connected": False, "queue": None, "last_event_at": None}
 ACCESS_COOKIE_NAME = os.getenv("ACCESS_COOKIE_NAME", "access_token")
 redis_client: redis.Redis | None = None
+# The order and menu endpoints run on the event loop and use async twins of the
+# Redis client, DB pool and upstream clients; admin routes and workers stay sync.
+async_redis_client: redis.asyncio.Redis | None = None
+redis_state = {"retry_at": 0.0, "backoff_seconds": 0.0}
+redis_state_lock = threading.Lock()
+menu_cache_state = {"version": 0}
+menu_l1_cache: dict[tuple[str, str, str | None, bool], dict[str, Any]] = {}
+menu_l1_lock = threading.Lock()
+menu_flights: dict[tuple[Any, ...], threading.Event] = {}
+price_catalog: dict[str, Any] = {"version": None, "loaded_at": 0.0, "items": {}}
+price_catalog_lock = asyncio.Lock()
+admission_state: dict[str, Any] = {"in_flight": 0, "waiting": 0, "limit": 0, "kitchen_depth": -1, "p95_ms": 0.0}
+admission_cond = asyncio.Condition()
+# One channel is kept for queue-depth probes instead of a connection per poll.
+queue_depth_state: dict[str, Any] = {"connection": None, "channel": None}
+queue_depth_lock = threading.Lock()
+redis_scripts: dict[str, Any] = {"client": None, "scripts": {}}
+# Set when a keyed order commits without its Redis record; Redis misses stop being trusted.
+idempotency_index_state = {"stale": False}
+rate_limit_buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+rate_limit_lock = threading.Lock()
+db_pool: ConnectionPool | None = None
+db_pool_lock = threading.Lock()
+async_db_pool: AsyncConnectionPool | None = None
+async_tasks: list[asyncio.Task] = []
+claims_cache: OrderedDict[str, tuple[float, dict[str, Any]]] = OrderedDict()
+claims_cache_lock = threading.Lock()
+
+
+def _env_int(name: str, default: int, minimum: int = 1) -> int:
+    raw = os.getenv(name, str(default))
+    try:
+        value = int(raw)
+        return value if value >= minimum else default
+    except ValueError:
+        return default
+
+
+def _env_float(name: str, default: float, minimum: float | None = None) -> float:
+    # Without a minimum the value must be positive; pass minimum=0.0 where zero means something.
+    raw = os.getenv(name, str(default))
+    try:
+        value = float(raw)
+    except ValueError:
+        return default
+    if minimum is None:
+        return value if value > 0 else default
+    return value if value >= minimum else default
 
 
 def _stock_cache_ttl_seconds() -> int:
@@ -59,6 +165,79 @@ def _stock_cache_ttl_seconds() -> int:
         return 3
 
 
+def _menu_l1_ttl_seconds() -> int:
+    return _env_int("MENU_L1_TTL_SECONDS", 10)
+
+
+def _menu_refresh_ahead_fraction() -> float:
+    # Share of a menu entry's TTL after which it is served stale and rebuilt in the background.
+    return min(_env_float("MENU_REFRESH_AHEAD_FRACTION", 0.8), 1.0)
+
+
+def _menu_single_flight_wait_seconds() -> float:
+    return _env_float("MENU_SINGLE_FLIGHT_WAIT_SECONDS", 2.0)
+
+
+def _order_max_in_flight() -> int:
+    # Default matches DB_POOL_MAX_SIZE: each admitted order holds a pooled connection,
+    # while waiters are parked coroutines bounded by ORDER_ADMISSION_QUEUE_SIZE.
+    return _env_int("ORDER_MAX_IN_FLIGHT", 20)
+
+
+def _order_admission_queue_size() -> int:
+    return _env_int("ORDER_ADMISSION_QUEUE_SIZE", 8, minimum=0)
+
+
+def _order_admission_wait_seconds() -> float:
+    return _env_float("ORDER_ADMISSION_WAIT_SECONDS", 0.5)
+
+
+def _order_admission_p95_target_ms() -> float:
+    return _env_float("ORDER_ADMISSION_P95_TARGET_MS", 1500.0)
+
+
+def _order_admission_p95_window_seconds() -> float:
+    return _env_float("ORDER_ADMISSION_P95_WINDOW_SECONDS", 60.0)
+
+
+def _order_shed_kitchen_queue_depth() -> int:
+    # 0 disables kitchen-backlog shedding.
+    return _env_int("ORDER_SHED_KITCHEN_QUEUE_DEPTH", 500, minimum=0)
+
+
+def _order_idempotency_lease_seconds() -> float:
+    # Must outlive a slow order (payment timeout included) or a second leader can start.
+    return _env_float("ORDER_IDEMPOTENCY_LEASE_SECONDS", 15.0)
+
+
+def _order_idempotency_wait_seconds() -> float:
+    return _env_float("ORDER_IDEMPOTENCY_WAIT_SECONDS", 3.0)
+
+
+def _order_idempotency_cache_ttl_seconds() -> int:
+    return _env_int("ORDER_IDEMPOTENCY_CACHE_TTL_SECONDS", 86400, minimum=60)
+
+
+def _order_rate_limit(role: str) -> tuple[float, float]:
+    """(burst, tokens per second); ORDER_RATE_LIMIT_*_<ROLE> overrides the defaults per role.
+
+    A rate of 0 per minute turns the limit off for that role.
+    """
+    suffix = role.strip().upper() or "STUDENT"
+    per_minute = _env_float(
+        f"ORDER_RATE_LIMIT_PER_MINUTE_{suffix}",
+        _env_float("ORDER_RATE_LIMIT_PER_MINUTE", 6.0, minimum=0.0),
+        minimum=0.0,
+    )
+    burst = _env_float(f"ORDER_RATE_LIMIT_BURST_{suffix}", _env_float("ORDER_RATE_LIMIT_BURST", 3.0))
+    return max(burst, 1.0), per_minute / 60.0
+
+
+def _price_catalog_ttl_seconds() -> int:
+    # Upper bound on price staleness if a menu.updated event is missed.
+    return _env_int("PRICE_CATALOG_TTL_SECONDS", 30)
+
+
 def _menu_cache_ttl_seconds() -> int:
     raw = os.getenv("MENU_CACHE_TTL_SECONDS", "60")
     try:
@@ -98,14 +277,142 @@ def _pickup_counter_label() -> str:
     return os.getenv("PICKUP_COUNTER_LABEL", "Counter 1")
 
 
-def _db_conn():
-    return psycopg.connect(
-        host=os.getenv("POSTGRES_HOST", "postgres"),
-        port=int(os.getenv("POSTGRES_PORT", "5432")),
-        dbname=os.getenv("POSTGRES_DB", "cafeteria"),
-        user=os.getenv("POSTGRES_USER", "cafeteria"),
-        password=os.getenv("POSTGRES_PASSWORD", "cafeteria"),
+def _db_pool_options(max_size_env: str) -> dict[str, Any]:
+    min_size = _env_int("DB_POOL_MIN_SIZE", 2, minimum=0)
+    return {
+        "kwargs": {
+            "host": os.getenv("POSTGRES_HOST", "postgres"),
+            "port": int(os.getenv("POSTGRES_PORT", "5432")),
+            "dbname": os.getenv("POSTGRES_DB", "cafeteria"),
+            "user": os.getenv("POSTGRES_USER", "cafeteria"),
+            "password": os.getenv("POSTGRES_PASSWORD", "cafeteria"),
+        },
+        "min_size": min_size,
+        "max_size": max(_env_int(max_size_env, 20), min_size, 1),
+        "timeout": _env_float("DB_POOL_ACQUIRE_TIMEOUT_SECONDS", 2.0),
+        "max_waiting": _env_int("DB_POOL_MAX_WAITING", 0, minimum=0),
+        "max_idle": _env_float("DB_POOL_MAX_IDLE_SECONDS", 300.0),
+        "max_lifetime": _env_float("DB_POOL_MAX_LIFETIME_SECONDS", 1800.0),
+    }
+
+
+def _db_pool() -> ConnectionPool:
+    global db_pool
+    if db_pool is not None:
+        return db_pool
+    with db_pool_lock:
+        if db_pool is None:
+            db_pool = ConnectionPool(
+                **_db_pool_options("DB_POOL_MAX_SIZE"),
+                # Validate idle connections on checkout so a Postgres restart or
+                # a dropped socket costs one reconnect instead of a failed request.
+                check=ConnectionPool.check_connection,
+                name="order-gateway",
+                open=True,
+            )
+    return db_pool
+
+
+async def _async_db_pool() -> AsyncConnectionPool:
+    global async_db_pool
+    if async_db_pool is not None:
+        return async_db_pool
+    pool = AsyncConnectionPool(
+        **_db_pool_options("DB_ASYNC_POOL_MAX_SIZE"),
+        check=AsyncConnectionPool.check_connection,
+        name="order-gateway-async",
+        open=False,
     )
+    await pool.open()
+    if async_db_pool is None:
+        async_db_pool = pool
+    else:
+        # Another request opened one while we were connecting.
+        await pool.close()
+    return async_db_pool
+
+
+def _close_db_pool() -> None:
+    global db_pool
+    if db_pool is not None:
+        try:
+            db_pool.close()
+        except Exception:
+            pass
+    db_pool = None
+
+
+async def _close_async_db_pool() -> None:
+    global async_db_pool
+    if async_db_pool is not None:
+        try:
+            await async_db_pool.close()
+        except Exception:
+            pass
+    async_db_pool = None
+
+
+def _record_db_acquire(started: float) -> None:
+    db_acquire_samples_ms.append((time.perf_counter() - started) * 1000)
+    if len(db_acquire_samples_ms) > 500:
+        del db_acquire_samples_ms[0]
+
+
+@contextmanager
+def _db_conn() -> Iterator[psycopg.Connection]:
+    pool = _db_pool()
+    started = time.perf_counter()
+    try:
+        conn = pool.getconn()
+    except (PoolTimeout, TooManyRequests) as exc:
+        metrics["db_pool_acquire_timeouts_total"] += 1
+        raise HTTPException(status_code=503, detail="Database busy, please retry") from exc
+    _record_db_acquire(started)
+    try:
+        # Same commit/rollback-on-exit behaviour as a plain psycopg connection.
+        with conn:
+            yield conn
+    finally:
+        pool.putconn(conn)
+
+
+@asynccontextmanager
+async def _async_db_conn() -> AsyncIterator[psycopg.AsyncConnection]:
+    pool = await _async_db_pool()
+    started = time.perf_counter()
+    try:
+        conn = await pool.getconn()
+    except (PoolTimeout, TooManyRequests) as exc:
+        metrics["db_pool_acquire_timeouts_total"] += 1
+        raise HTTPException(status_code=503, detail="Database busy, please retry") from exc
+    _record_db_acquire(started)
+    try:
+        async with conn:
+            yield conn
+    finally:
+        await pool.putconn(conn)
+
+
+def _db_pool_metrics() -> dict[str, float]:
+    # Both pools report together: one Postgres connection budget per replica.
+    stats: dict[str, int] = {}
+    for pool in (db_pool, async_db_pool):
+        if pool is not None:
+            for name, value in pool.get_stats().items():
+                stats[name] = stats.get(name, 0) + int(value)
+    pool_size = int(stats.get("pool_size", 0))
+    available = int(stats.get("pool_available", 0))
+    samples = list(db_acquire_samples_ms)
+    return {
+        "db_pool_size": pool_size,
+        "db_pool_in_use": max(pool_size - available, 0),
+        "db_pool_available": available,
+        "db_pool_waiting": int(stats.get("requests_waiting", 0)),
+        "db_pool_acquire_ms_avg": round(sum(samples) / len(samples), 2) if samples else 0,
+        "db_pool_acquire_ms_p95": round(_percentile(samples, 95), 2),
+        "db_pool_acquire_timeouts_total": metrics["db_pool_acquire_timeouts_total"],
+        "db_pool_connections_lost": int(stats.get("connections_lost", 0)),
+    }
 
 
 def _identity_url() -> str:
@@ -123,6 +430,26 @@ def _payment_url() -> str:
     return base.rstrip("/")
 
 
+def _order_pipeline_async() -> bool:
+    # async: ACK with 202 once stock is reserved and the order row is stored;
+    # payment, confirmation and the kitchen job run in the payment stage worker.
+    return os.getenv("ORDER_PIPELINE_MODE", "sync").strip().lower() == "async"
+
+
+def _order_payment_workers() -> int:
+    return _env_int("ORDER_PAYMENT_WORKERS", 4)
+
+
+def _order_payment_max_attempts() -> int:
+    return _env_int("ORDER_PAYMENT_MAX_ATTEMPTS", 5)
+
+
+def _order_payment_lease_seconds() -> int:
+    # Must outlast one payment call plus the stock confirm, or a second worker
+    # picks the job up while the first is still running it.
+    return _env_int("ORDER_PAYMENT_LEASE_SECONDS", 30)
+
+
 def _kitchen_url() -> str:
     base = os.getenv("KITCHEN_QUEUE_URL", "http://kitchen-queue:8000")
     return base.rstrip("/")
@@ -133,24 +460,192 @@ def _notification_url() -> str:
     return base.rstrip("/")
 
 
-def _rabbit_params() -> pika.ConnectionParameters:
-    host = os.getenv("RABBITMQ_HOST", "rabbitmq")
-    port = int(os.getenv("RABBITMQ_PORT", "5672"))
-    return pika.ConnectionParameters(host=host, port=port)
+UPSTREAM_DEFAULT_TIMEOUTS: dict[str, float] = {
+    "identity": 2.0,
+    "stock": 1.5,
+    "payment": 4.0,
+    "kitchen": 1.0,
+    "notification": 1.0,
+}
+# Per-call budgets kept from before the shared clients; the stock client's
+# default (1.5s) is the reservation budget.
+STOCK_CALL_TIMEOUTS: dict[str, float] = {"confirm": 2.0, "release": 2.0, "availability": 1.0}
+upstream_clients: dict[str, httpx.Client] = {}
+upstream_clients_lock = threading.Lock()
+async_upstream_clients: dict[str, httpx.AsyncClient] = {}
+upstream_http_metrics: dict[str, dict[str, float]] = {
+    name: {"requests_total": 0, "connections_opened_total": 0} for name in UPSTREAM_DEFAULT_TIMEOUTS
+}
+
+
+def _upstream_timeout_seconds(upstream: str) -> float:
+    return _env_float(f"{upstream.upper()}_HTTP_TIMEOUT_SECONDS", UPSTREAM_DEFAULT_TIMEOUTS[upstream])
+
+
+def _upstream_http2_enabled() -> bool:
+    return os.getenv("UPSTREAM_HTTP2", "false").lower() == "true"
+
+
+def _upstream_request_hook(upstream: str):
+    counters = upstream_http_metrics[upstream]
+
+    def _trace(event_name: str, _info: dict[str, Any]) -> None:
+        if event_name == "connection.connect_tcp.complete":
+            counters["connections_opened_total"] += 1
+
+    def _on_request(request: httpx.Request) -> None:
+        counters["requests_total"] += 1
+        request.extensions["trace"] = _trace
+
+    return _on_request
+
+
+def _async_upstream_request_hook(upstream: str):
+    # httpx awaits hooks and httpcore awaits trace callbacks on async clients.
+    on_request = _upstream_request_hook(upstream)
+
+    async def _on_request(request: httpx.Request) -> None:
+        on_request(request)
+        trace = request.extensions["trace"]
+
+        async def _trace(event_name: str, info: dict[str, Any]) -> None:
+            trace(event_name, info)
+
+        request.extensions["trace"] = _trace
+
+    return _on_request
+
+
+def _upstream_client_options(upstream: str) -> dict[str, Any]:
+    return {
+        "timeout": _upstream_timeout_seconds(upstream),
+        "limits": httpx.Limits(
+            max_connections=_env_int("UPSTREAM_MAX_CONNECTIONS", 50),
+            max_keepalive_connections=_env_int("UPSTREAM_MAX_KEEPALIVE_CONNECTIONS", 20),
+            keepalive_expiry=_env_float("UPSTREAM_KEEPALIVE_EXPIRY_SECONDS", 30.0),
+        ),
+    }
+
+
+def _upstream_client(upstream: str) -> httpx.Client:
+    client = upstream_clients.get(upstream)
+    if client is not None:
+        return client
+    with upstream_clients_lock:
+        client = upstream_clients.get(upstream)
+        if client is None:
+            options = _upstream_client_options(upstream)
+            options["event_hooks"] = {"request": [_upstream_request_hook(upstream)]}
+            try:
+                client = httpx.Client(http2=_upstream_http2_enabled(), **options)
+            except ImportError:
+                # http2=True needs the optional "h2" package; stay on HTTP/1.1 without it.
+                client = httpx.Client(**options)
+            upstream_clients[upstream] = client
+    return client
+
+
+def _async_upstream_client(upstream: str) -> httpx.AsyncClient:
+    # Only touched from the event loop, so no lock is needed.
+    client = async_upstream_clients.get(upstream)
+    if client is None:
+        options = _upstream_client_options(upstream)
+        options["event_hooks"] = {"request": [_async_upstream_request_hook(upstream)]}
+        try:
+            client = httpx.AsyncClient(http2=_upstream_http2_enabled(), **options)
+        except ImportError:
+            client = httpx.AsyncClient(**options)
+        async_upstream_clients[upstream] = client
+    return client
+
+
+def _close_upstream_clients() -> None:
+    with upstream_clients_lock:
+        clients = list(upstream_clients.values())
+        upstream_clients.clear()
+    for client in clients:
+        try:
+            client.close()
+        except Exception:
+            pass
+
+
+async def _close_async_upstream_clients() -> None:
+    clients = list(async_upstream_clients.values())
+    async_upstream_clients.clear()
+    for client in clients:
+        try:
+            await client.aclose()
+        except Exception:
+            pass
+
+
+def _upstream_http_metrics() -> dict[str, dict[str, float]]:
+    result: dict[str, dict[str, float]] = {}
+    for name, counters in upstream_http_metrics.items():
+        requests_total = counters["requests_total"]
+        opened = counters["connections_opened_total"]
+        result[name] = {
+            "requests_total": requests_total,
+            "connections_opened_total": opened,
+            "connections_reused_total": max(requests_total - opened, 0),
+        }
+    return result
 
 
 def _redis_url() -> str:
     return os.getenv("REDIS_URL", "redis://redis:6379/0")
 
 
+def _redis_socket_timeout_seconds() -> float:
+    return _env_float("REDIS_SOCKET_TIMEOUT_SECONDS", 0.5, minimum=0.05)
+
+
 def _init_redis() -> None:
     global redis_client
     try:
-        client = redis.Redis.from_url(_redis_url(), decode_responses=True)
+        timeout = _redis_socket_timeout_seconds()
+        client = redis.Redis.from_url(
+            _redis_url(),
+            decode_responses=True,
+            socket_connect_timeout=timeout,
+            socket_timeout=timeout,
+        )
         client.ping()
         redis_client = client
+        redis_state["backoff_seconds"] = 0.0
+        redis_state["retry_at"] = 0.0
     except Exception:
         redis_client = None
+        _redis_failed()
+
+
+def _redis_failed(exc: Exception | None = None) -> None:
+    metrics["redis_failures_total"] += 1
+    # Only an unreachable Redis is backed off; a command error (bad script,
+    # wrong type) says nothing about the next call. Without exc the connect failed.
+    if exc is not None and not isinstance(exc, (redis.ConnectionError, redis.TimeoutError)):
+        return
+    # Back off instead of paying a connect timeout on every request; L1 keeps serving.
+    backoff = min(max(redis_state["backoff_seconds"] * 2, 1.0), 30.0)
+    redis_state["backoff_seconds"] = backoff
+    redis_state["retry_at"] = time.monotonic() + backoff
+
+
+def _redis_ok() -> None:
+    # A command went through: the next failure starts the backoff over at 1s.
+    if redis_state["backoff_seconds"]:
+        redis_state["backoff_seconds"] = 0.0
+
+
+def _redis() -> redis.Redis | None:
+    if time.monotonic() < redis_state["retry_at"]:
+        return None
+    if redis_client is None:
+        with redis_state_lock:
+            if redis_client is None and time.monotonic() >= redis_state["retry_at"]:
+                _init_redis()
+    return redis_client
 
 
 def _close_redis() -> None:
@@ -163,71 +658,306 @@ def _close_redis() -> None:
     redis_client = None
 
 
+async def _async_redis() -> redis.asyncio.Redis | None:
+    global async_redis_client
+    # Shares the sync client's backoff: a Redis outage is skipped on both paths.
+    if time.monotonic() < redis_state["retry_at"]:
+        return None
+    if async_redis_client is None:
+        timeout = _redis_socket_timeout_seconds()
+        client = redis.asyncio.Redis.from_url(
+            _redis_url(),
+            decode_responses=True,
+            socket_connect_timeout=timeout,
+            socket_timeout=timeout,
+        )
+        try:
+            await client.ping()
+        except Exception:
+            await client.aclose()
+            _redis_failed()
+            return None
+        if async_redis_client is None:
+            async_redis_client = client
+        else:
+            await client.aclose()
+    return async_redis_client
+
+
+async def _close_async_redis() -> None:
+    global async_redis_client
+    if async_redis_client is not None:
+        try:
+            await async_redis_client.aclose()
+        except Exception:
+            pass
+    async_redis_client = None
+
+
 def _cache_get_json(key: str) -> Any | None:
-    if redis_client is None:
+    client = _redis()
+    if client is None:
+        return None
+    try:
+        raw = client.get(key)
+    except redis.RedisError as exc:
+        _redis_failed(exc)
+        return None
+    _redis_ok()
+    if not raw:
         return None
     try:
-        raw = redis_client.get(key)
-        if not raw:
-            return None
         return json.loads(raw)
-    except Exception:
+    except ValueError:
         return None
 
 
 def _cache_set_json(key: str, data: Any, ttl_seconds: int) -> None:
-    if redis_client is None:
+    client = _redis()
+    if client is None:
         return
     try:
-        redis_client.setex(key, ttl_seconds, json.dumps(data, default=str))
-    except Exception:
-        pass
+        client.setex(key, ttl_seconds, json.dumps(data, default=str))
+    except redis.RedisError as exc:
+        _redis_failed(exc)
+        return
+    _redis_ok()
 
 
 def _cache_get_text(key: str) -> str | None:
-    if redis_client is None:
+    client = _redis()
+    if client is None:
         return None
     try:
-        return redis_client.get(key)
-    except Exception:
+        value = client.get(key)
+    except redis.RedisError as exc:
+        _redis_failed(exc)
         return None
+    _redis_ok()
+    return value
 
 
 def _cache_set_text(key: str, value: str, ttl_seconds: int) -> None:
-    if redis_client is None:
+    client = _redis()
+    if client is None:
         return
     try:
-        redis_client.setex(key, ttl_seconds, value)
-    except Exception:
-        pass
+        client.setex(key, ttl_seconds, value)
+    except redis.RedisError as exc:
+        _redis_failed(exc)
+        return
+    _redis_ok()
+
+
+def _cache_mget_text(keys: list[str]) -> list[str | None]:
+    client = _redis()
+    if client is None or not keys:
+        return [None] * len(keys)
+    try:
+        values = list(client.mget(keys))
+    except redis.RedisError as exc:
+        _redis_failed(exc)
+        return [None] * len(keys)
+    _redis_ok()
+    return values
+
+
+def _cache_write_text_many(values: dict[str, str], deletes: list[str], ttl_seconds: int) -> None:
+    client = _redis()
+    if client is None or (not values and not deletes):
+        return
+    try:
+        pipe = client.pipeline(transaction=False)
+        for key, value in values.items():
+            pipe.setex(key, ttl_seconds, value)
+        if deletes:
+            pipe.delete(*deletes)
+        pipe.execute()
+    except redis.RedisError as exc:
+        _redis_failed(exc)
+        return
+    _redis_ok()
 
 
 def _cache_del_key(key: str) -> None:
-    if redis_client is None:
+    client = _redis()
+    if client is None:
         return
     try:
-        redis_client.delete(key)
-    except Exception:
-        pass
+        client.delete(key)
+    except redis.RedisError as exc:
+        _redis_failed(exc)
+        return
+    _redis_ok()
 
 
-def _cache_del_pattern(pattern: str) -> None:
-    if redis_client is None:
+async def _cache_get_text_async(key: str) -> str | None:
+    client = await _async_redis()
+    if client is None:
+        return None
+    try:
+        value = await client.get(key)
+    except redis.RedisError as exc:
+        _redis_failed(exc)
+        return None
+    _redis_ok()
+    return value
+
+
+async def _cache_mget_text_async(keys: list[str]) -> list[str | None]:
+    client = await _async_redis()
+    if client is None or not keys:
+        return [None] * len(keys)
+    try:
+        values = list(await client.mget(keys))
+    except redis.RedisError as exc:
+        _redis_failed(exc)
+        return [None] * len(keys)
+    _redis_ok()
+    return values
+
+
+async def _cache_write_text_many_async(values: dict[str, str], deletes: list[str], ttl_seconds: int) -> None:
+    client = await _async_redis()
+    if client is None or (not values and not deletes):
         return
     try:
-        keys = list(redis_client.scan_iter(match=pattern, count=100))
-        if keys:
-            redis_client.delete(*keys)
-    except Exception:
-        pass
+        pipe = client.pipeline(transaction=False)
+        for key, value in values.items():
+            pipe.setex(key, ttl_seconds, value)
+        if deletes:
+            pipe.delete(*deletes)
+        await pipe.execute()
+    except redis.RedisError as exc:
+        _redis_failed(exc)
+        return
+    _redis_ok()
+
+
+MENU_GENERATION_KEY = "menu:gen"
+
+
+def _menu_generation() -> int:
+    # Menu keys embed this counter, so invalidation is one INCR and old
+    # generations just age out on their TTL instead of being scanned for.
+    raw = _cache_get_text(MENU_GENERATION_KEY)
+    try:
+        return int(raw) if raw else 0
+    except ValueError:
+        return 0
+
+
+def _bump_menu_generation() -> None:
+    client = _redis()
+    if client is None:
+        return
+    try:
+        client.incr(MENU_GENERATION_KEY)
+    except redis.RedisError as exc:
+        _redis_failed(exc)
+        return
+    _redis_ok()
+
+
+MenuL1Key = tuple[str, str, str | None, bool]
+
+
+def _menu_l1_get(key: MenuL1Key) -> tuple[bytes, str, bool] | None:
+    """Return (body, etag, refresh_due) for a live entry."""
+    with menu_l1_lock:
+        entry = menu_l1_cache.get(key)
+        now = time.monotonic()
+        if entry is None or entry["version"] != menu_cache_state["version"] or entry["expires_at"] <= now:
+            metrics["menu_l1_misses_total"] += 1
+            return None
+        metrics["menu_l1_hits_total"] += 1
+        return entry["body"], entry["etag"], entry["refresh_at"] <= now
+
+
+def _menu_l1_put(key: MenuL1Key, body: bytes, etag: str, version: int, ttl_seconds: float) -> None:
+    with menu_l1_lock:
+        # A version bump while the payload was being built makes it stale already.
+        if version != menu_cache_state["version"]:
+            return
+        now = time.monotonic()
+        if len(menu_l1_cache) >= 64:
+            for stale_key in [k for k, v in menu_l1_cache.items() if v["expires_at"] <= now]:
+                del menu_l1_cache[stale_key]
+        menu_l1_cache[key] = {
+            "version": version,
+            "expires_at": now + ttl_seconds,
+            "refresh_at": now + ttl_seconds * _menu_refresh_ahead_fraction(),
+            "body": body,
+            "etag": etag,
+        }
+
+
+def _encode_menu_payload(payload: dict[str, Any]) -> tuple[bytes, str]:
+    # Same encoding JSONResponse uses; encoded once per cached payload.
+    body = json.dumps(payload, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+    return body, f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def _bump_menu_cache_version() -> None:
+    with menu_l1_lock:
+        menu_cache_state["version"] += 1
+        menu_l1_cache.clear()
+
+
+async def _price_catalog_items() -> dict[str, dict[str, Any]]:
+    version = menu_cache_state["version"]
+    if price_catalog["version"] == version and time.monotonic() - price_catalog["loaded_at"] < _price_catalog_ttl_seconds():
+        return price_catalog["items"]
+    async with price_catalog_lock:
+        if price_catalog["version"] == version and time.monotonic() - price_catalog["loaded_at"] < _price_catalog_ttl_seconds():
+            return price_catalog["items"]
+        loaded_at = time.monotonic()
+        async with _async_db_conn() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute("SELECT id, name, price, available FROM menu_items")
+                rows = await cur.fetchall()
+        items = {row[0]: {"id": row[0], "name": row[1], "price": row[2], "available": row[3]} for row in rows}
+        # Stamped with the version read before the load: a bump mid-load forces another reload.
+        price_catalog.update(version=version, loaded_at=loaded_at, items=items)
+        metrics["price_catalog_loads_total"] += 1
+        return items
+
+
+async def _menu_price_map(item_ids: list[str]) -> dict[str, dict[str, Any]]:
+    """Price order lines from the in-process catalog, falling back to Postgres for ids it lacks."""
+    catalog = await _price_catalog_items()
+    menu_map = {item_id: catalog[item_id] for item_id in item_ids if item_id in catalog}
+    missing = [item_id for item_id in item_ids if item_id not in menu_map]
+    if missing:
+        # Items added since the last load; unknown ids stay a cheap keyed lookup.
+        metrics["price_catalog_fallback_lookups_total"] += 1
+        async with _async_db_conn() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(
+                    "SELECT id, name, price, available FROM menu_items WHERE id = ANY(%s)",
+                    (missing,),
+                )
+                for row in await cur.fetchall():
+                    menu_map[row[0]] = {"id": row[0], "name": row[1], "price": row[2], "available": row[3]}
+    return menu_map
 
 
 def _stock_zero_cache_key(item_id: str) -> str:
     return f"stock:zero:{item_id}:v1"
 
 
-def _menu_cache_key(context: str) -> str:
-    return f"menu:{context}:v1"
+def _menu_cache_key(context: str, generation: int) -> str:
+    return f"menu:{generation}:{context}:v1"
 
 
 MAIN_SLOT_MAP: dict[str, tuple[str, ...]] = {
@@ -244,8 +974,8 @@ def _is_valid_main_slot(main: str, slot: str) -> bool:
     return main in MAIN_SLOT_MAP and slot in MAIN_SLOT_MAP[main]
 
 
-def _menu_cache_key_for_slot(main: str, slot: str) -> str:
-    return f"menu:{main}:{slot}:v1"
+def _menu_cache_key_for_slot(main: str, slot: str, generation: int) -> str:
+    return f"menu:{generation}:{main}:{slot}:v2"
 
 
 def _qr_svg_data_url(content: str) -> str:
@@ -267,6 +997,14 @@ def _should_fail() -> None:
     raise HTTPException(status_code=503, detail="Service in chaos mode")
 
 
+async def _should_fail_async() -> None:
+    if not chaos_state["enabled"]:
+        return
+    if chaos_state["mode"] == "timeout":
+        await asyncio.sleep(2)
+    raise HTTPException(status_code=503, detail="Service in chaos mode")
+
+
 class LoginRequest(BaseModel):
     student_id: str
     password: str
@@ -383,18 +1121,95 @@ def _extract_token(authorization: str | None, cookie_token: str | None) -> str |
     return None
 
 
+def _auth_cache_max_entries() -> int:
+    return _env_int("AUTH_CACHE_MAX_ENTRIES", 10000, minimum=0)
+
+
+def _auth_cache_ttl_seconds() -> float:
+    return _env_float("AUTH_CACHE_TTL_SECONDS", 30.0)
+
+
+def _claims_cache_key(token: str) -> str:
+    # Never keep raw bearer tokens in memory longer than the request needs them.
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def _claims_cache_get(token: str) -> dict | None:
+    key = _claims_cache_key(token)
+    now = time.time()
+    with claims_cache_lock:
+        entry = claims_cache.get(key)
+        if entry is not None and entry[0] <= now:
+            del claims_cache[key]
+            entry = None
+        if entry is not None:
+            claims_cache.move_to_end(key)
+    if entry is None:
+        metrics["auth_cache_misses_total"] += 1
+        return None
+    metrics["auth_cache_hits_total"] += 1
+    return dict(entry[1])
+
+
+def _claims_cache_put(token: str, claims: dict[str, Any]) -> None:
+    max_entries = _auth_cache_max_entries()
+    if max_entries == 0:
+        return
+    now = time.time()
+    expires_at = now + _auth_cache_ttl_seconds()
+    token_exp = claims.get("exp")
+    if isinstance(token_exp, (int, float)):
+        expires_at = min(expires_at, float(token_exp))
+    if expires_at <= now:
+        return
+    key = _claims_cache_key(token)
+    with claims_cache_lock:
+        claims_cache[key] = (expires_at, dict(claims))
+        claims_cache.move_to_end(key)
+        while len(claims_cache) > max_entries:
+            claims_cache.popitem(last=False)
+
+
 def _verify_token(token: str) -> dict | None:
     if not token:
         return None
 
+    cached = _claims_cache_get(token)
+    if cached is not None:
+        return cached
+
     try:
-        with httpx.Client(timeout=2.0) as client:
-            resp = client.get(f"{_identity_url()}/verify", headers={"Authorization": f"Bearer {token}"})
+        resp = _upstream_client("identity").get(
+            f"{_identity_url()}/verify", headers={"Authorization": f"Bearer {token}"}
+        )
     except Exception:
         raise HTTPException(status_code=503, detail="Identity service unavailable")
+    return _verified_claims(token, resp)
+
 
+async def _verify_token_async(token: str) -> dict | None:
+    if not token:
+        return None
+
+    cached = _claims_cache_get(token)
+    if cached is not None:
+        return cached
+
+    try:
+        resp = await _async_upstream_client("identity").get(
+            f"{_identity_url()}/verify", headers={"Authorization": f"Bearer {token}"}
+        )
+    except Exception:
+        raise HTTPException(status_code=503, detail="Identity service unavailable")
+    return _verified_claims(token, resp)
+
+
+def _verified_claims(token: str, resp: httpx.Response) -> dict | None:
     if resp.status_code == 200:
-        return resp.json()
+        claims = resp.json()
+        if isinstance(claims, dict):
+            _claims_cache_put(token, claims)
+        return claims
 
     if resp.status_code in {401, 403}:
         return None
@@ -402,11 +1217,7 @@ def _verify_token(token: str) -> dict | None:
     raise HTTPException(status_code=503, detail="Identity verification failed")
 
 
-def _extract_auth(authorization: str | None, cookie_token: str | None) -> dict | None:
-    token = _extract_token(authorization, cookie_token)
-    if not token:
-        return None
-    verified = _verify_token(token)
+def _auth_from_claims(token: str, verified: dict | None) -> dict | None:
     if not verified:
         return None
     student_id = verified.get("student_id")
@@ -415,6 +1226,20 @@ def _extract_auth(authorization: str | None, cookie_token: str | None) -> dict |
     return {"student_id": student_id, "role": verified.get("role", "student"), "token": token}
 
 
+def _extract_auth(authorization: str | None, cookie_token: str | None) -> dict | None:
+    token = _extract_token(authorization, cookie_token)
+    if not token:
+        return None
+    return _auth_from_claims(token, _verify_token(token))
+
+
+async def _extract_auth_async(authorization: str | None, cookie_token: str | None) -> dict | None:
+    token = _extract_token(authorization, cookie_token)
+    if not token:
+        return None
+    return _auth_from_claims(token, await _verify_token_async(token))
+
+
 def _require_admin(authorization: str | None, cookie_token: str | None) -> dict[str, Any]:
     auth = _extract_auth(authorization, cookie_token)
     if not auth:
@@ -680,7 +1505,7 @@ def _get_peak_mode() -> bool:
             return bool(row[0]) if row else False
 
 
-def _get_ramadan_visibility(now_local: datetime) -> dict[str, Any]:
+def _load_ramadan_visibility_settings() -> tuple[Any, ...] | None:
     with _db_conn() as conn:
         with conn.cursor() as cur:
             cur.execute(
@@ -690,13 +1515,20 @@ def _get_ramadan_visibility(now_local: datetime) -> dict[str, Any]:
                 WHERE id = 1
                 """
             )
-            row = cur.fetchone()
-            if not row:
-                return {"visible": True, "enabled": True, "start_at": None, "end_at": None, "timezone": "Asia/Dhaka"}
-            enabled = bool(row[0])
-            start_at = row[1]
-            end_at = row[2]
-            timezone = str(row[3] or "Asia/Dhaka")
+            return cur.fetchone()
+
+
+def _get_ramadan_visibility(now_local: datetime) -> dict[str, Any]:
+    return _ramadan_visibility_at(_load_ramadan_visibility_settings(), now_local)
+
+
+def _ramadan_visibility_at(row: tuple[Any, ...] | None, now_local: datetime) -> dict[str, Any]:
+    if not row:
+        return {"visible": True, "enabled": True, "start_at": None, "end_at": None, "timezone": "Asia/Dhaka"}
+    enabled = bool(row[0])
+    start_at = row[1]
+    end_at = row[2]
+    timezone = str(row[3] or "Asia/Dhaka")
 
     visible = enabled
     if visible and start_at is not None:
@@ -716,7 +1548,7 @@ def _get_ramadan_visibility(now_local: datetime) -> dict[str, Any]:
 def _resolve_main_slot_from_legacy_context(context: str, now_local: datetime) -> tuple[str, str]:
     ctx = (context or "").strip().lower()
     if ctx in {"", "auto"}:
-        active_context, _ = _resolve_auto_context(now_local)
+        active_context = _menu_schedule_active_context(now_local)
         if active_context == "regular":
             return "regular", "lunch"
         if active_context == "iftar":
@@ -757,6 +1589,206 @@ def _next_change_at_for_menu_slot(main: str, slot: str, now_local: datetime) ->
     return next_change.isoformat() if next_change else None
 
 
+# Menu schedule index: windows are expanded into per-day intervals and split into
+# elementary segments, so the active window and next change are a bisect away.
+MENU_SCHEDULE_MAX_DAYS_PER_WINDOW = 800
+MENU_SCHEDULE_RETRY_SECONDS = 5.0
+menu_schedule: dict[str, Any] = {"index": None, "built_at": 0.0, "attempted_at": float("-inf")}
+menu_schedule_lock = threading.Lock()
+
+
+def _menu_schedule_refresh_seconds() -> int:
+    return _env_int("MENU_SCHEDULE_REFRESH_SECONDS", 60)
+
+
+def _menu_prewarm_lead_seconds() -> float:
+    # Keep below MENU_L1_TTL_SECONDS so the warmed L1 entry outlives the boundary.
+    return _env_float("MENU_PREWARM_LEAD_SECONDS", 5.0)
+
+
+def _schedule_segments(
+    intervals: list[tuple[datetime, datetime, int, str]],
+) -> tuple[list[datetime], list[tuple[datetime, str] | None]]:
+    """Split overlapping [start, end) intervals into elementary segments.
+
+    Each segment keeps the earliest end among the windows covering it and the
+    name of the highest-id covering window, matching _resolve_auto_context.
+    """
+    boundaries = sorted({point for start, end, _, _ in intervals for point in (start, end)})
+    ordered = sorted(intervals)
+    by_end: list[tuple[datetime, int, str]] = []
+    by_id: list[tuple[int, datetime, str]] = []
+    values: list[tuple[datetime, str] | None] = []
+    pos = 0
+    for point in boundaries:
+        while pos < len(ordered) and ordered[pos][0] <= point:
+            _, end, window_id, name = ordered[pos]
+            heapq.heappush(by_end, (end, window_id, name))
+            heapq.heappush(by_id, (-window_id, end, name))
+            pos += 1
+        while by_end and by_end[0][0] <= point:
+            heapq.heappop(by_end)
+        while by_id and by_id[0][1] <= point:
+            heapq.heappop(by_id)
+        values.append((by_end[0][0], by_id[0][2]) if by_end else None)
+    return boundaries, values
+
+
+def _segment_at(
+    segments: tuple[list[datetime], list[tuple[datetime, str] | None]], point: datetime
+) -> tuple[datetime, str] | None:
+    boundaries, values = segments
+    idx = bisect.bisect_right(boundaries, point) - 1
+    return values[idx] if idx >= 0 else None
+
+
+def _build_menu_schedule() -> dict[str, Any] | None:
+    with _db_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT id, name, start_date, end_date, start_time, end_time
+                FROM menu_windows
+                WHERE is_active = TRUE
+                ORDER BY id ASC
+                """
+            )
+            rows = cur.fetchall()
+    visibility = _load_ramadan_visibility_settings()
+
+    intervals: dict[str, list[tuple[datetime, datetime, int, str]]] = {"iftar": [], "saheri": []}
+    for window_id, name, start_d, end_d, start_t, end_t in rows:
+        days = (end_d - start_d).days + 1
+        if days > MENU_SCHEDULE_MAX_DAYS_PER_WINDOW:
+            # Not worth expanding; callers fall back to the per-request queries.
+            return None
+        for offset in range(days):
+            day = start_d + timedelta(days=offset)
+            start = datetime.combine(day, start_t)
+            end = datetime.combine(day + timedelta(days=1) if _is_cross_midnight(start_t, end_t) else day, end_t)
+            if end > start:
+                intervals.setdefault(str(name), []).append((start, end, int(window_id), str(name)))
+
+    all_intervals = [interval for group in intervals.values() for interval in group]
+    return {
+        "all": _schedule_segments(all_intervals),
+        "by_name": {name: _schedule_segments(group) for name, group in intervals.items()},
+        "visibility": visibility,
+    }
+
+
+def _refresh_menu_schedule() -> None:
+    try:
+        index = _build_menu_schedule()
+    except Exception:
+        return
+    with menu_schedule_lock:
+        menu_schedule["index"] = index
+        menu_schedule["built_at"] = time.monotonic()
+    metrics["menu_schedule_builds_total"] += 1
+
+
+def _menu_schedule_index() -> dict[str, Any] | None:
+    if menu_schedule["index"] is None:
+        # Never built (Postgres down at startup): retry on a request at most
+        # every few seconds instead of on each one; callers fall back meanwhile.
+        now = time.monotonic()
+        with menu_schedule_lock:
+            due = now - menu_schedule["attempted_at"] >= MENU_SCHEDULE_RETRY_SECONDS
+            if due:
+                menu_schedule["attempted_at"] = now
+        if due:
+            _refresh_menu_schedule()
+    return menu_schedule["index"]
+
+
+def _menu_schedule_loop() -> None:
+    interval = _menu_schedule_refresh_seconds()
+    while cache_worker_state["running"]:
+        time.sleep(interval)
+        _refresh_menu_schedule()
+
+
+def _next_menu_boundary(now_local: datetime) -> datetime | None:
+    index = _menu_schedule_index()
+    if index is None:
+        return None
+    point = now_local.replace(tzinfo=None)
+    upcoming = []
+    for boundaries, _ in index["by_name"].values():
+        pos = bisect.bisect_right(boundaries, point)
+        if pos < len(boundaries):
+            upcoming.append(boundaries[pos])
+    return min(upcoming).replace(tzinfo=now_local.tzinfo) if upcoming else None
+
+
+def _prewarm_menu_at(boundary: datetime, now_local: datetime) -> int:
+    """Build every menu key that first becomes current at boundary."""
+    before = _menu_schedule_visibility(now_local)
+    after = _menu_schedule_visibility(boundary)
+    warmed = 0
+    for main, slots in MAIN_SLOT_MAP.items():
+        if main == "ramadan" and not after["visible"]:
+            continue
+        for slot in slots:
+            key = (main, slot, _menu_schedule_next_change(main, slot, boundary), bool(after["visible"]))
+            if key == (main, slot, _menu_schedule_next_change(main, slot, now_local), bool(before["visible"])):
+                continue
+            # Rebuild from Postgres: the Redis entry's TTL was capped at this boundary too.
+            _build_menu_body(key, boundary, rebuild=True)
+            warmed += 1
+    return warmed
+
+
+def _menu_prewarm_loop() -> None:
+    while cache_worker_state["running"]:
+        now_local = datetime.now(ZoneInfo(_menu_timezone()))
+        boundary = _next_menu_boundary(now_local)
+        if boundary is None:
+            time.sleep(_menu_schedule_refresh_seconds())
+            continue
+        wait_seconds = (boundary - now_local).total_seconds() - _menu_prewarm_lead_seconds()
+        if wait_seconds > 0:
+            # Wake up at least once per schedule refresh in case the windows changed.
+            time.sleep(min(wait_seconds, _menu_schedule_refresh_seconds()))
+            continue
+        try:
+            metrics["menu_prewarms_total"] += _prewarm_menu_at(boundary, now_local)
+        except Exception:
+            # Best effort; the first request after the boundary builds it instead.
+            pass
+        time.sleep(max((boundary - datetime.now(ZoneInfo(_menu_timezone()))).total_seconds(), 0.0) + 0.01)
+
+
+def _menu_schedule_active_context(now_local: datetime) -> str:
+    index = _menu_schedule_index()
+    if index is None:
+        active_context, _ = _resolve_auto_context(now_local)
+        return active_context
+    segment = _segment_at(index["all"], now_local.replace(tzinfo=None))
+    if segment and segment[1] in {"iftar", "saheri"}:
+        return segment[1]
+    return "regular"
+
+
+def _menu_schedule_visibility(now_local: datetime) -> dict[str, Any]:
+    index = _menu_schedule_index()
+    if index is None:
+        return _get_ramadan_visibility(now_local)
+    return _ramadan_visibility_at(index["visibility"], now_local)
+
+
+def _menu_schedule_next_change(main: str, slot: str, now_local: datetime) -> str | None:
+    if main != "ramadan":
+        return None
+    index = _menu_schedule_index()
+    if index is None:
+        return _next_change_at_for_menu_slot(main, slot, now_local)
+    segments = index["by_name"].get("iftar" if slot == "iftar" else "saheri")
+    segment = _segment_at(segments, now_local.replace(tzinfo=None)) if segments else None
+    return segment[0].replace(tzinfo=now_local.tzinfo).isoformat() if segment else None
+
+
 def _get_slot_items(main: str, slot: str) -> list[dict[str, Any]]:
     with _db_conn() as conn:
         with conn.cursor() as cur:
@@ -806,32 +1838,53 @@ def _fetch_user(student_id: str) -> dict | None:
             }
 
 
-def _reserve_item(order_id: str, item_id: str, qty: int) -> None:
-    payload = {"order_id": order_id, "item_id": item_id, "qty": qty}
+async def _reserve_items(order_id: str, lines: list[OrderLine]) -> None:
+    payload = {"order_id": order_id, "items": [{"item_id": line.id, "qty": line.qty} for line in lines]}
     try:
-        with httpx.Client(timeout=1.5) as client:
-            resp = client.post(f"{_stock_url()}/stock/reserve", json=payload)
+        resp = await _async_upstream_client("stock").post(f"{_stock_url()}/stock/reserve-batch", json=payload)
     except Exception as exc:
+        # The batch may have committed before the connection dropped; release is idempotent.
+        await _release_order_reservations_async(order_id)
         raise HTTPException(status_code=503, detail=f"Stock service unavailable: {exc}") from exc
 
     if resp.status_code == 409:
-        detail = resp.json().get("detail", f"Item {item_id} unavailable")
+        detail = resp.json().get("detail", "Item unavailable")
         raise HTTPException(status_code=409, detail=detail)
     if resp.status_code == 404:
-        raise HTTPException(status_code=400, detail=f"Item {item_id} not found")
+        detail = resp.json().get("detail", "Item not found")
+        raise HTTPException(status_code=400, detail=detail)
     if resp.status_code >= 500:
         raise HTTPException(status_code=503, detail="Stock service failure")
-    _invalidate_stock_cache(item_id)
+    if resp.status_code >= 400:
+        raise HTTPException(status_code=400, detail="Invalid stock reservation request")
+    await _cache_write_text_many_async(
+        {}, [_stock_zero_cache_key(item_id) for item_id in {line.id for line in lines}], _stock_cache_ttl_seconds()
+    )
 
 
 def _confirm_order_reservations(order_id: str) -> None:
     payload = {"order_id": order_id}
     try:
-        with httpx.Client(timeout=2.0) as client:
-            resp = client.post(f"{_stock_url()}/stock/confirm", json=payload)
+        resp = _upstream_client("stock").post(
+            f"{_stock_url()}/stock/confirm", json=payload, timeout=STOCK_CALL_TIMEOUTS["confirm"]
+        )
     except Exception as exc:
         raise HTTPException(status_code=503, detail=f"Stock service unavailable: {exc}") from exc
+    _check_confirmation(resp)
 
+
+async def _confirm_order_reservations_async(order_id: str) -> None:
+    payload = {"order_id": order_id}
+    try:
+        resp = await _async_upstream_client("stock").post(
+            f"{_stock_url()}/stock/confirm", json=payload, timeout=STOCK_CALL_TIMEOUTS["confirm"]
+        )
+    except Exception as exc:
+        raise HTTPException(status_code=503, detail=f"Stock service unavailable: {exc}") from exc
+    _check_confirmation(resp)
+
+
+def _check_confirmation(resp: httpx.Response) -> None:
     if resp.status_code == 200:
         return
     if resp.status_code == 409:
@@ -848,68 +1901,72 @@ def _invalidate_stock_cache(item_id: str) -> None:
     _cache_del_key(_stock_zero_cache_key(item_id))
 
 
-def _is_stock_available_cached(item_id: str) -> bool:
-    # Fast reject using short-lived negative cache.
-    if _cache_get_text(_stock_zero_cache_key(item_id)) == "1":
-        return False
+async def _unavailable_items_cached(item_ids: list[str]) -> list[str]:
+    """Return the ids (in request order) that are out of stock.
 
-    try:
-        with httpx.Client(timeout=1.0) as client:
-            resp = client.get(f"{_stock_url()}/stock/{item_id}")
-    except Exception as exc:
-        raise HTTPException(status_code=503, detail=f"Stock service unavailable: {exc}") from exc
-
-    if resp.status_code == 404:
-        raise HTTPException(status_code=400, detail=f"Item {item_id} not found")
-    if resp.status_code >= 500:
-        raise HTTPException(status_code=503, detail="Stock service failure")
-
-    body = resp.json()
-    is_available = bool(body.get("available", False))
-    stock_quantity = int(body.get("stock_quantity", 0))
-    if not is_available or stock_quantity <= 0:
-        _cache_set_text(_stock_zero_cache_key(item_id), "1", _stock_cache_ttl_seconds())
-        return False
+    One MGET over the negative cache, then one bulk stock-service call for the rest.
+    """
+    unique_ids = list(dict.fromkeys(item_ids))
+    zero_flags = await _cache_mget_text_async([_stock_zero_cache_key(item_id) for item_id in unique_ids])
+    unavailable = {item_id for item_id, flag in zip(unique_ids, zero_flags) if flag == "1"}
+    misses = [item_id for item_id in unique_ids if item_id not in unavailable]
+    if misses:
+        try:
+            resp = await _async_upstream_client("stock").get(
+                f"{_stock_url()}/stock",
+                params={"ids": ",".join(misses)},
+                timeout=STOCK_CALL_TIMEOUTS["availability"],
+            )
+        except Exception as exc:
+            raise HTTPException(status_code=503, detail=f"Stock service unavailable: {exc}") from exc
+
+        if resp.status_code >= 500:
+            raise HTTPException(status_code=503, detail="Stock service failure")
+        if resp.status_code >= 400:
+            raise HTTPException(status_code=400, detail="Stock lookup rejected")
+
+        body = resp.json()
+        missing = body.get("missing") or []
+        if missing:
+            raise HTTPException(status_code=400, detail=f"Item {missing[0]} not found")
+
+        zero_keys: dict[str, str] = {}
+        available_keys: list[str] = []
+        for item in body.get("items", []):
+            item_id = str(item.get("id"))
+            if not bool(item.get("available", False)) or int(item.get("stock_quantity", 0)) <= 0:
+                unavailable.add(item_id)
+                zero_keys[_stock_zero_cache_key(item_id)] = "1"
+            else:
+                available_keys.append(_stock_zero_cache_key(item_id))
+        await _cache_write_text_many_async(zero_keys, available_keys, _stock_cache_ttl_seconds())
 
-    _cache_del_key(_stock_zero_cache_key(item_id))
-    return is_available
+    return [item_id for item_id in unique_ids if item_id in unavailable]
 
 
 def _publish_kitchen_job(order: dict[str, Any]) -> None:
     try:
-        connection = pika.BlockingConnection(_rabbit_params())
-        channel = connection.channel()
-        channel.queue_declare(queue="kitchen.jobs", durable=True)
-        channel.basic_publish(
-            exchange="",
-            routing_key="kitchen.jobs",
-            body=json.dumps(order),
-            properties=pika.BasicProperties(delivery_mode=2),
-        )
-        connection.close()
+        rabbit_publisher.publish_queue("kitchen.jobs", order)
     except Exception as exc:
         raise HTTPException(status_code=503, detail=f"Queue unavailable: {exc}") from exc
 
 
-def _publish_queue(queue_name: str, payload: dict[str, Any]) -> None:
-    connection = pika.BlockingConnection(_rabbit_params())
-    channel = connection.channel()
-    channel.queue_declare(queue=queue_name, durable=True)
-    channel.basic_publish(
-        exchange="",
-        routing_key=queue_name,
-        body=json.dumps(payload),
-        properties=pika.BasicProperties(delivery_mode=2),
-    )
-    connection.close()
-
-
 def _publish_cache_invalidation(event: str, item_id: str | None = None) -> None:
-    payload: dict[str, Any] = {"event": event, "ts": int(time.time())}
+    payload: dict[str, Any] = {
+        "event": event,
+        "ts": int(time.time()),
+        "published_at": time.time(),
+        "origin": REPLICA_ID,
+    }
     if item_id:
         payload["item_id"] = item_id
+    if event == "menu.updated":
+        # Once per change, not once per consuming replica.
+        _bump_menu_generation()
+    # Apply locally first so this replica never serves its own stale menu.
+    _process_cache_event(payload)
     try:
-        _publish_queue("cache.invalidate", payload)
+        rabbit_publisher.publish_fanout(CACHE_EVENTS_EXCHANGE, payload)
     except Exception:
         # Best effort: cache is an optimization, not correctness source.
         pass
@@ -918,7 +1975,8 @@ def _publish_cache_invalidation(event: str, item_id: str | None = None) -> None:
 def _process_cache_event(event: dict[str, Any]) -> None:
     event_name = str(event.get("event", "")).strip().lower()
     if event_name == "menu.updated":
-        _cache_del_pattern("menu:*")
+        _bump_menu_cache_version()
+        _refresh_menu_schedule()
         return
     if event_name == "stock.changed":
         item_id = str(event.get("item_id", "")).strip()
@@ -926,20 +1984,42 @@ def _process_cache_event(event: dict[str, Any]) -> None:
             _cache_del_key(_stock_zero_cache_key(item_id))
 
 
+def _record_cache_event(event: dict[str, Any]) -> bool:
+    """Track delivery lag; returns False for this replica's own (already applied) events."""
+    metrics["cache_events_received_total"] += 1
+    cache_bus_state["last_event_at"] = time.time()
+    published_at = event.get("published_at")
+    if isinstance(published_at, (int, float)):
+        cache_event_lag_samples_ms.append(max(time.time() - float(published_at), 0.0) * 1000)
+        if len(cache_event_lag_samples_ms) > 500:
+            del cache_event_lag_samples_ms[0]
+    return event.get("origin") != REPLICA_ID
+
+
 def _cache_invalidator_loop() -> None:
+    # Each replica binds its own exclusive, auto-delete queue to the fanout
+    # exchange, so every replica sees every event rather than one of them.
     while cache_worker_state["running"]:
         try:
-            connection = pika.BlockingConnection(_rabbit_params())
+            connection = pika.BlockingConnection(rabbit_publisher.connection_params())
             channel = connection.channel()
-            channel.queue_declare(queue="cache.invalidate", durable=True)
-            for method, _, body in channel.consume("cache.invalidate", inactivity_timeout=1.0):
+            channel.exchange_declare(exchange=CACHE_EVENTS_EXCHANGE, exchange_type="fanout", durable=True)
+            queue_name = channel.queue_declare(queue="", exclusive=True, auto_delete=True).method.queue
+            channel.queue_bind(queue=queue_name, exchange=CACHE_EVENTS_EXCHANGE)
+            if cache_bus_state["queue"] is not None:
+                # Events published while we were unbound are gone; drop local state instead.
+                metrics["cache_bus_reconnects_total"] += 1
+                _process_cache_event({"event": "menu.updated"})
+            cache_bus_state["queue"] = queue_name
+            cache_bus_state["connected"] = True
+            for method, _, body in channel.consume(queue_name, inactivity_timeout=1.0):
                 if not cache_worker_state["running"]:
                     break
                 if method is None:
                     continue
                 try:
                     payload = json.loads(body.decode("utf-8")) if isinstance(body, (bytes, bytearray)) else {}
-                    if isinstance(payload, dict):
+                    if isinstance(payload, dict) and _record_cache_event(payload):
                         _process_cache_event(payload)
                 finally:
                     channel.basic_ack(method.delivery_tag)
@@ -947,6 +2027,8 @@ def _cache_invalidator_loop() -> None:
             connection.close()
         except Exception:
             time.sleep(1.0)
+        finally:
+            cache_bus_state["connected"] = False
 
 
 def _ensure_outbox_schema() -> None:
@@ -962,10 +2044,13 @@ def _ensure_outbox_schema() -> None:
                     published_at TIMESTAMPTZ,
                     attempts INTEGER NOT NULL DEFAULT 0,
                     last_error TEXT,
+                    locked_until TIMESTAMPTZ,
                     created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
                 )
                 """
             )
+            # Same column as database/migrations/019_outbox_job_lease.sql.
+            cur.execute("ALTER TABLE event_outbox ADD COLUMN IF NOT EXISTS locked_until TIMESTAMPTZ")
             cur.execute(
                 """
                 CREATE INDEX IF NOT EXISTS idx_event_outbox_unpublished_created
@@ -1028,6 +2113,32 @@ def _ensure_wallet_schema() -> None:
             conn.commit()
 
 
+def _ensure_order_pipeline_schema() -> None:
+    # Same change as database/migrations/017_order_pending_payment.sql.
+    with _db_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                DO $$
+                BEGIN
+                    IF NOT EXISTS (
+                        SELECT 1
+                        FROM pg_constraint
+                        WHERE conname = 'chk_orders_status_valid'
+                          AND pg_get_constraintdef(oid) LIKE '%PENDING_PAYMENT%'
+                    ) THEN
+                        ALTER TABLE orders DROP CONSTRAINT IF EXISTS chk_orders_status_valid;
+                        ALTER TABLE orders
+                            ADD CONSTRAINT chk_orders_status_valid
+                            CHECK (status IN ('PENDING_PAYMENT', 'QUEUED', 'IN_PROGRESS', 'READY', 'COMPLETED', 'CANCELLED'));
+                    END IF;
+                END
+                $$;
+                """
+            )
+            conn.commit()
+
+
 def _ensure_order_slip_schema() -> None:
     with _db_conn() as conn:
         with conn.cursor() as cur:
@@ -1047,14 +2158,18 @@ def _ensure_order_slip_schema() -> None:
             conn.commit()
 
 
+OUTBOX_INSERT_SQL = """
+INSERT INTO event_outbox(event_type, queue_name, payload)
+VALUES (%s, %s, %s::jsonb)
+"""
+
+
 def _enqueue_outbox_event(cur: Any, event_type: str, queue_name: str, payload: dict[str, Any]) -> None:
-    cur.execute(
-        """
-        INSERT INTO event_outbox(event_type, queue_name, payload)
-        VALUES (%s, %s, %s::jsonb)
-        """,
-        (event_type, queue_name, json.dumps(payload)),
-    )
+    cur.execute(OUTBOX_INSERT_SQL, (event_type, queue_name, json.dumps(payload)))
+
+
+async def _enqueue_outbox_event_async(cur: Any, event_type: str, queue_name: str, payload: dict[str, Any]) -> None:
+    await cur.execute(OUTBOX_INSERT_SQL, (event_type, queue_name, json.dumps(payload)))
 
 
 def _complete_topup(cur: Any, topup_id: str, provider_ref: str | None = None) -> tuple[bool, dict[str, Any]]:
@@ -1159,49 +2274,65 @@ def _process_outbox_once(batch_size: int = 25) -> int:
                 """
                 SELECT id, queue_name, payload::text
                 FROM event_outbox
-                WHERE published_at IS NULL
+                WHERE published_at IS NULL AND queue_name <> %s
                 ORDER BY created_at ASC
                 LIMIT %s
                 FOR UPDATE SKIP LOCKED
                 """,
-                (batch_size,),
+                (ORDER_PAYMENT_STAGE, batch_size),
             )
             rows = cur.fetchall()
             if not rows:
                 conn.commit()
                 return 0
 
+            batch: list[tuple[str, dict[str, Any]]] = []
+            batch_ids: list[int] = []
             for row in rows:
                 outbox_id = int(row[0])
-                queue_name = str(row[1])
                 payload_raw = row[2]
                 try:
                     payload = json.loads(payload_raw) if isinstance(payload_raw, str) else payload_raw
-                    _publish_queue(queue_name, payload)
-                    cur.execute(
-                        """
-                        UPDATE event_outbox
-                        SET published_at = NOW(), attempts = attempts + 1, last_error = NULL
-                        WHERE id = %s
-                        """,
-                        (outbox_id,),
-                    )
-                    metrics["outbox_published_total"] += 1
-                    processed += 1
                 except Exception as exc:
-                    cur.execute(
-                        """
-                        UPDATE event_outbox
-                        SET attempts = attempts + 1, last_error = %s
-                        WHERE id = %s
-                        """,
-                        (str(exc)[:400], outbox_id),
-                    )
-                    metrics["outbox_publish_failed_total"] += 1
+                    _record_outbox_failure(cur, [outbox_id], exc)
+                    continue
+                batch.append((str(row[1]), payload))
+                batch_ids.append(outbox_id)
+            # One broker round trip for the drained rows instead of a confirm per event.
+            try:
+                rabbit_publisher.publish_queue_batch(batch)
+            except Exception as exc:
+                _record_outbox_failure(cur, batch_ids, exc)
+                batch_ids = []
+            if batch_ids:
+                cur.execute(
+                    """
+                    UPDATE event_outbox
+                    SET published_at = NOW(), attempts = attempts + 1, last_error = NULL
+                    WHERE id = ANY(%s)
+                    """,
+                    (batch_ids,),
+                )
+                metrics["outbox_published_total"] += len(batch_ids)
+                processed = len(batch_ids)
             conn.commit()
     return processed
 
 
+def _record_outbox_failure(cur: Any, outbox_ids: list[int], exc: Exception) -> None:
+    if not outbox_ids:
+        return
+    cur.execute(
+        """
+        UPDATE event_outbox
+        SET attempts = attempts + 1, last_error = %s
+        WHERE id = ANY(%s)
+        """,
+        (str(exc)[:400], outbox_ids),
+    )
+    metrics["outbox_publish_failed_total"] += len(outbox_ids)
+
+
 def _outbox_worker_loop() -> None:
     while outbox_worker_state["running"]:
         try:
@@ -1213,39 +2344,239 @@ def _outbox_worker_loop() -> None:
             time.sleep(1.0)
 
 
+ORDER_PAYMENT_STAGE = "order.payment"
+
+
+def _lease_payment_job() -> tuple[int, dict[str, Any], int] | None:
+    """Claim the oldest due payment job for one lease; the attempt counts as soon as it is claimed."""
+    with _db_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                UPDATE event_outbox
+                SET attempts = attempts + 1,
+                    locked_until = NOW() + make_interval(secs => %s)
+                WHERE id = (
+                    SELECT id
+                    FROM event_outbox
+                    WHERE published_at IS NULL
+                      AND queue_name = %s
+                      AND (locked_until IS NULL OR locked_until <= NOW())
+                    ORDER BY created_at ASC
+                    LIMIT 1
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING id, payload::text, attempts
+                """,
+                (_order_payment_lease_seconds(), ORDER_PAYMENT_STAGE),
+            )
+            row = cur.fetchone()
+            conn.commit()
+    if not row:
+        return None
+    payload_raw = row[1]
+    job = json.loads(payload_raw) if isinstance(payload_raw, str) else payload_raw
+    return int(row[0]), job, int(row[2])
+
+
+def _process_payment_stage_once() -> int:
+    """Run one pending payment job from the outbox; returns how many were handled."""
+    leased = _lease_payment_job()
+    if leased is None:
+        return 0
+    outbox_id, job, attempts = leased
+    order_id = job["order_id"]
+    # No connection or row lock is held while payment and stock are called;
+    # the lease keeps other workers off the job until it expires.
+    error = None
+    retryable = False
+    try:
+        _run_payment_stage(job)
+    except HTTPException as exc:
+        error = str(exc.detail)
+        retryable = exc.status_code == 503
+    except Exception as exc:
+        error = str(exc) or exc.__class__.__name__
+        retryable = True
+
+    retry = error is not None and retryable and attempts < _order_payment_max_attempts()
+    if error is not None and not retry:
+        # This or an earlier attempt may have charged the student before stock
+        # was refused (confirm 409), so refund before cancelling. If the refund
+        # fails the job and order are kept and retried; a rerun finds the
+        # payment already processed and lands here again.
+        try:
+            _refund_order_payment(order_id)
+        except HTTPException as exc:
+            metrics["payment_stage_refund_failed_total"] += 1
+            logger.warning("payment stage: refund for order %s failed: %s", order_id, exc.detail)
+            error = f"Refund failed: {exc.detail}"
+            retry = True
+
+    cancelled = False
+    with _db_conn() as conn:
+        with conn.cursor() as cur:
+            if error is None:
+                _queue_paid_order(cur, job)
+                metrics["payment_stage_completed_total"] += 1
+            elif retry:
+                # Payment and confirm are idempotent per order; back off 2s per
+                # attempt from this one so a down upstream is not hammered.
+                cur.execute(
+                    """
+                    UPDATE event_outbox
+                    SET last_error = %s, locked_until = NOW() + make_interval(secs => %s)
+                    WHERE id = %s
+                    """,
+                    (error[:400], attempts * 2, outbox_id),
+                )
+                conn.commit()
+                metrics["payment_stage_retries_total"] += 1
+                return 1
+            else:
+                cur.execute(
+                    "UPDATE orders SET status = 'CANCELLED', eta_minutes = 0 WHERE id = %s AND status = 'PENDING_PAYMENT'",
+                    (order_id,),
+                )
+                cancelled = True
+            cur.execute(
+                """
+                UPDATE event_outbox
+                SET published_at = NOW(), locked_until = NULL, last_error = %s
+                WHERE id = %s
+                """,
+                (error[:400] if error else None, outbox_id),
+            )
+            conn.commit()
+    if cancelled:
+        _release_order_reservations(order_id)
+        metrics["payment_stage_cancelled_total"] += 1
+    return 1
+
+
+def _run_payment_stage(job: dict[str, Any]) -> None:
+    _process_payment(
+        order_id=job["order_id"],
+        student_id=job["student_id"],
+        amount=int(job["amount"]),
+        method=job["method"],
+    )
+    _confirm_order_reservations(job["order_id"])
+
+
+def _queue_paid_order(cur: Any, job: dict[str, Any]) -> None:
+    order_id = job["order_id"]
+    cur.execute(
+        "UPDATE orders SET status = 'QUEUED' WHERE id = %s AND status = 'PENDING_PAYMENT'",
+        (order_id,),
+    )
+    if cur.rowcount:
+        _enqueue_outbox_event(
+            cur=cur,
+            event_type="order.created",
+            queue_name="kitchen.jobs",
+            payload={
+                "order_id": order_id,
+                "token_no": job["token_no"],
+                "pickup_counter": job["pickup_counter"],
+                "student_id": job["student_id"],
+                "status": "QUEUED",
+                "eta_minutes": job["eta_minutes"],
+            },
+        )
+
+
+def _payment_stage_worker_loop() -> None:
+    while outbox_worker_state["running"]:
+        try:
+            if _process_payment_stage_once() == 0:
+                time.sleep(0.5)
+        except Exception:
+            time.sleep(1.0)
+
+
 def _release_order_reservations(order_id: str) -> None:
     payload = {"order_id": order_id}
     try:
-        with httpx.Client(timeout=2.0) as client:
-            client.post(f"{_stock_url()}/stock/release", json=payload)
-    except Exception:
-        pass
+        resp = _upstream_client("stock").post(
+            f"{_stock_url()}/stock/release", json=payload, timeout=STOCK_CALL_TIMEOUTS["release"]
+        )
+        resp.raise_for_status()
+    except Exception as exc:
+        _release_failed(order_id, exc)
 
 
-def _mark_order_cancelled(order_id: str) -> None:
+async def _release_order_reservations_async(order_id: str) -> None:
+    payload = {"order_id": order_id}
     try:
-        with _db_conn() as conn:
-            with conn.cursor() as cur:
-                cur.execute("UPDATE orders SET status = 'CANCELLED', eta_minutes = 0 WHERE id = %s", (order_id,))
-                conn.commit()
+        resp = await _async_upstream_client("stock").post(
+            f"{_stock_url()}/stock/release", json=payload, timeout=STOCK_CALL_TIMEOUTS["release"]
+        )
+        resp.raise_for_status()
+    except Exception as exc:
+        _release_failed(order_id, exc)
+
+
+def _release_failed(order_id: str, exc: Exception) -> None:
+    # The order is still cancelled; its stock comes back when the stock
+    # service expires the reservation, so count it instead of failing.
+    metrics["stock_release_failed_total"] += 1
+    logger.warning("stock release for order %s failed: %s", order_id, exc)
+
+
+async def _mark_order_cancelled_async(order_id: str, free_idempotency_key: bool = False) -> None:
+    try:
+        async with _async_db_conn() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute("UPDATE orders SET status = 'CANCELLED', eta_minutes = 0 WHERE id = %s", (order_id,))
+                if free_idempotency_key:
+                    # The client never got this order, so a retry with its key may place a new one.
+                    await cur.execute("DELETE FROM order_idempotency WHERE order_id = %s", (order_id,))
+                await conn.commit()
     except Exception:
         pass
 
 
-def _process_payment(order_id: str, student_id: str, amount: int, method: str) -> dict[str, Any]:
-    payload = {
+def _payment_request(order_id: str, student_id: str, amount: int, method: str) -> dict[str, Any]:
+    return {
         "order_id": order_id,
         "student_id": student_id,
         "amount": amount,
         "currency": "BDT",
         "method": method,
     }
+
+
+def _process_payment(order_id: str, student_id: str, amount: int, method: str) -> dict[str, Any]:
+    payload = _payment_request(order_id, student_id, amount, method)
+    try:
+        resp = _upstream_client("payment").post(f"{_payment_url()}/payments/process", json=payload)
+    except Exception as exc:
+        raise HTTPException(status_code=503, detail=f"Payment service unavailable: {exc}") from exc
+    return _payment_result(resp)
+
+
+async def _process_payment_async(order_id: str, student_id: str, amount: int, method: str) -> dict[str, Any]:
+    payload = _payment_request(order_id, student_id, amount, method)
     try:
-        with httpx.Client(timeout=4.0) as client:
-            resp = client.post(f"{_payment_url()}/payments/process", json=payload)
+        resp = await _async_upstream_client("payment").post(f"{_payment_url()}/payments/process", json=payload)
     except Exception as exc:
         raise HTTPException(status_code=503, detail=f"Payment service unavailable: {exc}") from exc
+    return _payment_result(resp)
+
+
+def _refund_order_payment(order_id: str) -> None:
+    """Refund an order's payment; an order that was never charged has nothing to refund."""
+    try:
+        resp = _upstream_client("payment").post(f"{_payment_url()}/payments/refund", json={"order_id": order_id})
+    except Exception as exc:
+        raise HTTPException(status_code=503, detail=f"Payment service unavailable: {exc}") from exc
+    if resp.status_code in {200, 404}:
+        return
+    raise HTTPException(status_code=503, detail="Payment refund failed")
 
+
+def _payment_result(resp: httpx.Response) -> dict[str, Any]:
     if resp.status_code == 200:
         return resp.json()
     if resp.status_code in {404, 409, 422}:
@@ -1265,58 +2596,102 @@ def _percentile(values: list[float], pct: float) -> float:
     return sorted_values[idx]
 
 
-def _queue_depth(queue_name: str = "kitchen.jobs") -> int:
-    try:
-        connection = pika.BlockingConnection(_rabbit_params())
-        channel = connection.channel()
-        result = channel.queue_declare(queue=queue_name, durable=True, passive=True)
-        connection.close()
-        return int(result.method.message_count)
-    except Exception:
-        return -1
+def _close_queue_depth_channel() -> None:
+    connection = queue_depth_state["connection"]
+    queue_depth_state["connection"] = None
+    queue_depth_state["channel"] = None
+    if connection is not None:
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+
+def _queue_depth(queue_name: str = "kitchen.jobs") -> int:
+    # pika channels are not thread-safe; probes from the admission loop and
+    # /metrics share one channel under the lock.
+    with queue_depth_lock:
+        for _ in range(2):
+            channel = queue_depth_state["channel"]
+            reused = channel is not None and channel.is_open
+            try:
+                if not reused:
+                    _close_queue_depth_channel()
+                    connection = pika.BlockingConnection(rabbit_publisher.connection_params())
+                    queue_depth_state["connection"] = connection
+                    queue_depth_state["channel"] = channel = connection.channel()
+                result = channel.queue_declare(queue=queue_name, durable=True, passive=True)
+                return int(result.method.message_count)
+            except Exception:
+                # A failed passive declare closes the channel; a broker restart
+                # leaves a stale one. Reconnect once, but only if it was reused.
+                _close_queue_depth_channel()
+                if not reused:
+                    break
+        return -1
+
+
+IDEMPOTENT_ORDER_COLUMNS = (
+    "o.id, o.token_no, o.pickup_counter, o.ready_at, o.ready_until, o.status, o.eta_minutes, o.total_amount, o.created_at"
+)
 
 
-def _find_idempotent_order(student_id: str, idempotency_key: str) -> dict[str, Any] | None:
-    with _db_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute(
-                """
-                SELECT o.id, o.token_no, o.pickup_counter, o.ready_at, o.ready_until, o.status, o.eta_minutes, o.total_amount, o.created_at
+def _idempotent_replay(row: Any) -> dict[str, Any]:
+    return {
+        "order_id": row[0],
+        "token_no": int(row[1]),
+        "pickup_counter": int(row[2]),
+        "ready_at": row[3].isoformat() if row[3] else None,
+        "ready_until": row[4].isoformat() if row[4] else None,
+        "status": row[5],
+        "eta_minutes": row[6],
+        "total_amount": row[7],
+        "created_at": row[8].isoformat() if row[8] else None,
+        "idempotent_replay": True,
+    }
+
+
+async def _find_idempotent_order(student_id: str, idempotency_key: str) -> dict[str, Any] | None:
+    async with _async_db_conn() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                f"""
+                SELECT {IDEMPOTENT_ORDER_COLUMNS}
                 FROM order_idempotency oi
                 JOIN orders o ON o.id = oi.order_id
                 WHERE oi.student_id = %s AND oi.idempotency_key = %s
                 """,
                 (student_id, idempotency_key),
             )
-            row = cur.fetchone()
-            if not row:
-                return None
-            return {
-                "order_id": row[0],
-                "token_no": int(row[1]),
-                "pickup_counter": int(row[2]),
-                "ready_at": row[3].isoformat() if row[3] else None,
-                "ready_until": row[4].isoformat() if row[4] else None,
-                "status": row[5],
-                "eta_minutes": row[6],
-                "total_amount": row[7],
-                "created_at": row[8].isoformat() if row[8] else None,
-                "idempotent_replay": True,
-            }
+            row = await cur.fetchone()
+    return _idempotent_replay(row) if row else None
 
 
-def _store_idempotency(student_id: str, idempotency_key: str, order_id: str) -> None:
-    with _db_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute(
-                """
-                INSERT INTO order_idempotency(student_id, idempotency_key, order_id)
-                VALUES (%s, %s, %s)
-                ON CONFLICT (student_id, idempotency_key) DO NOTHING
-                """,
-                (student_id, idempotency_key, order_id),
-            )
-            conn.commit()
+async def _idempotent_order_by_id(order_id: str) -> dict[str, Any] | None:
+    async with _async_db_conn() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(f"SELECT {IDEMPOTENT_ORDER_COLUMNS} FROM orders o WHERE o.id = %s", (order_id,))
+            row = await cur.fetchone()
+    return _idempotent_replay(row) if row else None
+
+
+IDEMPOTENCY_INSERT_SQL = """
+INSERT INTO order_idempotency(student_id, idempotency_key, order_id)
+VALUES (%s, %s, %s)
+ON CONFLICT (student_id, idempotency_key) DO NOTHING
+"""
+
+
+def _store_idempotency(cur: Any, student_id: str, idempotency_key: str, order_id: str) -> bool:
+    """False when another order already holds the key."""
+    cur.execute(IDEMPOTENCY_INSERT_SQL, (student_id, idempotency_key, order_id))
+    return cur.rowcount == 1
+
+
+async def _store_idempotency_async(cur: Any, student_id: str, idempotency_key: str, order_id: str) -> bool:
+    """False when another order already holds the key."""
+    await cur.execute(IDEMPOTENCY_INSERT_SQL, (student_id, idempotency_key, order_id))
+    return cur.rowcount == 1
 
 
 def _load_order_with_items(order_id: str) -> dict[str, Any] | None:
@@ -1372,6 +2747,88 @@ def _load_order_with_items(order_id: str) -> dict[str, Any] | None:
     }
 
 
+# Separate worker-thread pools per route group so a burst of admin or slip
+# traffic cannot take the threads that menu misses and student routes need.
+# Sync routes outside these groups keep anyio's default limiter.
+BULKHEAD_DEFAULTS: dict[str, tuple[int, int]] = {
+    # group: (threads, queued calls before rejecting)
+    # "orders" holds the student-facing sync routes: auth, wallet and order cancel.
+    "orders": (8, 16),
+    "menu": (8, 32),
+    "admin": (4, 8),
+    "slips": (4, 8),
+}
+bulkheads: dict[str, dict[str, Any]] = {
+    name: {"limiter": None, "rejected_total": 0, "wait_samples_ms": []} for name in BULKHEAD_DEFAULTS
+}
+
+
+def _bulkhead_threads(group: str) -> int:
+    return _env_int(f"BULKHEAD_{group.upper()}_THREADS", BULKHEAD_DEFAULTS[group][0])
+
+
+def _bulkhead_queue_size(group: str) -> int:
+    return _env_int(f"BULKHEAD_{group.upper()}_QUEUE_SIZE", BULKHEAD_DEFAULTS[group][1], minimum=0)
+
+
+def _bulkhead_limiter(group: str) -> anyio.CapacityLimiter:
+    state = bulkheads[group]
+    if state["limiter"] is None:
+        # Created on first use: anyio limiters need a running event loop.
+        state["limiter"] = anyio.CapacityLimiter(_bulkhead_threads(group))
+    return state["limiter"]
+
+
+async def _run_in_bulkhead(group: str, func: Any, *args: Any) -> Any:
+    state = bulkheads[group]
+    limiter = _bulkhead_limiter(group)
+    stats = limiter.statistics()
+    if stats.borrowed_tokens >= stats.total_tokens and stats.tasks_waiting >= _bulkhead_queue_size(group):
+        state["rejected_total"] += 1
+        raise HTTPException(status_code=503, detail="Server busy, please retry", headers={"Retry-After": "1"})
+    queued_at = time.perf_counter()
+
+    def run() -> Any:
+        samples = state["wait_samples_ms"]
+        samples.append((time.perf_counter() - queued_at) * 1000)
+        if len(samples) > 500:
+            del samples[0]
+        return func(*args)
+
+    return await anyio.to_thread.run_sync(run, limiter=limiter)
+
+
+def _bulkhead(group: str):
+    """Run a sync route in its group's pool instead of the shared threadpool."""
+
+    def decorate(func):
+        # wraps() keeps the signature FastAPI reads parameters from.
+        @functools.wraps(func)
+        async def endpoint(*args: Any, **kwargs: Any) -> Any:
+            return await _run_in_bulkhead(group, functools.partial(func, *args, **kwargs))
+
+        return endpoint
+
+    return decorate
+
+
+def _bulkhead_metrics() -> dict[str, dict[str, float]]:
+    result: dict[str, dict[str, float]] = {}
+    for name, state in bulkheads.items():
+        limiter = state["limiter"]
+        stats = limiter.statistics() if limiter is not None else None
+        samples = list(state["wait_samples_ms"])
+        result[name] = {
+            "threads": stats.total_tokens if stats else _bulkhead_threads(name),
+            "active": stats.borrowed_tokens if stats else 0,
+            "waiting": stats.tasks_waiting if stats else 0,
+            "rejected_total": state["rejected_total"],
+            "queue_wait_ms_avg": round(sum(samples) / len(samples), 2) if samples else 0,
+            "queue_wait_ms_p95": round(_percentile(samples, 95), 2),
+        }
+    return result
+
+
 @app.get("/health")
 def health():
     if chaos_state["enabled"]:
@@ -1386,15 +2843,14 @@ def health():
         raise HTTPException(status_code=503, detail=f"database unavailable: {exc}")
 
     try:
-        with httpx.Client(timeout=1.0) as client:
-            stock_resp = client.get(f"{_stock_url()}/health")
-            if stock_resp.status_code != 200:
-                raise RuntimeError("stock health check failed")
+        stock_resp = _upstream_client("stock").get(f"{_stock_url()}/health", timeout=1.0)
+        if stock_resp.status_code != 200:
+            raise RuntimeError("stock health check failed")
     except Exception as exc:
         raise HTTPException(status_code=503, detail=f"stock unavailable: {exc}")
 
     try:
-        connection = pika.BlockingConnection(_rabbit_params())
+        connection = pika.BlockingConnection(rabbit_publisher.connection_params())
         connection.close()
     except Exception as exc:
         raise HTTPException(status_code=503, detail=f"rabbitmq unavailable: {exc}")
@@ -1413,30 +2869,63 @@ def get_metrics():
         "outbox_published_total": metrics["outbox_published_total"],
         "outbox_publish_failed_total": metrics["outbox_publish_failed_total"],
         "outbox_backlog": _outbox_backlog(),
+        "payment_stage_completed_total": metrics["payment_stage_completed_total"],
+        "payment_stage_retries_total": metrics["payment_stage_retries_total"],
+        "payment_stage_cancelled_total": metrics["payment_stage_cancelled_total"],
+        "payment_stage_refund_failed_total": metrics["payment_stage_refund_failed_total"],
+        "stock_release_failed_total": metrics["stock_release_failed_total"],
+        "rabbit_connections_opened_total": rabbit_publisher.metrics["connections_opened_total"],
+        "rabbit_publish_retries_total": rabbit_publisher.metrics["publish_retries_total"],
+        "auth_cache_hits_total": metrics["auth_cache_hits_total"],
+        "auth_cache_misses_total": metrics["auth_cache_misses_total"],
+        "auth_cache_size": len(claims_cache),
+        "menu_l1_hits_total": metrics["menu_l1_hits_total"],
+        "menu_l1_misses_total": metrics["menu_l1_misses_total"],
+        "menu_l2_hits_total": metrics["menu_l2_hits_total"],
+        "menu_not_modified_total": metrics["menu_not_modified_total"],
+        "menu_coalesced_total": metrics["menu_coalesced_total"],
+        "menu_background_refreshes_total": metrics["menu_background_refreshes_total"],
+        "menu_prewarms_total": metrics["menu_prewarms_total"],
+        "menu_cache_version": menu_cache_state["version"],
+        "redis_connected": redis_client is not None,
+        "redis_failures_total": metrics["redis_failures_total"],
+        "menu_schedule_builds_total": metrics["menu_schedule_builds_total"],
+        "cache_bus_connected": cache_bus_state["connected"],
+        "cache_bus_replica_id": REPLICA_ID,
+        "cache_events_received_total": metrics["cache_events_received_total"],
+        "cache_bus_reconnects_total": metrics["cache_bus_reconnects_total"],
+        "price_catalog_loads_total": metrics["price_catalog_loads_total"],
+        "price_catalog_fallback_lookups_total": metrics["price_catalog_fallback_lookups_total"],
+        "cache_event_lag_ms_p50": round(_percentile(cache_event_lag_samples_ms, 50), 2),
+        "cache_event_lag_ms_p95": round(_percentile(cache_event_lag_samples_ms, 95), 2),
+        "cache_event_last_received_at": cache_bus_state["last_event_at"],
+        **_db_pool_metrics(),
+        "upstream_http": _upstream_http_metrics(),
+        "bulkheads": _bulkhead_metrics(),
     }
 
 
 def _admin_service_health_map() -> dict[str, str]:
     service_urls = {
-        "identity-provider": f"{_identity_url()}/health",
-        "stock-service": f"{_stock_url()}/health",
-        "kitchen-queue": f"{_kitchen_url()}/health",
-        "notification-hub": f"{_notification_url()}/health",
-        "payment-service": f"{_payment_url()}/health",
+        "identity-provider": ("identity", f"{_identity_url()}/health"),
+        "stock-service": ("stock", f"{_stock_url()}/health"),
+        "kitchen-queue": ("kitchen", f"{_kitchen_url()}/health"),
+        "notification-hub": ("notification", f"{_notification_url()}/health"),
+        "payment-service": ("payment", f"{_payment_url()}/health"),
     }
     results: dict[str, str] = {}
-    with httpx.Client(timeout=1.0) as client:
-        for name, url in service_urls.items():
-            try:
-                response = client.get(url)
-                results[name] = "up" if response.status_code == 200 else "down"
-            except Exception:
-                results[name] = "down"
+    for name, (upstream, url) in service_urls.items():
+        try:
+            response = _upstream_client(upstream).get(url, timeout=1.0)
+            results[name] = "up" if response.status_code == 200 else "down"
+        except Exception:
+            results[name] = "down"
     return results
 
 
 @app.get("/admin/health")
 @app.get("/admin/h")
+@_bulkhead("admin")
 def admin_health(
     authorization: str | None = Header(default=None),
     access_token: str | None = Cookie(default=None, alias=ACCESS_COOKIE_NAME),
@@ -1447,6 +2936,7 @@ def admin_health(
 
 
 @app.get("/api/admin/metrics")
+@_bulkhead("admin")
 def get_admin_metrics(
     authorization: str | None = Header(default=None),
     access_token: str | None = Cookie(default=None, alias=ACCESS_COOKIE_NAME),
@@ -1463,16 +2953,35 @@ def get_admin_metrics(
         "queue_depth_kitchen_jobs": kitchen_queue_depth,
         "queue_depth_order_status": status_queue_depth,
         "outbox_backlog": _outbox_backlog(),
+        "admission": {
+            "in_flight": admission_state["in_flight"],
+            "waiting": admission_state["waiting"],
+            "limit": admission_state["limit"],
+            "recent_p95_ms": round(admission_state["p95_ms"], 2),
+            "admitted_total": metrics["orders_admitted_total"],
+            "queued_total": metrics["orders_queued_total"],
+            "shed_queue_full_total": metrics["orders_shed_queue_full_total"],
+            "shed_wait_timeout_total": metrics["orders_shed_wait_timeout_total"],
+            "shed_kitchen_backlog_total": metrics["orders_shed_kitchen_backlog_total"],
+            "rate_limited_total": metrics["orders_rate_limited_total"],
+            "rate_limit_local_fallback_total": metrics["rate_limit_local_fallback_total"],
+            "idempotency_claims_total": metrics["idempotency_claims_total"],
+            "idempotency_follower_waits_total": metrics["idempotency_follower_waits_total"],
+            "idempotency_claim_unavailable_total": metrics["idempotency_claim_unavailable_total"],
+            "idempotency_cache_hits_total": metrics["idempotency_cache_hits_total"],
+            "idempotency_db_lookups_total": metrics["idempotency_db_lookups_total"],
+            "idempotency_duplicates_blocked_total": metrics["idempotency_duplicates_blocked_total"],
+        },
         "updatedAt": int(time.time()),
     }
 
 
 @app.get("/admin/metrics")
-def get_admin_metrics_alias(
+async def get_admin_metrics_alias(
     authorization: str | None = Header(default=None),
     access_token: str | None = Cookie(default=None, alias=ACCESS_COOKIE_NAME),
 ):
-    return get_admin_metrics(authorization=authorization, access_token=access_token)
+    return await get_admin_metrics(authorization=authorization, access_token=access_token)
 
 
 @app.on_event("startup")
@@ -1481,11 +2990,29 @@ def on_startup():
     _ensure_outbox_schema()
     _ensure_wallet_schema()
     _ensure_order_slip_schema()
+    _ensure_order_pipeline_schema()
     _ensure_kitchen_settings_schema()
     _ensure_menu_slot_schema()
     _ensure_ramadan_visibility_schema()
     threading.Thread(target=_outbox_worker_loop, daemon=True).start()
     threading.Thread(target=_cache_invalidator_loop, daemon=True).start()
+    _refresh_menu_schedule()
+    threading.Thread(target=_menu_schedule_loop, daemon=True).start()
+    threading.Thread(target=_menu_prewarm_loop, daemon=True).start()
+    threading.Thread(target=_idempotency_index_loop, daemon=True).start()
+    # One worker even in sync mode, to drain jobs left from a previous async run.
+    for _ in range(_order_payment_workers() if _order_pipeline_async() else 1):
+        threading.Thread(target=_payment_stage_worker_loop, daemon=True).start()
+
+
+@app.on_event("startup")
+async def on_startup_async():
+    try:
+        await _async_db_pool()
+    except Exception:
+        # Opened lazily by the first request instead; startup stays tolerant of a late Postgres.
+        pass
+    async_tasks.append(asyncio.create_task(_admission_signal_loop()))
 
 
 @app.on_event("shutdown")
@@ -1493,6 +3020,21 @@ def on_shutdown():
     outbox_worker_state["running"] = False
     cache_worker_state["running"] = False
     _close_redis()
+    _close_db_pool()
+    _close_upstream_clients()
+    with queue_depth_lock:
+        _close_queue_depth_channel()
+    rabbit_publisher.close_all()
+
+
+@app.on_event("shutdown")
+async def on_shutdown_async():
+    for task in async_tasks:
+        task.cancel()
+    async_tasks.clear()
+    await _close_async_redis()
+    await _close_async_db_pool()
+    await _close_async_upstream_clients()
 
 
 @app.post("/chaos/fail")
@@ -1503,6 +3045,7 @@ def chaos_fail(payload: ChaosRequest):
 
 
 @app.get("/api/admin/menu")
+@_bulkhead("admin")
 def admin_get_menu(
     authorization: str | None = Header(default=None),
     access_token: str | None = Cookie(default=None, alias=ACCESS_COOKIE_NAME),
@@ -1535,6 +3078,7 @@ def admin_get_menu(
 
 
 @app.get("/api/admin/menu/slots")
+@_bulkhead("admin")
 def admin_get_menu_slots(
     authorization: str | None = Header(default=None),
     access_token: str | None = Cookie(default=None, alias=ACCESS_COOKIE_NAME),
@@ -1570,6 +3114,7 @@ def admin_get_menu_slots(
 
 
 @app.post("/api/admin/menu/slots/{main}/{slot}/items")
+@_bulkhead("admin")
 def admin_assign_menu_slot_items(
     main: str,
     slot: str,
@@ -1619,6 +3164,7 @@ def admin_assign_menu_slot_items(
 
 
 @app.get("/api/admin/menu/visibility")
+@_bulkhead("admin")
 def admin_get_menu_visibility(
     authorization: str | None = Header(default=None),
     access_token: str | None = Cookie(default=None, alias=ACCESS_COOKIE_NAME),
@@ -1639,6 +3185,7 @@ def admin_get_menu_visibility(
 
 
 @app.put("/api/admin/menu/visibility")
+@_bulkhead("admin")
 def admin_update_menu_visibility(
     payload: AdminRamadanVisibilityUpdateRequest,
     authorization: str | None = Header(default=None),
@@ -1680,6 +3227,7 @@ def admin_update_menu_visibility(
 
 
 @app.post("/api/admin/menu")
+@_bulkhead("admin")
 def admin_create_menu_item(
     payload: AdminMenuCreateRequest,
     authorization: str | None = Header(default=None),
@@ -1717,6 +3265,7 @@ def admin_create_menu_item(
 
 
 @app.put("/api/admin/menu/{item_id}")
+@_bulkhead("admin")
 def admin_update_menu_item(
     item_id: str,
     payload: AdminMenuUpdateRequest,
@@ -1755,6 +3304,7 @@ def admin_update_menu_item(
 
 
 @app.patch("/api/admin/menu/{item_id}")
+@_bulkhead("admin")
 def admin_patch_menu_item_availability(
     item_id: str,
     payload: AdminMenuAvailabilityRequest,
@@ -1793,6 +3343,7 @@ def admin_patch_menu_item_availability(
 
 
 @app.get("/api/admin/menu/windows")
+@_bulkhead("admin")
 def admin_get_menu_windows(
     authorization: str | None = Header(default=None),
     access_token: str | None = Cookie(default=None, alias=ACCESS_COOKIE_NAME),
@@ -1832,6 +3383,7 @@ def admin_get_menu_windows(
 
 
 @app.post("/api/admin/menu/windows")
+@_bulkhead("admin")
 def admin_create_menu_window(
     payload: AdminMenuWindowCreateRequest,
     authorization: str | None = Header(default=None),
@@ -1879,6 +3431,7 @@ def admin_create_menu_window(
 
 
 @app.put("/api/admin/menu/windows/{window_id}")
+@_bulkhead("admin")
 def admin_update_menu_window(
     window_id: int,
     payload: AdminMenuWindowUpdateRequest,
@@ -1930,6 +3483,7 @@ def admin_update_menu_window(
 
 
 @app.delete("/api/admin/menu/windows/{window_id}")
+@_bulkhead("admin")
 def admin_delete_menu_window(
     window_id: int,
     authorization: str | None = Header(default=None),
@@ -1950,6 +3504,7 @@ def admin_delete_menu_window(
 
 
 @app.post("/api/admin/menu/windows/{window_id}/items")
+@_bulkhead("admin")
 def admin_assign_window_items(
     window_id: int,
     payload: AdminMenuWindowItemsRequest,
@@ -1992,7 +3547,18 @@ def admin_assign_window_items(
 
 
 @app.post("/api/login")
+@_bulkhead("orders")
 def login(payload: LoginRequest, response: Response):
+    return _login(payload, response)
+
+
+@app.post("/api/auth/login")
+@_bulkhead("orders")
+def auth_login(payload: LoginRequest, response: Response):
+    return _login(payload, response)
+
+
+def _login(payload: LoginRequest, response: Response):
     _should_fail()
     metrics["login_proxy_total"] += 1
 
@@ -2000,36 +3566,32 @@ def login(payload: LoginRequest, response: Response):
     data = json.dumps(payload.model_dump()).encode("utf-8")
 
     try:
-        with httpx.Client(timeout=5) as client:
-            resp = client.post(url, content=data, headers={"Content-Type": "application/json"})
-            if resp.status_code >= 400:
-                detail = resp.json().get("detail") if resp.headers.get("content-type", "").startswith("application/json") else "Login failed"
-                if isinstance(detail, dict):
-                    detail = detail.get("message", "Login failed")
-                return JSONResponse(status_code=resp.status_code, content={"message": detail or "Login failed", "error": "Unauthorized"})
-            body = resp.json()
-            token = body.get("access_token")
-            if isinstance(token, str) and token:
-                response.set_cookie(
-                    key=ACCESS_COOKIE_NAME,
-                    value=token,
-                    httponly=True,
-                    samesite="lax",
-                    secure=_cookie_secure(),
-                    max_age=_jwt_exp_minutes() * 60,
-                    path="/",
-                )
-            return body
+        client = _upstream_client("identity")
+        resp = client.post(url, content=data, headers={"Content-Type": "application/json"}, timeout=5)
+        if resp.status_code >= 400:
+            detail = resp.json().get("detail") if resp.headers.get("content-type", "").startswith("application/json") else "Login failed"
+            if isinstance(detail, dict):
+                detail = detail.get("message", "Login failed")
+            return JSONResponse(status_code=resp.status_code, content={"message": detail or "Login failed", "error": "Unauthorized"})
+        body = resp.json()
+        token = body.get("access_token")
+        if isinstance(token, str) and token:
+            response.set_cookie(
+                key=ACCESS_COOKIE_NAME,
+                value=token,
+                httponly=True,
+                samesite="lax",
+                secure=_cookie_secure(),
+                max_age=_jwt_exp_minutes() * 60,
+                path="/",
+            )
+        return body
     except Exception as exc:
         return JSONResponse(status_code=503, content={"message": f"Identity service unavailable: {exc}", "error": "Service Unavailable"})
 
 
-@app.post("/api/auth/login")
-def auth_login(payload: LoginRequest, response: Response):
-    return login(payload, response)
-
-
 @app.post("/api/auth/register")
+@_bulkhead("orders")
 def auth_register(payload: RegisterRequest, response: Response):
     _should_fail()
     metrics["login_proxy_total"] += 1
@@ -2037,34 +3599,35 @@ def auth_register(payload: RegisterRequest, response: Response):
     data = json.dumps(payload.model_dump()).encode("utf-8")
 
     try:
-        with httpx.Client(timeout=5) as client:
-            resp = client.post(url, content=data, headers={"Content-Type": "application/json"})
-            if resp.status_code >= 400:
-                detail = (
-                    resp.json().get("detail")
-                    if resp.headers.get("content-type", "").startswith("application/json")
-                    else "Registration failed"
-                )
-                return JSONResponse(status_code=resp.status_code, content={"message": detail or "Registration failed"})
-
-            body = resp.json()
-            token = body.get("access_token")
-            if isinstance(token, str) and token:
-                response.set_cookie(
-                    key=ACCESS_COOKIE_NAME,
-                    value=token,
-                    httponly=True,
-                    samesite="lax",
-                    secure=_cookie_secure(),
-                    max_age=_jwt_exp_minutes() * 60,
-                    path="/",
-                )
-            return body
+        client = _upstream_client("identity")
+        resp = client.post(url, content=data, headers={"Content-Type": "application/json"}, timeout=5)
+        if resp.status_code >= 400:
+            detail = (
+                resp.json().get("detail")
+                if resp.headers.get("content-type", "").startswith("application/json")
+                else "Registration failed"
+            )
+            return JSONResponse(status_code=resp.status_code, content={"message": detail or "Registration failed"})
+
+        body = resp.json()
+        token = body.get("access_token")
+        if isinstance(token, str) and token:
+            response.set_cookie(
+                key=ACCESS_COOKIE_NAME,
+                value=token,
+                httponly=True,
+                samesite="lax",
+                secure=_cookie_secure(),
+                max_age=_jwt_exp_minutes() * 60,
+                path="/",
+            )
+        return body
     except Exception as exc:
         return JSONResponse(status_code=503, content={"message": f"Identity service unavailable: {exc}"})
 
 
 @app.post("/api/refresh")
+@_bulkhead("orders")
 def refresh(
     response: Response,
     authorization: str | None = Header(default=None),
@@ -2074,23 +3637,23 @@ def refresh(
     if not token:
         raise HTTPException(status_code=401, detail="Missing or invalid token")
     try:
-        with httpx.Client(timeout=5) as client:
-            resp = client.post(f"{_identity_url()}/refresh", headers={"Authorization": f"Bearer {token}"})
-            if resp.status_code >= 400:
-                raise HTTPException(status_code=401, detail="Missing or invalid token")
-            body = resp.json()
-            refreshed = body.get("access_token")
-            if isinstance(refreshed, str) and refreshed:
-                response.set_cookie(
-                    key=ACCESS_COOKIE_NAME,
-                    value=refreshed,
-                    httponly=True,
-                    samesite="lax",
-                    secure=_cookie_secure(),
-                    max_age=_jwt_exp_minutes() * 60,
-                    path="/",
-                )
-            return body
+        client = _upstream_client("identity")
+        resp = client.post(f"{_identity_url()}/refresh", headers={"Authorization": f"Bearer {token}"}, timeout=5)
+        if resp.status_code >= 400:
+            raise HTTPException(status_code=401, detail="Missing or invalid token")
+        body = resp.json()
+        refreshed = body.get("access_token")
+        if isinstance(refreshed, str) and refreshed:
+            response.set_cookie(
+                key=ACCESS_COOKIE_NAME,
+                value=refreshed,
+                httponly=True,
+                samesite="lax",
+                secure=_cookie_secure(),
+                max_age=_jwt_exp_minutes() * 60,
+                path="/",
+            )
+        return body
     except HTTPException:
         raise
     except Exception as exc:
@@ -2098,6 +3661,7 @@ def refresh(
 
 
 @app.get("/api/auth/me")
+@_bulkhead("orders")
 def auth_me(
     authorization: str | None = Header(default=None),
     access_token: str | None = Cookie(default=None, alias=ACCESS_COOKIE_NAME),
@@ -2113,16 +3677,31 @@ def auth_me(
 
 
 @app.post("/api/auth/logout")
+@_bulkhead("orders")
 def auth_logout(response: Response):
     response.delete_cookie(key=ACCESS_COOKIE_NAME, path="/")
     return {"ok": True}
 
 
 @app.get("/api/wallet/balance")
+@_bulkhead("orders")
 def wallet_balance(
     authorization: str | None = Header(default=None),
     access_token: str | None = Cookie(default=None, alias=ACCESS_COOKIE_NAME),
 ):
+    return _wallet_balance(authorization, access_token)
+
+
+@app.get("/api/wallet")
+@_bulkhead("orders")
+def wallet_get(
+    authorization: str | None = Header(default=None),
+    access_token: str | None = Cookie(default=None, alias=ACCESS_COOKIE_NAME),
+):
+    return _wallet_balance(authorization, access_token)
+
+
+def _wallet_balance(authorization: str | None, access_token: str | None) -> dict[str, Any]:
     auth = _extract_auth(authorization, access_token)
     if not auth:
         raise HTTPException(status_code=401, detail="Missing or invalid token")
@@ -2143,15 +3722,8 @@ def wallet_balance(
             return {"student_id": auth["student_id"], "account_balance": int(row[0])}
 
 
-@app.get("/api/wallet")
-def wallet_get(
-    authorization: str | None = Header(default=None),
-    access_token: str | None = Cookie(default=None, alias=ACCESS_COOKIE_NAME),
-):
-    return wallet_balance(authorization=authorization, access_token=access_token)
-
-
 @app.get("/api/wallet/transactions")
+@_bulkhead("orders")
 def wallet_transactions(
     status: str = Query(default="all"),
     limit: int = Query(default=50, ge=1, le=200),
@@ -2219,6 +3791,7 @@ def wallet_transactions(
 
 
 @app.post("/api/wallet/topups")
+@_bulkhead("orders")
 def wallet_topup(
     payload: WalletTopupRequest,
     authorization: str | None = Header(default=None),
@@ -2337,6 +3910,7 @@ def wallet_topup(
 
 
 @app.post("/api/wallet/webhook/{provider}")
+@_bulkhead("orders")
 def wallet_webhook(
     provider: str,
     payload: WalletWebhookRequest,
@@ -2399,6 +3973,7 @@ def wallet_webhook(
 
 
 @app.get("/api/admin/wallet/topups")
+@_bulkhead("admin")
 def admin_wallet_topups(
     status: str = Query(default="pending"),
     authorization: str | None = Header(default=None),
@@ -2452,6 +4027,7 @@ def admin_wallet_topups(
 
 
 @app.post("/api/admin/wallet/topups/{topup_id}/review")
+@_bulkhead("admin")
 def admin_review_topup(
     topup_id: str,
     payload: AdminTopupReviewRequest,
@@ -2507,6 +4083,7 @@ def admin_review_topup(
 
 
 @app.get("/api/admin/kitchen/orders")
+@_bulkhead("admin")
 def admin_kitchen_orders(
     authorization: str | None = Header(default=None),
     access_token: str | None = Cookie(default=None, alias=ACCESS_COOKIE_NAME),
@@ -2568,6 +4145,7 @@ def admin_kitchen_orders(
 
 
 @app.get("/api/admin/kitchen/peak-mode")
+@_bulkhead("admin")
 def admin_get_kitchen_peak_mode(
     authorization: str | None = Header(default=None),
     access_token: str | None = Cookie(default=None, alias=ACCESS_COOKIE_NAME),
@@ -2577,6 +4155,7 @@ def admin_get_kitchen_peak_mode(
 
 
 @app.put("/api/admin/kitchen/peak-mode")
+@_bulkhead("admin")
 def admin_set_kitchen_peak_mode(
     payload: AdminKitchenPeakModeRequest,
     authorization: str | None = Header(default=None),
@@ -2598,6 +4177,7 @@ def admin_set_kitchen_peak_mode(
 
 
 @app.post("/api/admin/kitchen/orders/{order_id}/status")
+@_bulkhead("admin")
 def admin_kitchen_set_status(
     order_id: str,
     payload: AdminKitchenStatusRequest,
@@ -2678,7 +4258,7 @@ def admin_kitchen_set_status(
     event_from_status = "READY" if action == "extend" else expected_current
     event_to_status = "READY" if action == "extend" else target_status
     is_expired = bool(target_status == "READY" and resolved_ready_until and resolved_ready_until <= now)
-    _publish_queue(
+    rabbit_publisher.publish_queue(
         "order.status",
         {
             "event": event_type,
@@ -2710,21 +4290,36 @@ def admin_kitchen_set_status(
 
 
 @app.get("/api/menu")
-def get_menu(
+async def get_menu(
     main: str | None = Query(default=None),
     slot: str | None = Query(default=None),
     context: str | None = Query(default=None),
     x_debug_time: str | None = Header(default=None, alias="X-Debug-Time"),
+    if_none_match: str | None = Header(default=None, alias="If-None-Match"),
     authorization: str | None = Header(default=None),
     access_token: str | None = Cookie(default=None, alias=ACCESS_COOKIE_NAME),
 ):
-    _should_fail()
-    auth = _extract_auth(authorization, access_token)
+    await _should_fail_async()
+    auth = await _extract_auth_async(authorization, access_token)
     if not auth:
         raise HTTPException(status_code=401, detail="Missing or invalid token")
 
     now_local = _parse_debug_time(x_debug_time) or datetime.now(ZoneInfo(_menu_timezone()))
+    if menu_schedule["index"] is not None:
+        l1_key = _menu_l1_key(main, slot, context, now_local)
+    else:
+        # Without a schedule index the key is resolved from Postgres; keep that off the loop.
+        l1_key = await _run_in_bulkhead("menu", _menu_l1_key, main, slot, context, now_local)
+
+    # L1 hits are answered on the event loop; misses build (or wait for) the
+    # payload on a menu worker thread behind the per-key single-flight.
+    cached = _menu_l1_hit(l1_key, now_local)
+    if cached is None:
+        cached = await _run_in_bulkhead("menu", _menu_body, l1_key, now_local)
+    return _menu_response(*cached, if_none_match)
 
+
+def _menu_l1_key(main: str | None, slot: str | None, context: str | None, now_local: datetime) -> MenuL1Key:
     requested_main = (main or "").strip().lower()
     requested_slot = (slot or "").strip().lower()
 
@@ -2743,14 +4338,97 @@ def get_menu(
     if not _is_valid_main_slot(requested_main, requested_slot):
         raise HTTPException(status_code=422, detail="Invalid slot for selected main")
 
-    visibility = _get_ramadan_visibility(now_local)
+    visibility = _menu_schedule_visibility(now_local)
     if requested_main == "ramadan" and not visibility["visible"]:
         requested_main = "regular"
         requested_slot = _default_slot_for_main("regular")
 
-    next_change_at = _next_change_at_for_menu_slot(requested_main, requested_slot, now_local)
-    cache_key = _menu_cache_key_for_slot(requested_main, requested_slot)
-    payload = _cache_get_json(cache_key)
+    next_change_at = _menu_schedule_next_change(requested_main, requested_slot, now_local)
+    return (requested_main, requested_slot, next_change_at, bool(visibility["visible"]))
+
+
+def _menu_flight_claim(flight_key: tuple[Any, ...]) -> tuple[threading.Event, bool]:
+    with menu_l1_lock:
+        event = menu_flights.get(flight_key)
+        if event is not None:
+            return event, False
+        event = threading.Event()
+        menu_flights[flight_key] = event
+        return event, True
+
+
+def _menu_flight_done(flight_key: tuple[Any, ...], event: threading.Event) -> None:
+    with menu_l1_lock:
+        if menu_flights.get(flight_key) is event:
+            del menu_flights[flight_key]
+    event.set()
+
+
+def _menu_l1_hit(key: MenuL1Key, now_local: datetime) -> tuple[bytes, str] | None:
+    cached = _menu_l1_get(key)
+    if cached is None:
+        return None
+    body, etag, refresh_due = cached
+    if refresh_due:
+        _start_menu_refresh(key, now_local)
+    return body, etag
+
+
+def _menu_body(key: MenuL1Key, now_local: datetime) -> tuple[bytes, str]:
+    cached = _menu_l1_hit(key, now_local)
+    if cached is not None:
+        return cached
+
+    # Single-flight: at a slot boundary every request misses the same new key;
+    # one of them rebuilds it and the rest wait for its L1 entry.
+    event, leader = _menu_flight_claim(key)
+    if not leader:
+        metrics["menu_coalesced_total"] += 1
+        event.wait(_menu_single_flight_wait_seconds())
+        cached = _menu_l1_get(key)
+        if cached is not None:
+            return cached[0], cached[1]
+        # Leader failed or is too slow; build it ourselves rather than fail the request.
+        return _build_menu_body(key, now_local)
+    try:
+        return _build_menu_body(key, now_local)
+    finally:
+        _menu_flight_done(key, event)
+
+
+def _start_menu_refresh(key: MenuL1Key, now_local: datetime) -> None:
+    flight_key = ("refresh", *key)
+    event, leader = _menu_flight_claim(flight_key)
+    if not leader:
+        return
+
+    def refresh() -> None:
+        try:
+            _build_menu_body(key, now_local, background=True)
+            metrics["menu_background_refreshes_total"] += 1
+        except Exception:
+            # The stale entry keeps serving until it expires; the next miss retries.
+            pass
+        finally:
+            _menu_flight_done(flight_key, event)
+
+    threading.Thread(target=refresh, daemon=True).start()
+
+
+def _build_menu_body(
+    key: MenuL1Key, now_local: datetime, background: bool = False, rebuild: bool = False
+) -> tuple[bytes, str]:
+    requested_main, requested_slot, next_change_at, visible = key
+    version = menu_cache_state["version"]
+    cache_key = _menu_cache_key_for_slot(requested_main, requested_slot, _menu_generation())
+    cached = None if rebuild else _cache_get_json(cache_key)
+    payload = cached.get("payload") if isinstance(cached, dict) else None
+    if isinstance(payload, dict) and time.time() >= float(cached.get("refresh_at") or 0):
+        if background:
+            # Already off the request path: rebuild from Postgres now.
+            payload = None
+        else:
+            _start_menu_refresh(key, now_local)
     if not isinstance(payload, dict):
         items = _get_slot_items(requested_main, requested_slot)
         generated_at = datetime.now(ZoneInfo(_menu_timezone())).isoformat()
@@ -2760,7 +4438,7 @@ def get_menu(
             "items": items,
             "generated_at": generated_at,
             "next_change_at": next_change_at,
-            "ramadan_visible": bool(visibility["visible"]),
+            "ramadan_visible": visible,
         }
         ttl_seconds = _menu_cache_ttl_seconds()
         if next_change_at:
@@ -2771,89 +4449,592 @@ def get_menu(
                     ttl_seconds = min(ttl_seconds, seconds_until_change)
             except Exception:
                 pass
-        _cache_set_json(cache_key, payload, max(ttl_seconds, 1))
+        ttl_seconds = max(ttl_seconds, 1)
+        _cache_set_json(
+            cache_key,
+            {"payload": payload, "refresh_at": time.time() + ttl_seconds * _menu_refresh_ahead_fraction()},
+            ttl_seconds,
+        )
     else:
+        metrics["menu_l2_hits_total"] += 1
         payload["main"] = requested_main
         payload["slot"] = requested_slot
         payload["next_change_at"] = next_change_at
-        payload["ramadan_visible"] = bool(visibility["visible"])
+        payload["ramadan_visible"] = visible
         payload.setdefault("generated_at", datetime.now(ZoneInfo(_menu_timezone())).isoformat())
         payload.setdefault("items", [])
 
-    return payload
+    l1_ttl = float(_menu_l1_ttl_seconds())
+    if next_change_at:
+        try:
+            l1_ttl = min(l1_ttl, (datetime.fromisoformat(next_change_at) - now_local).total_seconds())
+        except Exception:
+            pass
+    body, etag = _encode_menu_payload(payload)
+    if l1_ttl > 0:
+        _menu_l1_put(key, body, etag, version, l1_ttl)
+    return body, etag
+
+
+def _menu_response(body: bytes, etag: str, if_none_match: str | None) -> Response:
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if _etag_matches(if_none_match, etag):
+        metrics["menu_not_modified_total"] += 1
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+GATEWAY_REDIS_SCRIPTS: dict[str, str] = {}
+IDEMPOTENCY_INDEX_SINCE_KEY = "idem:index:since"
+
+# Token bucket per student, refilled lazily. Uses the Redis clock so every
+# gateway replica agrees on elapsed time. Returns {allowed, retry_after}.
+GATEWAY_REDIS_SCRIPTS["order_rate_limit"] = """
+local burst = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(now - ts, 0) * rate)
+local allowed = 0
+local retry_after = 0
+if tokens >= 1 then
+  tokens = tokens - 1
+  allowed = 1
+else
+  retry_after = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return {allowed, tostring(retry_after)}
+"""
+
+# Ends an idempotency claim only if we still own it: ARGV[2] empty deletes it,
+# otherwise it is replaced by the leader's error for followers to replay.
+# A result (ARGV[4]) is cached under KEYS[2] either way.
+GATEWAY_REDIS_SCRIPTS["idempotency_release"] = """
+if ARGV[4] ~= '' then
+  redis.call('SET', KEYS[2], ARGV[4], 'EX', ARGV[5])
+end
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+  return 0
+end
+if ARGV[2] == '' then
+  return redis.call('DEL', KEYS[1])
+end
+redis.call('SET', KEYS[1], ARGV[2], 'PX', ARGV[3])
+return 1
+"""
+
+# First step for a keyed order, in one round trip: replay a cached result, or
+# claim the key. The claim reports whether a miss here is authoritative, i.e.
+# the index marker is at least one record TTL old.
+GATEWAY_REDIS_SCRIPTS["idempotency_begin"] = """
+local record = redis.call('GET', KEYS[1])
+if record then
+  return {'hit', record}
+end
+if not redis.call('SET', KEYS[3], ARGV[1], 'NX', 'PX', ARGV[2]) then
+  return {'busy', ''}
+end
+local since = tonumber(redis.call('GET', KEYS[2]) or '')
+local clock = redis.call('TIME')
+if since and since <= tonumber(clock[1]) + tonumber(clock[2]) / 1000000 - tonumber(ARGV[3]) then
+  return {'claimed', '1'}
+end
+return {'claimed', '0'}
+"""
+
+
+def _redis_script(client: redis.Redis | redis.asyncio.Redis, name: str) -> Any:
+    with redis_state_lock:
+        if redis_scripts["client"] is not client:
+            redis_scripts["client"] = client
+            redis_scripts["scripts"] = {}
+        script = redis_scripts["scripts"].get(name)
+        if script is None:
+            script = client.register_script(GATEWAY_REDIS_SCRIPTS[name])
+            redis_scripts["scripts"][name] = script
+        return script
+
+
+def _order_rate_limit_key(student_id: str) -> str:
+    return f"ratelimit:orders:{student_id}"
+
+
+async def _take_order_token_redis(
+    client: redis.asyncio.Redis, student_id: str, burst: float, rate: float
+) -> tuple[bool, float]:
+    script = _redis_script(client, "order_rate_limit")
+    allowed, retry_after = await script(keys=[_order_rate_limit_key(student_id)], args=[burst, rate])
+    return int(allowed) == 1, float(retry_after)
+
+
+def _take_order_token_local(student_id: str, burst: float, rate: float) -> tuple[bool, float]:
+    # Per-replica fallback while Redis is down: looser across replicas, but still bounded.
+    now = time.monotonic()
+    with rate_limit_lock:
+        tokens, ts = rate_limit_buckets.get(student_id, (burst, now))
+        tokens = min(burst, tokens + max(now - ts, 0.0) * rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        rate_limit_buckets[student_id] = (tokens, now)
+        rate_limit_buckets.move_to_end(student_id)
+        while len(rate_limit_buckets) > 10000:
+            rate_limit_buckets.popitem(last=False)
+    return allowed, 0.0 if allowed else (1 - tokens) / rate
+
+
+async def _enforce_order_rate_limit(student_id: str, role: str) -> None:
+    burst, rate = _order_rate_limit(role)
+    if rate <= 0:
+        return
+    client = await _async_redis()
+    result = None
+    if client is not None:
+        try:
+            result = await _take_order_token_redis(client, student_id, burst, rate)
+            _redis_ok()
+        except redis.RedisError as exc:
+            _redis_failed(exc)
+    if result is None:
+        metrics["rate_limit_local_fallback_total"] += 1
+        result = _take_order_token_local(student_id, burst, rate)
+    allowed, retry_after = result
+    if not allowed:
+        metrics["orders_rate_limited_total"] += 1
+        metrics["orders_failed_total"] += 1
+        raise HTTPException(
+            status_code=429,
+            detail="Too many orders, slow down",
+            headers={"Retry-After": str(max(math.ceil(retry_after), 1))},
+        )
+
+
+def _idempotency_digest(idempotency_key: str) -> str:
+    return hashlib.sha256(idempotency_key.encode("utf-8")).hexdigest()[:32]
+
+
+def _idempotency_claim_key(student_id: str, idempotency_key: str) -> str:
+    return f"idem:claim:{student_id}:{_idempotency_digest(idempotency_key)}"
+
+
+def _idempotency_record_key(student_id: str, idempotency_key: str) -> str:
+    return f"idem:order:{student_id}:{_idempotency_digest(idempotency_key)}"
+
+
+# Replays are served from the response cached with the key. Only an order the
+# payment stage has not settled yet is re-read, since its status may change.
+IDEMPOTENCY_UNSETTLED_STATUSES = {"PENDING_PAYMENT"}
+
+
+def _idempotency_record(replay: dict[str, Any]) -> str:
+    return json.dumps({**replay, "idempotent_replay": True})
+
+
+async def _replay_from_record(raw: str, record_key: str) -> dict[str, Any] | None:
+    """Replay the response cached for a key; None if its order is gone."""
+    # Records briefly held just the order id; those are reloaded too.
+    cached = json.loads(raw) if raw.startswith("{") else {"order_id": raw}
+    if cached.get("status") and cached["status"] not in IDEMPOTENCY_UNSETTLED_STATUSES:
+        metrics["idempotency_cache_hits_total"] += 1
+        return {**cached, "idempotent_replay": True}
+    replay = await _idempotent_order_by_id(str(cached["order_id"]))
+    if replay is None:
+        return None
+    metrics["idempotency_cache_hits_total"] += 1
+    if replay["status"] not in IDEMPOTENCY_UNSETTLED_STATUSES:
+        # Settled now: later retries are answered from Redis alone.
+        client = await _async_redis()
+        if client is not None:
+            try:
+                await client.set(record_key, _idempotency_record(replay), xx=True, keepttl=True)
+                _redis_ok()
+            except redis.RedisError as exc:
+                _redis_failed(exc)
+    return replay
+
+
+async def _claim_idempotency(student_id: str, idempotency_key: str) -> tuple[str | None, dict[str, Any] | None]:
+    """Return (claim value, None) for the leader or (None, replay) for a replay/follower.
+
+    A new key costs one script call. Postgres is only read when Redis is
+    unavailable or its index is not yet complete; without Redis the request
+    runs unclaimed, as before.
+    """
+    claim_key = _idempotency_claim_key(student_id, idempotency_key)
+    record_key = _idempotency_record_key(student_id, idempotency_key)
+    claim_value = f"pending:{uuid.uuid4().hex}"
+    lease_ms = int(_order_idempotency_lease_seconds() * 1000)
+    for _ in range(3):
+        client = await _async_redis()
+        if client is None:
+            metrics["idempotency_claim_unavailable_total"] += 1
+            return None, await _find_idempotent_order(student_id, idempotency_key)
+        try:
+            if idempotency_index_state["stale"]:
+                await client.delete(IDEMPOTENCY_INDEX_SINCE_KEY)
+                idempotency_index_state["stale"] = False
+            script = _redis_script(client, "idempotency_begin")
+            status, value = await script(
+                keys=[record_key, IDEMPOTENCY_INDEX_SINCE_KEY, claim_key],
+                args=[claim_value, lease_ms, _order_idempotency_cache_ttl_seconds()],
+            )
+            _redis_ok()
+        except redis.RedisError as exc:
+            _redis_failed(exc)
+            metrics["idempotency_claim_unavailable_total"] += 1
+            return None, await _find_idempotent_order(student_id, idempotency_key)
+        if status == "hit":
+            replay = await _replay_from_record(value, record_key)
+            if replay is not None:
+                return None, replay
+            # The order was deleted; forget the key and claim it afresh.
+            try:
+                await client.delete(record_key)
+            except redis.RedisError as exc:
+                _redis_failed(exc)
+            continue
+        if status == "claimed":
+            metrics["idempotency_claims_total"] += 1
+            if value != "1":
+                # Redis may not know keys written before its index was (re)built.
+                metrics["idempotency_db_lookups_total"] += 1
+                existing = await _find_idempotent_order(student_id, idempotency_key)
+                if existing:
+                    await _release_idempotency_claim(student_id, idempotency_key, claim_value, None, existing)
+                    return None, existing
+            return claim_value, None
+        metrics["idempotency_follower_waits_total"] += 1
+        replay = await _await_idempotency_leader(student_id, idempotency_key, claim_key)
+        if replay is not None:
+            return None, replay
+        # The leader gave up without a result; try to take over.
+    raise HTTPException(status_code=409, detail="Order with this Idempotency-Key is in progress", headers={"Retry-After": "1"})
+
+
+async def _await_idempotency_leader(student_id: str, idempotency_key: str, claim_key: str) -> dict[str, Any] | None:
+    deadline = time.monotonic() + _order_idempotency_wait_seconds()
+    while time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+        value = await _cache_get_text_async(claim_key)
+        if value is None:
+            record_key = _idempotency_record_key(student_id, idempotency_key)
+            record = await _cache_get_text_async(record_key)
+            replay = await _replay_from_record(record, record_key) if record else None
+            return replay or await _find_idempotent_order(student_id, idempotency_key)
+        if value.startswith("{"):
+            failure = json.loads(value)
+            raise HTTPException(status_code=int(failure["status_code"]), detail=failure["detail"])
+    raise HTTPException(status_code=409, detail="Order with this Idempotency-Key is in progress", headers={"Retry-After": "1"})
+
+
+async def _release_idempotency_claim(
+    student_id: str,
+    idempotency_key: str,
+    claim_value: str,
+    failure: HTTPException | None,
+    result: dict[str, Any] | None = None,
+) -> None:
+    client = await _async_redis()
+    if client is None:
+        if result is not None:
+            idempotency_index_state["stale"] = True
+        return
+    # The leader's response is cached for replays; rejections (stock, payment)
+    # are replayed to followers for a few seconds only, then the key may be retried.
+    outcome = json.dumps({"status_code": failure.status_code, "detail": failure.detail}) if failure else ""
+    record = _idempotency_record(result) if result and result.get("order_id") else ""
+    try:
+        script = _redis_script(client, "idempotency_release")
+        await script(
+            keys=[
+                _idempotency_claim_key(student_id, idempotency_key),
+                _idempotency_record_key(student_id, idempotency_key),
+            ],
+            args=[claim_value, outcome, 5000, record, _order_idempotency_cache_ttl_seconds()],
+        )
+    except redis.RedisError as exc:
+        _redis_failed(exc)
+        if result is not None:
+            idempotency_index_state["stale"] = True
+
+
+def _backfill_idempotency_index() -> None:
+    """Load keys younger than the cache TTL into Redis, then mark Redis misses as authoritative."""
+    client = _redis()
+    if client is None:
+        return
+    ttl_seconds = _order_idempotency_cache_ttl_seconds()
+    try:
+        if client.exists(IDEMPOTENCY_INDEX_SINCE_KEY):
+            return
+        # One replica rebuilds; the others keep checking Postgres until it is done.
+        if not client.set("idem:index:backfill", REPLICA_ID, nx=True, ex=300):
+            return
+        started = time.time()
+        with _db_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    f"""
+                    SELECT oi.student_id, oi.idempotency_key, EXTRACT(EPOCH FROM oi.created_at), {IDEMPOTENT_ORDER_COLUMNS}
+                    FROM order_idempotency oi
+                    JOIN orders o ON o.id = oi.order_id
+                    WHERE oi.created_at > NOW() - make_interval(secs => %s)
+                    """,
+                    (ttl_seconds,),
+                )
+                rows = cur.fetchall()
+        pipe = client.pipeline(transaction=False)
+        for student_id, idempotency_key, created_epoch, *order_row in rows:
+            remaining = int(ttl_seconds - (started - float(created_epoch)))
+            if remaining <= 0:
+                continue
+            record = _idempotency_record(_idempotent_replay(order_row))
+            pipe.set(_idempotency_record_key(student_id, idempotency_key), record, ex=remaining, nx=True)
+        # Dated one TTL back: every live key is in Redis now, so misses are trusted at once.
+        pipe.set(IDEMPOTENCY_INDEX_SINCE_KEY, str(started - ttl_seconds), nx=True)
+        pipe.delete("idem:index:backfill")
+        pipe.execute()
+        metrics["idempotency_index_backfills_total"] += 1
+    except redis.RedisError as exc:
+        _redis_failed(exc)
+
+
+def _idempotency_index_loop() -> None:
+    # Re-checks the marker so a Redis restart without persistence gets rebuilt.
+    while outbox_worker_state["running"]:
+        try:
+            _backfill_idempotency_index()
+        except Exception:
+            pass
+        time.sleep(60.0)
+
+
+async def _update_admission_signals() -> None:
+    depth_limit = _order_shed_kitchen_queue_depth()
+    # pika is blocking; the passive declare runs on a worker thread.
+    admission_state["kitchen_depth"] = await run_in_threadpool(_queue_depth, "kitchen.jobs") if depth_limit else -1
+    cutoff = time.monotonic() - _order_admission_p95_window_seconds()
+    while admission_latency_samples and admission_latency_samples[0][0] < cutoff:
+        admission_latency_samples.popleft()
+    p95_ms = _percentile([ms for _, ms in admission_latency_samples], 95)
+    admission_state["p95_ms"] = p95_ms
+    max_in_flight = _order_max_in_flight()
+    # Halve concurrency while recent orders miss the latency target. Samples age
+    # out of the window, so the limit recovers even if no orders complete.
+    limit = max(max_in_flight // 2, 1) if p95_ms > _order_admission_p95_target_ms() else max_in_flight
+    async with admission_cond:
+        raised = limit > admission_state["limit"]
+        admission_state["limit"] = limit
+        if raised:
+            admission_cond.notify_all()
+
+
+async def _admission_signal_loop() -> None:
+    while outbox_worker_state["running"]:
+        try:
+            await _update_admission_signals()
+        except Exception:
+            pass
+        await asyncio.sleep(1.0)
+
+
+def _shed_order(status_code: int, reason: str, detail: str, retry_after: int) -> HTTPException:
+    metrics[f"orders_shed_{reason}_total"] += 1
+    metrics["orders_failed_total"] += 1
+    return HTTPException(status_code=status_code, detail=detail, headers={"Retry-After": str(retry_after)})
+
+
+async def _admit_order() -> None:
+    depth_limit = _order_shed_kitchen_queue_depth()
+    if depth_limit and admission_state["kitchen_depth"] >= depth_limit:
+        raise _shed_order(503, "kitchen_backlog", "Kitchen is at capacity, retry shortly", 5)
+    async with admission_cond:
+        if admission_state["limit"] <= 0:
+            admission_state["limit"] = _order_max_in_flight()
+        if admission_state["in_flight"] >= admission_state["limit"]:
+            if admission_state["waiting"] >= _order_admission_queue_size():
+                raise _shed_order(429, "queue_full", "Too many orders in progress, retry shortly", 1)
+            metrics["orders_queued_total"] += 1
+            admission_state["waiting"] += 1
+            try:
+                await asyncio.wait_for(
+                    admission_cond.wait_for(lambda: admission_state["in_flight"] < admission_state["limit"]),
+                    timeout=_order_admission_wait_seconds(),
+                )
+                admitted = True
+            except asyncio.TimeoutError:
+                admitted = False
+            finally:
+                admission_state["waiting"] -= 1
+            if not admitted:
+                raise _shed_order(503, "wait_timeout", "Order service is busy, retry shortly", 1)
+        admission_state["in_flight"] += 1
+        metrics["orders_admitted_total"] += 1
+
+
+async def _release_order() -> None:
+    async with admission_cond:
+        admission_state["in_flight"] -= 1
+        # Wake every waiter: a single notify is lost if the waiter it picks has
+        # just timed out or been cancelled. Each re-checks the limit under the lock.
+        admission_cond.notify_all()
 
 
 @app.post("/api/orders")
-def create_order(
+async def create_order(
     payload: CreateOrderRequest,
     authorization: str | None = Header(default=None),
     access_token: str | None = Cookie(default=None, alias=ACCESS_COOKIE_NAME),
     idempotency_key: str | None = Header(default=None, alias="Idempotency-Key"),
+    response: Response = None,
+):
+    result = await _create_order(payload, authorization, access_token, idempotency_key)
+    if isinstance(result, dict) and result.get("payment_status") == "PENDING" and not result.get("idempotent_replay"):
+        response.status_code = 202
+    return result
+
+
+async def _admit_and_charge(student_id: str, role: str) -> None:
+    # Reject fast under overload instead of letting every request miss the ACK target.
+    await _admit_order()
+    try:
+        await _enforce_order_rate_limit(student_id, role)
+    except HTTPException:
+        await _release_order()
+        raise
+
+
+async def _create_order(
+    payload: CreateOrderRequest,
+    authorization: str | None,
+    access_token: str | None,
+    idempotency_key: str | None,
 ):
     start = time.perf_counter()
-    _should_fail()
+    await _should_fail_async()
 
     if not payload.items:
         metrics["orders_failed_total"] += 1
         return JSONResponse(status_code=400, content={"message": "Order items are required", "error": "Bad Request"})
 
-    auth = _extract_auth(authorization, access_token)
+    # Auth and idempotency replays are resolved before admission so rejected
+    # requests and retries never hold an admission slot.
+    auth = await _extract_auth_async(authorization, access_token)
     if not auth:
         metrics["orders_failed_total"] += 1
         raise HTTPException(status_code=401, detail="Missing or invalid token")
     student_id = auth["student_id"]
+    role = str(auth.get("role") or "student")
 
     key = (idempotency_key or "").strip()
-    if key:
-        existing = _find_idempotent_order(student_id, key)
-        if existing:
-            return existing
+    if not key:
+        await _admit_and_charge(student_id, role)
+        try:
+            return await _place_order(payload, student_id, key, start)
+        finally:
+            await _release_order()
+
+    # Replay or claim the key before any downstream work so a double tap waits
+    # for this request's result instead of reserving stock and charging again.
+    claim_value, replay = await _claim_idempotency(student_id, key)
+    if replay is not None:
+        return replay
+    # Only the request that goes on to place the order spends a token; retries
+    # of a placed order are replayed above without touching the limit.
+    try:
+        await _admit_and_charge(student_id, role)
+    except HTTPException:
+        if claim_value is not None:
+            # Free the key without an outcome so a waiting retry takes over.
+            await _release_idempotency_claim(student_id, key, claim_value, None)
+        raise
+    try:
+        return await _place_claimed_order(payload, student_id, key, claim_value, start)
+    finally:
+        await _release_order()
+
+
+async def _place_claimed_order(
+    payload: CreateOrderRequest, student_id: str, key: str, claim_value: str | None, start: float
+):
+    if claim_value is None:
+        result = await _place_order(payload, student_id, key, start)
+        if isinstance(result, dict):
+            idempotency_index_state["stale"] = True
+        return result
+    failure: HTTPException | None = None
+    result = None
+    try:
+        result = await _place_order(payload, student_id, key, start)
+        return result
+    except HTTPException as exc:
+        failure = exc
+        raise
+    finally:
+        await _release_idempotency_claim(
+            student_id, key, claim_value, failure, result if isinstance(result, dict) else None
+        )
+
+
+def _record_order_latency(start: float) -> None:
+    metrics["orders_total"] += 1
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    metrics["latency_total_ms"] += elapsed_ms
+    metrics["latency_count"] += 1
+    latency_samples_ms.append(elapsed_ms)
+    if len(latency_samples_ms) > 500:
+        del latency_samples_ms[0]
+    admission_latency_samples.append((time.monotonic(), elapsed_ms))
+
 
+async def _place_order(payload: CreateOrderRequest, student_id: str, key: str, start: float):
     ids = list({line.id for line in payload.items})
     order_id = str(uuid.uuid4())
-    status_value = "QUEUED"
+    pipeline_async = _order_pipeline_async()
+    status_value = "PENDING_PAYMENT" if pipeline_async else "QUEUED"
     eta_minutes = 12
     reservations_done = False
+    duplicate_key = False
     total_amount = 0
     pickup_counter = 1
     payment_method = (payload.payment_method or "CASH").strip().upper()
 
     try:
-        with _db_conn() as conn:
-            with conn.cursor() as cur:
-                placeholders = ",".join(["%s"] * len(ids))
-                cur.execute(
-                    f"SELECT id, name, price, available FROM menu_items WHERE id IN ({placeholders})",
-                    tuple(ids),
-                )
-                menu_rows = cur.fetchall()
-
-                menu_map: dict[str, dict[str, Any]] = {
-                    row[0]: {"id": row[0], "name": row[1], "price": row[2], "available": row[3]}
-                    for row in menu_rows
-                }
-
-                for line in payload.items:
-                    item = menu_map.get(line.id)
-                    if not item:
-                        metrics["orders_failed_total"] += 1
-                        return JSONResponse(status_code=400, content={"message": f"Item {line.id} not found", "error": "Bad Request"})
-
-                total = sum(menu_map[line.id]["price"] * line.qty for line in payload.items)
-                total_amount = total
-
-                # Cache-first stock pre-check before reservation call.
-                for line in payload.items:
-                    if not _is_stock_available_cached(line.id):
-                        metrics["orders_failed_total"] += 1
-                        raise HTTPException(status_code=409, detail=f"Item {line.id} unavailable")
-
-                # Reserve stock before order insert.
-                for line in payload.items:
-                    _reserve_item(order_id=order_id, item_id=line.id, qty=line.qty)
-                reservations_done = True
-
-                cur.execute(
+        # Pricing and the cache-first stock pre-check are independent: run them together.
+        menu_map, unavailable = await asyncio.gather(
+            _menu_price_map(ids),
+            _unavailable_items_cached([line.id for line in payload.items]),
+            return_exceptions=True,
+        )
+        if isinstance(menu_map, BaseException):
+            raise menu_map
+        for line in payload.items:
+            item = menu_map.get(line.id)
+            if not item:
+                metrics["orders_failed_total"] += 1
+                return JSONResponse(status_code=400, content={"message": f"Item {line.id} not found", "error": "Bad Request"})
+
+        total = sum(menu_map[line.id]["price"] * line.qty for line in payload.items)
+        total_amount = total
+
+        if isinstance(unavailable, BaseException):
+            raise unavailable
+        if unavailable:
+            metrics["orders_failed_total"] += 1
+            raise HTTPException(status_code=409, detail=f"Item {unavailable[0]} unavailable")
+
+        # Reserve every line atomically before order insert; no pooled connection is held meanwhile.
+        await _reserve_items(order_id, payload.items)
+        reservations_done = True
+
+        async with _async_db_conn() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(
                     """
                     INSERT INTO orders(id, student_id, status, eta_minutes, total_amount)
                     VALUES (%s, %s, %s, %s, %s)
@@ -2861,51 +5042,100 @@ def create_order(
                     """,
                     (order_id, student_id, status_value, eta_minutes, total),
                 )
-                token_row = cur.fetchone()
+                token_row = await cur.fetchone()
                 token_no = int(token_row[0]) if token_row else None
                 pickup_counter = int(token_row[1]) if token_row else 1
 
-                for line in payload.items:
-                    unit_price = menu_map[line.id]["price"]
-                    cur.execute(
-                        """
-                        INSERT INTO order_items(order_id, item_id, qty, unit_price)
-                        VALUES (%s, %s, %s, %s)
-                        """,
-                        (order_id, line.id, line.qty, unit_price),
-                    )
+                await cur.execute(
+                    """
+                    INSERT INTO order_items(order_id, item_id, qty, unit_price)
+                    SELECT %s, item_id, qty, unit_price
+                    FROM unnest(%s::text[], %s::int[], %s::int[]) WITH ORDINALITY AS lines(item_id, qty, unit_price, pos)
+                    ORDER BY pos
+                    """,
+                    (
+                        order_id,
+                        [line.id for line in payload.items],
+                        [line.qty for line in payload.items],
+                        [menu_map[line.id]["price"] for line in payload.items],
+                    ),
+                )
 
-                conn.commit()
+                # The key is recorded with the order, before any payment, in both modes.
+                duplicate_key = bool(key) and not await _store_idempotency_async(cur, student_id, key, order_id)
+                if duplicate_key:
+                    # Another request placed this key while our Redis miss looked
+                    # authoritative (e.g. a replica's stale index marker).
+                    await conn.rollback()
+                else:
+                    if pipeline_async:
+                        # Order, payment job and idempotency record commit together.
+                        await _enqueue_outbox_event_async(
+                            cur=cur,
+                            event_type="order.payment_requested",
+                            queue_name=ORDER_PAYMENT_STAGE,
+                            payload={
+                                "order_id": order_id,
+                                "student_id": student_id,
+                                "amount": total_amount,
+                                "method": payment_method,
+                                "token_no": token_no,
+                                "pickup_counter": pickup_counter,
+                                "eta_minutes": eta_minutes,
+                            },
+                        )
+                    await conn.commit()
     except Exception:
         if reservations_done:
-            _release_order_reservations(order_id)
+            await _release_order_reservations_async(order_id)
         raise
 
+    if duplicate_key:
+        metrics["idempotency_duplicates_blocked_total"] += 1
+        await _release_order_reservations_async(order_id)
+        replay = await _find_idempotent_order(student_id, key)
+        if replay is None:
+            raise HTTPException(status_code=409, detail="Order with this Idempotency-Key is in progress", headers={"Retry-After": "1"})
+        return replay
+
+    if pipeline_async:
+        _record_order_latency(start)
+        return {
+            "order_id": order_id,
+            "token_no": token_no,
+            "pickup_counter": pickup_counter,
+            "ready_at": None,
+            "ready_until": None,
+            "status": status_value,
+            "eta_minutes": eta_minutes,
+            "payment_status": "PENDING",
+        }
+
     try:
-        _process_payment(
+        await _process_payment_async(
             order_id=order_id,
             student_id=student_id,
             amount=total_amount,
             method=payment_method,
         )
     except Exception:
-        _mark_order_cancelled(order_id)
+        await _mark_order_cancelled_async(order_id, free_idempotency_key=bool(key))
         if reservations_done:
-            _release_order_reservations(order_id)
+            await _release_order_reservations_async(order_id)
         raise
 
     try:
         if reservations_done:
-            _confirm_order_reservations(order_id)
+            await _confirm_order_reservations_async(order_id)
     except Exception:
-        _mark_order_cancelled(order_id)
+        await _mark_order_cancelled_async(order_id, free_idempotency_key=bool(key))
         if reservations_done:
-            _release_order_reservations(order_id)
+            await _release_order_reservations_async(order_id)
         raise
 
-    with _db_conn() as conn:
-        with conn.cursor() as cur:
-            _enqueue_outbox_event(
+    async with _async_db_conn() as conn:
+        async with conn.cursor() as cur:
+            await _enqueue_outbox_event_async(
                 cur=cur,
                 event_type="order.created",
                 queue_name="kitchen.jobs",
@@ -2918,18 +5148,9 @@ def create_order(
                     "eta_minutes": eta_minutes,
                 },
             )
-            conn.commit()
+            await conn.commit()
 
-    if key:
-        _store_idempotency(student_id, key, order_id)
-
-    metrics["orders_total"] += 1
-    elapsed_ms = (time.perf_counter() - start) * 1000
-    metrics["latency_total_ms"] += elapsed_ms
-    metrics["latency_count"] += 1
-    latency_samples_ms.append(elapsed_ms)
-    if len(latency_samples_ms) > 500:
-        del latency_samples_ms[0]
+    _record_order_latency(start)
 
     return {
         "order_id": order_id,
@@ -2944,27 +5165,27 @@ def create_order(
 
 
 @app.get("/api/orders/{order_id}")
-def get_order(
+async def get_order(
     order_id: str,
     authorization: str | None = Header(default=None),
     access_token: str | None = Cookie(default=None, alias=ACCESS_COOKIE_NAME),
 ):
-    _should_fail()
+    await _should_fail_async()
     if order_id == "me":
-        return get_my_orders(authorization=authorization, access_token=access_token)
+        return await get_my_orders(authorization=authorization, access_token=access_token)
 
-    auth = _extract_auth(authorization, access_token)
+    auth = await _extract_auth_async(authorization, access_token)
     if not auth:
         raise HTTPException(status_code=401, detail="Missing or invalid token")
     student_id = auth["student_id"]
 
-    with _db_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute(
+    async with _async_db_conn() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
                 "SELECT id, student_id, token_no, pickup_counter, ready_at, ready_until, pickup_extend_count, status, eta_minutes, total_amount, created_at FROM orders WHERE id = %s",
                 (order_id,),
             )
-            row = cur.fetchone()
+            row = await cur.fetchone()
             if not row:
                 raise HTTPException(status_code=404, detail="Order not found")
             if row[1] != student_id:
@@ -2989,6 +5210,7 @@ def get_order(
 
 
 @app.get("/api/orders/{order_id}/slip", response_class=HTMLResponse)
+@_bulkhead("slips")
 def get_order_slip(
     order_id: str,
     auto_print: bool = Query(default=True),
@@ -3080,6 +5302,7 @@ def get_order_slip(
 
 
 @app.post("/api/orders/{order_id}/slip/printed")
+@_bulkhead("slips")
 def mark_order_slip_printed(
     order_id: str,
     authorization: str | None = Header(default=None),
@@ -3107,6 +5330,7 @@ def mark_order_slip_printed(
 
 
 @app.delete("/api/orders/{order_id}")
+@_bulkhead("orders")
 def delete_order(
     order_id: str,
     authorization: str | None = Header(default=None),
@@ -3137,19 +5361,19 @@ def delete_order(
 
 
 @app.get("/api/orders/me")
-def get_my_orders(
+async def get_my_orders(
     authorization: str | None = Header(default=None),
     access_token: str | None = Cookie(default=None, alias=ACCESS_COOKIE_NAME),
 ):
-    _should_fail()
-    auth = _extract_auth(authorization, access_token)
+    await _should_fail_async()
+    auth = await _extract_auth_async(authorization, access_token)
     if not auth:
         raise HTTPException(status_code=401, detail="Missing or invalid token")
     student_id = auth["student_id"]
 
-    with _db_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute(
+    async with _async_db_conn() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
                 """
                 SELECT id, token_no, pickup_counter, ready_at, ready_until, pickup_extend_count, status, eta_minutes, total_amount, created_at
                 FROM orders
@@ -3158,7 +5382,7 @@ def get_my_orders(
                 """,
                 (student_id,),
             )
-            rows = cur.fetchall()
+            rows = await cur.fetchall()
             now = datetime.now(timezone.utc)
 
     return {
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The images copy services/shared next to main.py; mirror that for the tests.
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "shared"))
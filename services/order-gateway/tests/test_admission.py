@@ -0,0 +1,378 @@
+import asyncio
+import importlib.util
+import json
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+
+MODULE_PATH = Path(__file__).resolve().parents[1] / "main.py"
+SPEC = importlib.util.spec_from_file_location("order_gateway_main", MODULE_PATH)
+assert SPEC and SPEC.loader
+gateway = importlib.util.module_from_spec(SPEC)
+SPEC.loader.exec_module(gateway)
+
+
+@pytest.fixture
+def admission(monkeypatch: pytest.MonkeyPatch) -> dict:
+    state = {"in_flight": 0, "waiting": 0, "limit": 2, "kitchen_depth": -1, "p95_ms": 0.0}
+    monkeypatch.setattr(gateway, "admission_state", state)
+    monkeypatch.setattr(gateway, "admission_cond", asyncio.Condition())
+    monkeypatch.setenv("ORDER_ADMISSION_QUEUE_SIZE", "0")
+    monkeypatch.setenv("ORDER_ADMISSION_WAIT_SECONDS", "0.05")
+    return state
+
+
+def test_admission_sheds_when_full_with_retry_after(admission: dict) -> None:
+    asyncio.run(gateway._admit_order())
+    asyncio.run(gateway._admit_order())
+
+    with pytest.raises(gateway.HTTPException) as exc:
+        asyncio.run(gateway._admit_order())
+    assert exc.value.status_code == 429
+    assert exc.value.headers == {"Retry-After": "1"}
+
+    asyncio.run(gateway._release_order())
+    asyncio.run(gateway._admit_order())
+    assert admission["in_flight"] == 2
+
+
+def test_admission_waits_briefly_then_times_out(admission: dict, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("ORDER_ADMISSION_QUEUE_SIZE", "1")
+    admission["in_flight"] = 2
+
+    with pytest.raises(gateway.HTTPException) as exc:
+        asyncio.run(gateway._admit_order())
+    assert exc.value.status_code == 503
+    assert admission["waiting"] == 0
+
+
+def test_release_wakes_the_next_waiter_when_the_woken_one_is_cancelled(
+    admission: dict, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setenv("ORDER_ADMISSION_QUEUE_SIZE", "2")
+    monkeypatch.setenv("ORDER_ADMISSION_WAIT_SECONDS", "0.5")
+    admission["in_flight"] = 2
+
+    async def scenario() -> None:
+        first = asyncio.create_task(gateway._admit_order())
+        second = asyncio.create_task(gateway._admit_order())
+        while admission["waiting"] < 2:
+            await asyncio.sleep(0)
+        # The first waiter gives up (timeout or client disconnect) just as the
+        # release picks it, so it never takes the slot.
+        release = asyncio.create_task(gateway._release_order())
+        first.cancel()
+        await release
+        await second
+        with pytest.raises(asyncio.CancelledError):
+            await first
+
+    asyncio.run(scenario())
+    assert admission["in_flight"] == 2
+    assert admission["waiting"] == 0
+
+
+class FakeDepthChannel:
+    def __init__(self, depths: dict[str, int]) -> None:
+        self.depths = depths
+        self.is_open = True
+
+    def queue_declare(self, queue: str, durable: bool, passive: bool):
+        if queue not in self.depths:
+            # The broker closes the channel on a failed passive declare.
+            self.is_open = False
+            raise RuntimeError("NOT_FOUND")
+        return SimpleNamespace(method=SimpleNamespace(message_count=self.depths[queue]))
+
+
+def test_queue_depth_reuses_one_channel_and_reconnects_after_a_failure(monkeypatch: pytest.MonkeyPatch) -> None:
+    opened: list[FakeDepthChannel] = []
+
+    class FakeConnection:
+        def __init__(self, _params) -> None:
+            opened.append(FakeDepthChannel({"kitchen.jobs": 7}))
+
+        def channel(self) -> FakeDepthChannel:
+            return opened[-1]
+
+        def close(self) -> None:
+            pass
+
+    monkeypatch.setattr(gateway.pika, "BlockingConnection", FakeConnection)
+    monkeypatch.setattr(gateway, "queue_depth_state", {"connection": None, "channel": None})
+
+    assert [gateway._queue_depth("kitchen.jobs") for _ in range(3)] == [7, 7, 7]
+    assert len(opened) == 1
+
+    assert gateway._queue_depth("missing") == -1
+    assert gateway._queue_depth("kitchen.jobs") == 7
+    # The failed probe reconnected once, then the fresh channel was reused.
+    assert len(opened) == 3
+
+
+def test_admission_sheds_on_kitchen_backlog_and_halves_limit_on_slow_p95(
+    admission: dict, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setenv("ORDER_MAX_IN_FLIGHT", "10")
+    monkeypatch.setattr(gateway, "_queue_depth", lambda _queue: 900)
+    now = gateway.time.monotonic()
+    monkeypatch.setattr(gateway, "admission_latency_samples", gateway.deque([(now, 2500.0)] * 20))
+
+    asyncio.run(gateway._update_admission_signals())
+    assert admission["limit"] == 5
+
+    with pytest.raises(gateway.HTTPException) as exc:
+        asyncio.run(gateway._admit_order())
+    assert exc.value.status_code == 503
+    assert exc.value.headers == {"Retry-After": "5"}
+
+
+def test_admission_p95_only_counts_recent_orders(admission: dict, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("ORDER_MAX_IN_FLIGHT", "10")
+    monkeypatch.setenv("ORDER_SHED_KITCHEN_QUEUE_DEPTH", "0")
+    monkeypatch.setenv("ORDER_ADMISSION_P95_WINDOW_SECONDS", "60")
+    now = gateway.time.monotonic()
+    samples = gateway.deque([(now - 120, 2500.0)] * 20 + [(now - 5, 200.0)] * 3)
+    monkeypatch.setattr(gateway, "admission_latency_samples", samples)
+
+    asyncio.run(gateway._update_admission_signals())
+    assert admission["p95_ms"] == 200.0
+    assert admission["limit"] == 10
+    assert len(samples) == 3
+
+    # With no orders at all the slow burst still ages out and the limit recovers.
+    samples.clear()
+    samples.extend([(now - 120, 2500.0)] * 20)
+    admission["limit"] = 5
+    asyncio.run(gateway._update_admission_signals())
+    assert admission["limit"] == 10
+
+
+def test_rate_limit_falls_back_to_local_bucket_without_redis(monkeypatch: pytest.MonkeyPatch) -> None:
+    clock = [100.0]
+    monkeypatch.setattr(gateway.time, "monotonic", lambda: clock[0])
+    monkeypatch.setattr(gateway, "async_redis_client", None)
+    monkeypatch.setattr(gateway, "redis_state", {"retry_at": float("inf"), "backoff_seconds": 0.0})
+    monkeypatch.setattr(gateway, "rate_limit_buckets", gateway.OrderedDict())
+    monkeypatch.setenv("ORDER_RATE_LIMIT_BURST", "2")
+    monkeypatch.setenv("ORDER_RATE_LIMIT_PER_MINUTE", "60")
+    monkeypatch.setenv("ORDER_RATE_LIMIT_PER_MINUTE_ADMIN", "600")
+
+    def take(student_id: str) -> None:
+        asyncio.run(gateway._enforce_order_rate_limit(student_id, "student"))
+
+    take("2100001")
+    take("2100001")
+    with pytest.raises(gateway.HTTPException) as exc:
+        take("2100001")
+    assert exc.value.status_code == 429
+    assert exc.value.headers == {"Retry-After": "1"}
+
+    take("2100002")
+    clock[0] += 1.0
+    take("2100001")
+    assert gateway._order_rate_limit("admin") == (2.0, 10.0)
+
+
+class FakeClaimRedis:
+    """Python stand-ins for the idempotency scripts; the index marker is always trusted."""
+
+    def __init__(self) -> None:
+        self.store: dict[str, str] = {}
+
+    async def get(self, key: str) -> str | None:
+        return self.store.get(key)
+
+    async def set(self, key: str, value: str, xx: bool = False, keepttl: bool = False) -> None:
+        if not xx or key in self.store:
+            self.store[key] = value
+
+    async def delete(self, *keys: str) -> None:
+        for key in keys:
+            self.store.pop(key, None)
+
+    def register_script(self, source: str):
+        async def begin(keys: list[str], args: list) -> list[str]:
+            record_key, _since_key, claim_key = keys
+            if record_key in self.store:
+                return ["hit", self.store[record_key]]
+            if claim_key in self.store:
+                return ["busy", ""]
+            self.store[claim_key] = args[0]
+            return ["claimed", "1"]
+
+        async def release(keys: list[str], args: list) -> int:
+            claim_key, record_key = keys
+            if args[3]:
+                self.store[record_key] = args[3]
+            if self.store.get(claim_key) != args[0]:
+                return 0
+            if args[1]:
+                self.store[claim_key] = args[1]
+            else:
+                del self.store[claim_key]
+            return 1
+
+        return begin if source == gateway.GATEWAY_REDIS_SCRIPTS["idempotency_begin"] else release
+
+
+def test_duplicate_tap_waits_for_leader_and_replays_its_result(monkeypatch: pytest.MonkeyPatch) -> None:
+    fake_redis = FakeClaimRedis()
+    placed: list[str] = []
+
+    async def fake_place_order(_payload, _student_id: str, key: str, _start: float) -> dict:
+        placed.append(key)
+        await asyncio.sleep(0.2)
+        return {"order_id": "o-1", "status": "QUEUED", "payment_status": "COMPLETED"}
+
+    async def fake_auth(*_args) -> dict:
+        return {"student_id": "2100001", "role": "student"}
+
+    charged: list[str] = []
+
+    async def count_rate_limit(student_id: str, _role: str) -> None:
+        charged.append(student_id)
+
+    async def no_db_lookup(*_args) -> None:
+        raise AssertionError("new and cached keys must not be looked up by key in Postgres")
+
+    monkeypatch.setattr(gateway, "async_redis_client", fake_redis)
+    monkeypatch.setattr(gateway, "redis_scripts", {"client": None, "scripts": {}})
+    monkeypatch.setattr(gateway, "_extract_auth_async", fake_auth)
+    monkeypatch.setattr(gateway, "_enforce_order_rate_limit", count_rate_limit)
+    monkeypatch.setattr(gateway, "_find_idempotent_order", no_db_lookup)
+    monkeypatch.setattr(gateway, "_idempotent_order_by_id", no_db_lookup)
+    monkeypatch.setattr(gateway, "_place_order", fake_place_order)
+    payload = gateway.CreateOrderRequest(items=[{"id": "1", "qty": 1}])
+
+    async def double_tap() -> tuple[dict, dict, dict]:
+        leader = asyncio.create_task(gateway._create_order(payload, None, None, "tap"))
+        await asyncio.sleep(0.05)
+        follower = await gateway._create_order(payload, None, None, "tap")
+        return await leader, follower, await gateway._create_order(payload, None, None, "tap")
+
+    result, follower, later = asyncio.run(double_tap())
+
+    assert placed == ["tap"]
+    # Follower and later retry are replays: only the leader spent a token.
+    assert charged == ["2100001"]
+    assert result == {"order_id": "o-1", "status": "QUEUED", "payment_status": "COMPLETED"}
+    # A settled order is replayed from the cached response, without Postgres.
+    assert follower == later == {**result, "idempotent_replay": True}
+    assert json.loads(fake_redis.store[gateway._idempotency_record_key("2100001", "tap")]) == follower
+
+
+def test_replay_rereads_only_orders_awaiting_payment(monkeypatch: pytest.MonkeyPatch) -> None:
+    fake_redis = FakeClaimRedis()
+    record_key = gateway._idempotency_record_key("2100001", "tap")
+    leader = {"order_id": "o-1", "status": "PENDING_PAYMENT", "payment_status": "PENDING"}
+    fake_redis.store[record_key] = gateway._idempotency_record(leader)
+    orders = {"o-1": {"order_id": "o-1", "status": "PENDING_PAYMENT", "idempotent_replay": True}}
+    reads: list[str] = []
+
+    async def order_by_id(order_id: str) -> dict | None:
+        reads.append(order_id)
+        return orders.get(order_id)
+
+    monkeypatch.setattr(gateway, "async_redis_client", fake_redis)
+    monkeypatch.setattr(gateway, "redis_scripts", {"client": None, "scripts": {}})
+    monkeypatch.setattr(gateway, "_idempotent_order_by_id", order_by_id)
+
+    assert asyncio.run(gateway._claim_idempotency("2100001", "tap"))[1]["status"] == "PENDING_PAYMENT"
+    orders["o-1"] = {**orders["o-1"], "status": "CANCELLED"}
+    assert asyncio.run(gateway._claim_idempotency("2100001", "tap"))[1]["status"] == "CANCELLED"
+    assert reads == ["o-1", "o-1"]
+
+    # The settled status was cached, so later replays skip Postgres.
+    orders["o-1"] = {**orders["o-1"], "status": "QUEUED"}
+    assert asyncio.run(gateway._claim_idempotency("2100001", "tap"))[1]["status"] == "CANCELLED"
+    assert reads == ["o-1", "o-1"]
+
+    # Records holding only the order id are reloaded; a deleted order frees the key.
+    fake_redis.store[record_key] = "o-1"
+    del orders["o-1"]
+    claim_value, replay = asyncio.run(gateway._claim_idempotency("2100001", "tap"))
+    assert replay is None and claim_value
+
+
+def test_rate_limited_leader_frees_its_claim(monkeypatch: pytest.MonkeyPatch) -> None:
+    fake_redis = FakeClaimRedis()
+
+    async def fake_auth(*_args) -> dict:
+        return {"student_id": "2100001", "role": "student"}
+
+    async def rate_limited(*_args) -> None:
+        raise gateway.HTTPException(status_code=429, detail="Too many orders, slow down")
+
+    async def never_place(*_args) -> dict:
+        raise AssertionError("a rate-limited request must not place the order")
+
+    monkeypatch.setattr(gateway, "async_redis_client", fake_redis)
+    monkeypatch.setattr(gateway, "redis_scripts", {"client": None, "scripts": {}})
+    monkeypatch.setattr(gateway, "_extract_auth_async", fake_auth)
+    monkeypatch.setattr(gateway, "_enforce_order_rate_limit", rate_limited)
+    monkeypatch.setattr(gateway, "_place_order", never_place)
+    payload = gateway.CreateOrderRequest(items=[{"id": "1", "qty": 1}])
+
+    with pytest.raises(gateway.HTTPException) as exc:
+        asyncio.run(gateway._create_order(payload, None, None, "tap"))
+    assert exc.value.status_code == 429
+    # No claim and no cached rejection: the retry is free to lead.
+    assert fake_redis.store == {}
+
+
+def test_zero_rate_disables_a_roles_limit(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("ORDER_RATE_LIMIT_PER_MINUTE", "6")
+    monkeypatch.setenv("ORDER_RATE_LIMIT_PER_MINUTE_STAFF", "0")
+    monkeypatch.setattr(gateway, "_async_redis", None)
+
+    assert gateway._order_rate_limit("staff")[1] == 0.0
+    assert gateway._order_rate_limit("student")[1] == 0.1
+    for _ in range(10):
+        asyncio.run(gateway._enforce_order_rate_limit("staff-1", "staff"))
+
+
+def test_follower_replays_leader_rejection(monkeypatch: pytest.MonkeyPatch) -> None:
+    fake_redis = FakeClaimRedis()
+    claim_key = gateway._idempotency_claim_key("2100001", "tap")
+    fake_redis.store[claim_key] = '{"status_code": 409, "detail": "Item 1 unavailable"}'
+    monkeypatch.setattr(gateway, "async_redis_client", fake_redis)
+    monkeypatch.setattr(gateway, "redis_scripts", {"client": None, "scripts": {}})
+
+    with pytest.raises(gateway.HTTPException) as exc:
+        asyncio.run(gateway._claim_idempotency("2100001", "tap"))
+    assert (exc.value.status_code, exc.value.detail) == (409, "Item 1 unavailable")
+
+
+def test_rejected_and_replayed_orders_do_not_take_an_admission_slot(
+    admission: dict, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    fake_redis = FakeClaimRedis()
+    fake_redis.store[gateway._idempotency_record_key("2100001", "tap")] = gateway._idempotency_record(
+        {"order_id": "o-1", "status": "QUEUED"}
+    )
+    admission["in_flight"] = 2
+
+    async def auth(authorization, _access_token) -> dict | None:
+        return {"student_id": "2100001", "role": "student"} if authorization else None
+
+    monkeypatch.setattr(gateway, "async_redis_client", fake_redis)
+    monkeypatch.setattr(gateway, "redis_scripts", {"client": None, "scripts": {}})
+    monkeypatch.setattr(gateway, "_extract_auth_async", auth)
+    payload = gateway.CreateOrderRequest(items=[{"id": "1", "qty": 1}])
+
+    with pytest.raises(gateway.HTTPException) as exc:
+        asyncio.run(gateway._create_order(payload, None, None, "tap"))
+    assert exc.value.status_code == 401
+
+    replay = asyncio.run(gateway._create_order(payload, "Bearer t", None, "tap"))
+    assert replay["idempotent_replay"] is True
+
+    # A new key does reach admission; the shed request frees its claim.
+    with pytest.raises(gateway.HTTPException) as exc:
+        asyncio.run(gateway._create_order(payload, "Bearer t", None, "other"))
+    assert exc.value.status_code == 429
+    assert gateway._idempotency_claim_key("2100001", "other") not in fake_redis.store
+    assert admission["in_flight"] == 2
@@ -70,3 +70,43 @@ def test_legacy_context_mapping_ramadan_labels() -> None:
     now_local = gateway.datetime(2026, 3, 1, 12, 0, tzinfo=gateway.ZoneInfo("Asia/Dhaka"))
     assert gateway._resolve_main_slot_from_legacy_context("iftar", now_local) == ("ramadan", "iftar")
     assert gateway._resolve_main_slot_from_legacy_context("saheri", now_local) == ("ramadan", "suhoor")
+
+
+class FakeIdentityClient:
+    def __init__(self, claims: dict) -> None:
+        self.claims = claims
+        self.calls = 0
+
+    def get(self, _url: str, headers: dict):
+        self.calls += 1
+        return gateway.httpx.Response(200, json=self.claims)
+
+
+@pytest.fixture
+def empty_claims_cache(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(gateway, "claims_cache", gateway.OrderedDict())
+    return gateway.claims_cache
+
+
+def test_verify_token_serves_repeat_calls_from_cache(monkeypatch: pytest.MonkeyPatch, empty_claims_cache) -> None:
+    client = FakeIdentityClient({"valid": True, "student_id": "240041246", "role": "student"})
+    monkeypatch.setattr(gateway, "_upstream_client", lambda _name: client)
+    assert gateway._verify_token("tok-1")["student_id"] == "240041246"
+    assert gateway._verify_token("tok-1")["student_id"] == "240041246"
+    assert client.calls == 1
+    assert "tok-1" not in next(iter(empty_claims_cache))
+
+
+def test_claims_cache_skips_expired_tokens(empty_claims_cache) -> None:
+    gateway._claims_cache_put("tok-old", {"student_id": "1", "exp": int(gateway.time.time()) - 5})
+    assert gateway._claims_cache_get("tok-old") is None
+
+
+def test_claims_cache_evicts_least_recently_used(monkeypatch: pytest.MonkeyPatch, empty_claims_cache) -> None:
+    monkeypatch.setenv("AUTH_CACHE_MAX_ENTRIES", "2")
+    gateway._claims_cache_put("a", {"student_id": "a"})
+    gateway._claims_cache_put("b", {"student_id": "b"})
+    assert gateway._claims_cache_get("a") is not None
+    gateway._claims_cache_put("c", {"student_id": "c"})
+    assert gateway._claims_cache_get("b") is None
+    assert gateway._claims_cache_get("a") is not None
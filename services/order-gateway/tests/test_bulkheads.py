@@ -0,0 +1,53 @@
+import asyncio
+import importlib.util
+from pathlib import Path
+
+import pytest
+
+
+MODULE_PATH = Path(__file__).resolve().parents[1] / "main.py"
+SPEC = importlib.util.spec_from_file_location("order_gateway_main", MODULE_PATH)
+assert SPEC and SPEC.loader
+gateway = importlib.util.module_from_spec(SPEC)
+SPEC.loader.exec_module(gateway)
+
+
+@pytest.fixture(autouse=True)
+def fresh_bulkheads(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(
+        gateway,
+        "bulkheads",
+        {name: {"limiter": None, "rejected_total": 0, "wait_samples_ms": []} for name in gateway.BULKHEAD_DEFAULTS},
+    )
+
+
+def test_bulkhead_rejects_when_its_pool_is_saturated(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("BULKHEAD_ADMIN_THREADS", "1")
+    monkeypatch.setenv("BULKHEAD_ADMIN_QUEUE_SIZE", "0")
+    release = gateway.threading.Event()
+
+    async def burst() -> tuple[str, str]:
+        slow = asyncio.create_task(gateway._run_in_bulkhead("admin", lambda: release.wait(2) and "admin"))
+        await asyncio.sleep(0.05)
+        with pytest.raises(gateway.HTTPException) as exc:
+            await gateway._run_in_bulkhead("admin", lambda: "admin")
+        assert exc.value.status_code == 503
+        menu = await gateway._run_in_bulkhead("menu", lambda: "menu")
+        release.set()
+        return await slow, menu
+
+    assert asyncio.run(burst()) == ("admin", "menu")
+    stats = gateway._bulkhead_metrics()
+    assert stats["admin"]["rejected_total"] == 1
+    assert stats["admin"]["threads"] == 1
+    assert stats["menu"]["rejected_total"] == 0
+
+
+def test_wallet_alias_runs_in_the_orders_pool(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(gateway, "_extract_auth", lambda *_args: None)
+
+    with pytest.raises(gateway.HTTPException) as exc:
+        asyncio.run(gateway.wallet_get(authorization=None, access_token=None))
+
+    assert exc.value.status_code == 401
+    assert len(gateway.bulkheads["orders"]["wait_samples_ms"]) == 1
@@ -0,0 +1,72 @@
+import importlib.util
+from pathlib import Path
+
+import pytest
+
+
+MODULE_PATH = Path(__file__).resolve().parents[1] / "main.py"
+SPEC = importlib.util.spec_from_file_location("order_gateway_main", MODULE_PATH)
+assert SPEC and SPEC.loader
+gateway = importlib.util.module_from_spec(SPEC)
+SPEC.loader.exec_module(gateway)
+
+
+class FakeConn:
+    def __init__(self) -> None:
+        self.entered = False
+
+    def __enter__(self):
+        self.entered = True
+        return self
+
+    def __exit__(self, *_exc):
+        return False
+
+
+class FakePool:
+    def __init__(self, fail: bool = False) -> None:
+        self.fail = fail
+        self.returned: list[FakeConn] = []
+
+    def getconn(self):
+        if self.fail:
+            raise gateway.PoolTimeout("no connection")
+        return FakeConn()
+
+    def putconn(self, conn: FakeConn) -> None:
+        self.returned.append(conn)
+
+    def get_stats(self) -> dict[str, int]:
+        return {"pool_size": 5, "pool_available": 2, "requests_waiting": 1}
+
+
+def test_db_conn_returns_connection_to_pool(monkeypatch: pytest.MonkeyPatch) -> None:
+    pool = FakePool()
+    monkeypatch.setattr(gateway, "_db_pool", lambda: pool)
+    with gateway._db_conn() as conn:
+        assert conn.entered
+    assert pool.returned == [conn]
+
+
+def test_db_conn_returns_connection_on_error(monkeypatch: pytest.MonkeyPatch) -> None:
+    pool = FakePool()
+    monkeypatch.setattr(gateway, "_db_pool", lambda: pool)
+    with pytest.raises(RuntimeError):
+        with gateway._db_conn():
+            raise RuntimeError("boom")
+    assert len(pool.returned) == 1
+
+
+def test_db_conn_maps_pool_timeout_to_503(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(gateway, "_db_pool", lambda: FakePool(fail=True))
+    with pytest.raises(gateway.HTTPException) as exc_info:
+        with gateway._db_conn():
+            pass
+    assert exc_info.value.status_code == 503
+
+
+def test_db_pool_metrics_report_in_use_and_waiting(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(gateway, "db_pool", FakePool())
+    stats = gateway._db_pool_metrics()
+    assert stats["db_pool_in_use"] == 3
+    assert stats["db_pool_waiting"] == 1
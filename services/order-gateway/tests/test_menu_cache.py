@@ -0,0 +1,293 @@
+import asyncio
+import importlib.util
+from pathlib import Path
+
+import pytest
+
+
+MODULE_PATH = Path(__file__).resolve().parents[1] / "main.py"
+SPEC = importlib.util.spec_from_file_location("order_gateway_main", MODULE_PATH)
+assert SPEC and SPEC.loader
+gateway = importlib.util.module_from_spec(SPEC)
+SPEC.loader.exec_module(gateway)
+
+
+@pytest.fixture
+def empty_menu_l1(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(gateway, "menu_l1_cache", {})
+    monkeypatch.setattr(gateway, "menu_cache_state", {"version": 0})
+    monkeypatch.setattr(gateway, "_refresh_menu_schedule", lambda: None)
+
+
+def test_menu_l1_serves_until_version_bump(empty_menu_l1) -> None:
+    key = ("regular", "lunch", None, True)
+    body, etag = gateway._encode_menu_payload({"items": [{"id": "1"}]})
+    gateway._menu_l1_put(key, body, etag, 0, 30)
+    assert gateway._menu_l1_get(key) == (b'{"items":[{"id":"1"}]}', etag, False)
+
+    gateway._process_cache_event({"event": "menu.updated"})
+    assert gateway._menu_l1_get(key) is None
+
+
+def test_menu_l1_drops_payload_built_before_bump(empty_menu_l1) -> None:
+    key = ("regular", "lunch", None, True)
+    version = gateway.menu_cache_state["version"]
+    gateway._bump_menu_cache_version()
+    gateway._menu_l1_put(key, b"{}", '"x"', version, 30)
+    assert gateway._menu_l1_get(key) is None
+
+
+def test_menu_misses_for_one_key_share_a_single_rebuild(empty_menu_l1, monkeypatch: pytest.MonkeyPatch) -> None:
+    calls: list[str] = []
+    release = gateway.threading.Event()
+
+    def slow_slot_items(main: str, slot: str) -> list[dict]:
+        calls.append(slot)
+        release.wait(2)
+        return [{"id": "1"}]
+
+    monkeypatch.setattr(gateway, "redis_client", None)
+    monkeypatch.setattr(gateway, "redis_state", {"retry_at": float("inf"), "backoff_seconds": 0.0})
+    monkeypatch.setattr(gateway, "_get_slot_items", slow_slot_items)
+    monkeypatch.setitem(gateway.metrics, "menu_coalesced_total", 0)
+    key = ("ramadan", "iftar", None, True)
+    now_local = gateway.datetime(2026, 3, 1, 18, 0)
+    results: list[tuple[bytes, str]] = []
+    workers = [
+        gateway.threading.Thread(target=lambda: results.append(gateway._menu_body(key, now_local)))
+        for _ in range(5)
+    ]
+    for worker in workers:
+        worker.start()
+    for _ in range(200):
+        if gateway.metrics["menu_coalesced_total"] == 4:
+            break
+        gateway.time.sleep(0.01)
+    release.set()
+    for worker in workers:
+        worker.join()
+
+    assert calls == ["iftar"]
+    assert len(set(results)) == 1
+
+
+def test_menu_update_bumps_redis_generation(empty_menu_l1, monkeypatch: pytest.MonkeyPatch) -> None:
+    class FakeRedis:
+        def __init__(self) -> None:
+            self.store: dict[str, str] = {}
+
+        def get(self, key: str) -> str | None:
+            return self.store.get(key)
+
+        def incr(self, key: str) -> int:
+            self.store[key] = str(int(self.store.get(key, "0")) + 1)
+            return int(self.store[key])
+
+        def delete(self, *keys: str) -> None:
+            for key in keys:
+                self.store.pop(key, None)
+
+    fake_redis = FakeRedis()
+    monkeypatch.setattr(gateway, "redis_client", fake_redis)
+    monkeypatch.setattr(gateway.rabbit_publisher, "publish_queue", lambda _queue, _payload: None)
+
+    before = gateway._menu_cache_key_for_slot("regular", "lunch", gateway._menu_generation())
+    gateway._publish_cache_invalidation("menu.updated")
+    gateway._publish_cache_invalidation("stock.changed", item_id="1")
+    after = gateway._menu_cache_key_for_slot("regular", "lunch", gateway._menu_generation())
+
+    assert fake_redis.store == {gateway.MENU_GENERATION_KEY: "1"}
+    assert before != after
+
+
+def test_cache_bus_records_lag_and_skips_own_events(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(gateway, "cache_event_lag_samples_ms", [])
+    monkeypatch.setattr(gateway.time, "time", lambda: 1000.25)
+
+    assert gateway._record_cache_event({"event": "stock.changed", "published_at": 1000.0, "origin": "other"})
+    assert not gateway._record_cache_event({"event": "menu.updated", "origin": gateway.REPLICA_ID})
+    assert gateway.cache_event_lag_samples_ms == [250.0]
+
+
+def test_menu_response_answers_matching_etag_with_304() -> None:
+    body, etag = gateway._encode_menu_payload({"items": []})
+
+    fresh = gateway._menu_response(body, etag, None)
+    assert fresh.status_code == 200
+    assert fresh.body == body
+    assert fresh.headers["etag"] == etag
+
+    assert gateway._menu_response(body, etag, f'"stale", W/{etag}').status_code == 304
+    assert gateway._menu_response(body, etag, '"stale"').status_code == 200
+
+
+def test_redis_reconnects_after_backoff(monkeypatch: pytest.MonkeyPatch) -> None:
+    class FakeRedis:
+        def ping(self) -> bool:
+            return True
+
+    attempts: list[int] = []
+
+    def fake_from_url(*_args, **_kwargs):
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise gateway.redis.ConnectionError("down")
+        return FakeRedis()
+
+    clock = [1000.0]
+    monkeypatch.setattr(gateway.redis.Redis, "from_url", fake_from_url)
+    monkeypatch.setattr(gateway.time, "monotonic", lambda: clock[0])
+    monkeypatch.setattr(gateway, "redis_client", None)
+    monkeypatch.setattr(gateway, "redis_state", {"retry_at": 0.0, "backoff_seconds": 0.0})
+
+    assert gateway._redis() is None
+    assert gateway._redis() is None
+    assert len(attempts) == 1
+
+    clock[0] += 2.0
+    assert isinstance(gateway._redis(), FakeRedis)
+    assert len(attempts) == 2
+
+
+def test_redis_backoff_restarts_after_a_successful_command(monkeypatch: pytest.MonkeyPatch) -> None:
+    class FlakyRedis:
+        def __init__(self) -> None:
+            self.replies: list[object] = []
+
+        def get(self, _key: str) -> str:
+            reply = self.replies.pop(0)
+            if isinstance(reply, Exception):
+                raise reply
+            return reply
+
+    client = FlakyRedis()
+    clock = [1000.0]
+    monkeypatch.setattr(gateway.time, "monotonic", lambda: clock[0])
+    monkeypatch.setattr(gateway, "redis_client", client)
+    monkeypatch.setattr(gateway, "redis_state", {"retry_at": 0.0, "backoff_seconds": 0.0})
+
+    client.replies = [gateway.redis.TimeoutError("slow"), "1", gateway.redis.ConnectionError("reset")]
+    assert gateway._cache_get_text("k") is None
+    assert gateway.redis_state["backoff_seconds"] == 1.0
+    clock[0] += 1.0
+    assert gateway._cache_get_text("k") == "1"
+    assert gateway._cache_get_text("k") is None
+    assert gateway.redis_state["backoff_seconds"] == 1.0
+    assert gateway.redis_state["retry_at"] == clock[0] + 1.0
+
+    # A command error does not take Redis out of service.
+    clock[0] += 1.0
+    client.replies = [gateway.redis.ResponseError("WRONGTYPE"), "2"]
+    assert gateway._cache_get_text("k") is None
+    assert gateway._cache_get_text("k") == "2"
+
+
+def test_failed_schedule_build_is_retried_after_a_delay(monkeypatch: pytest.MonkeyPatch) -> None:
+    builds: list[float] = []
+    clock = [1000.0]
+
+    def postgres_down() -> dict:
+        builds.append(clock[0])
+        raise gateway.psycopg.OperationalError("connection refused")
+
+    monkeypatch.setattr(gateway.time, "monotonic", lambda: clock[0])
+    monkeypatch.setattr(gateway, "_build_menu_schedule", postgres_down)
+    monkeypatch.setattr(gateway, "menu_schedule", {"index": None, "built_at": 0.0, "attempted_at": float("-inf")})
+
+    assert gateway._menu_schedule_index() is None
+    clock[0] += 1.0
+    assert gateway._menu_schedule_index() is None
+    assert builds == [1000.0]
+
+    clock[0] += gateway.MENU_SCHEDULE_RETRY_SECONDS
+    monkeypatch.setattr(gateway, "_build_menu_schedule", lambda: builds.append(clock[0]) or {"all": []})
+    assert gateway._menu_schedule_index() == {"all": []}
+    assert builds == [1000.0, 1006.0]
+
+
+def test_schedule_segments_pick_earliest_end_and_latest_window() -> None:
+    day = gateway.datetime(2026, 3, 1)
+
+    def hours(value: float):
+        return day + gateway.timedelta(hours=value)
+
+    segments = gateway._schedule_segments(
+        [
+            (hours(17), hours(20), 1, "iftar"),
+            (hours(23.5), hours(28.5), 2, "saheri"),
+            (hours(18), hours(19), 3, "saheri"),
+        ]
+    )
+
+    assert gateway._segment_at(segments, hours(16)) is None
+    assert gateway._segment_at(segments, hours(17.5)) == (hours(20), "iftar")
+    assert gateway._segment_at(segments, hours(18.5)) == (hours(19), "saheri")
+    assert gateway._segment_at(segments, hours(19)) == (hours(20), "iftar")
+    assert gateway._segment_at(segments, hours(20)) is None
+    assert gateway._segment_at(segments, hours(26)) == (hours(28.5), "saheri")
+
+
+def test_prewarm_builds_only_keys_that_change_at_next_boundary(monkeypatch: pytest.MonkeyPatch) -> None:
+    day = gateway.datetime(2026, 3, 1)
+    iftar = (day + gateway.timedelta(hours=18), day + gateway.timedelta(hours=20), 1, "iftar")
+    saheri = (day + gateway.timedelta(hours=27), day + gateway.timedelta(hours=29), 2, "saheri")
+    index = {
+        "all": gateway._schedule_segments([iftar, saheri]),
+        "by_name": {"iftar": gateway._schedule_segments([iftar]), "saheri": gateway._schedule_segments([saheri])},
+        "visibility": None,
+    }
+    built: list[tuple] = []
+    monkeypatch.setattr(gateway, "menu_schedule", {"index": index, "built_at": 1.0})
+    monkeypatch.setattr(gateway, "_build_menu_body", lambda key, _now, rebuild: built.append(key))
+
+    now_local = day + gateway.timedelta(hours=17, minutes=59, seconds=57)
+    boundary = gateway._next_menu_boundary(now_local)
+    assert boundary == day + gateway.timedelta(hours=18)
+
+    assert gateway._prewarm_menu_at(boundary, now_local) == 1
+    assert built == [("ramadan", "iftar", (day + gateway.timedelta(hours=20)).isoformat(), True)]
+
+
+def test_price_catalog_reloads_after_menu_update(empty_menu_l1, monkeypatch: pytest.MonkeyPatch) -> None:
+    rows = {"1": ("1", "Khichuri", 120, True)}
+    queries: list[str] = []
+
+    class FakeCursor:
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *_exc) -> None:
+            return None
+
+        async def execute(self, sql: str, params: tuple = ()) -> None:
+            queries.append(sql)
+            self.result = [rows[i] for i in params[0] if i in rows] if params else list(rows.values())
+
+        async def fetchall(self) -> list[tuple]:
+            return self.result
+
+    class FakeConn:
+        def cursor(self) -> FakeCursor:
+            return FakeCursor()
+
+    @gateway.asynccontextmanager
+    async def fake_db_conn():
+        yield FakeConn()
+
+    def price_map(ids: list[str]) -> dict:
+        return asyncio.run(gateway._menu_price_map(ids))
+
+    monkeypatch.setattr(gateway, "_async_db_conn", fake_db_conn)
+    monkeypatch.setattr(gateway, "price_catalog", {"version": None, "loaded_at": 0.0, "items": {}})
+
+    assert price_map(["1"])["1"]["price"] == 120
+    assert price_map(["1"])["1"]["price"] == 120
+    assert len(queries) == 1
+
+    rows["1"] = ("1", "Khichuri", 150, True)
+    rows["2"] = ("2", "Haleem", 90, True)
+    assert price_map(["2", "3"]) == {"2": {"id": "2", "name": "Haleem", "price": 90, "available": True}}
+    assert price_map(["1"])["1"]["price"] == 120
+
+    gateway._process_cache_event({"event": "menu.updated"})
+    assert price_map(["1"])["1"]["price"] == 150
@@ -0,0 +1,381 @@
+import asyncio
+import importlib.util
+from pathlib import Path
+
+import pytest
+
+
+MODULE_PATH = Path(__file__).resolve().parents[1] / "main.py"
+SPEC = importlib.util.spec_from_file_location("order_gateway_main", MODULE_PATH)
+assert SPEC and SPEC.loader
+gateway = importlib.util.module_from_spec(SPEC)
+SPEC.loader.exec_module(gateway)
+
+
+class FakeCursor:
+    def __init__(self, rowcount: int):
+        self.rowcount = rowcount
+        self.statements: list[tuple[str, tuple]] = []
+
+    def execute(self, sql: str, params: tuple = ()) -> None:
+        self.statements.append((" ".join(sql.split()), params))
+
+
+JOB = {
+    "order_id": "o-1",
+    "student_id": "2100001",
+    "amount": 240,
+    "method": "CASH",
+    "token_no": 1001,
+    "pickup_counter": 1,
+    "eta_minutes": 12,
+}
+
+
+def test_paid_order_is_queued_with_its_kitchen_job() -> None:
+    cur = FakeCursor(rowcount=1)
+
+    gateway._queue_paid_order(cur, JOB)
+
+    assert "status = 'PENDING_PAYMENT'" in cur.statements[0][0]
+    assert cur.statements[1][1][:2] == ("order.created", "kitchen.jobs")
+
+
+def test_paid_order_is_not_requeued_when_already_queued() -> None:
+    cur = FakeCursor(rowcount=0)
+
+    gateway._queue_paid_order(cur, JOB)
+
+    assert len(cur.statements) == 1
+
+
+class FakeStageConn:
+    def __init__(self) -> None:
+        self.cur = FakeCursor(rowcount=1)
+        self.committed = False
+
+    @gateway.contextmanager
+    def cursor(self):
+        yield self.cur
+
+    def commit(self) -> None:
+        self.committed = True
+
+
+class FakeStageDb:
+    def __init__(self) -> None:
+        self.conns: list[FakeStageConn] = []
+        self.open = 0
+
+    @gateway.contextmanager
+    def conn(self):
+        conn = FakeStageConn()
+        self.conns.append(conn)
+        self.open += 1
+        try:
+            yield conn
+        finally:
+            self.open -= 1
+
+
+def _payment_stage(
+    monkeypatch: pytest.MonkeyPatch,
+    attempts: int,
+    failure: Exception | None,
+    confirm_failure: Exception | None = None,
+    refund_failure: Exception | None = None,
+):
+    db = FakeStageDb()
+    events: list[str] = []
+
+    def pay(**_kwargs) -> None:
+        # The upstream call runs with no pooled connection checked out.
+        events.append(f"pay:open={db.open}")
+        if failure is not None:
+            raise failure
+
+    def confirm(order_id: str) -> None:
+        events.append(f"confirm:{order_id}")
+        if confirm_failure is not None:
+            raise confirm_failure
+
+    def refund(order_id: str) -> None:
+        events.append(f"refund:{order_id}")
+        if refund_failure is not None:
+            raise refund_failure
+
+    monkeypatch.setenv("ORDER_PAYMENT_MAX_ATTEMPTS", "3")
+    monkeypatch.setattr(gateway, "_db_conn", db.conn)
+    monkeypatch.setattr(gateway, "_lease_payment_job", lambda: (7, dict(JOB), attempts))
+    monkeypatch.setattr(gateway, "_process_payment", pay)
+    monkeypatch.setattr(gateway, "_confirm_order_reservations", confirm)
+    monkeypatch.setattr(gateway, "_refund_order_payment", refund)
+    monkeypatch.setattr(gateway, "_release_order_reservations", lambda order_id: events.append(f"release:{order_id}"))
+    assert gateway._process_payment_stage_once() == 1
+    # Whatever the outcome, the job is settled in one fresh transaction.
+    assert len(db.conns) == 1 and db.conns[0].committed
+    return db.conns[0].cur.statements, events
+
+
+def test_payment_stage_pays_without_holding_a_connection(monkeypatch: pytest.MonkeyPatch) -> None:
+    statements, events = _payment_stage(monkeypatch, attempts=1, failure=None)
+
+    assert events == ["pay:open=0", "confirm:o-1"]
+    assert "SET status = 'QUEUED'" in statements[0][0]
+    assert "published_at = NOW()" in statements[-1][0] and statements[-1][1] == (None, 7)
+
+
+def test_payment_stage_retries_an_unavailable_upstream_after_a_backoff(monkeypatch: pytest.MonkeyPatch) -> None:
+    failure = gateway.HTTPException(status_code=503, detail="Payment service unavailable")
+    statements, events = _payment_stage(monkeypatch, attempts=2, failure=failure)
+
+    assert events == ["pay:open=0"]
+    assert len(statements) == 1
+    assert "locked_until = NOW()" in statements[0][0] and "published_at" not in statements[0][0]
+    assert statements[0][1] == ("Payment service unavailable", 4, 7)
+
+
+def test_payment_stage_counts_unexpected_errors_as_attempts(monkeypatch: pytest.MonkeyPatch) -> None:
+    statements, events = _payment_stage(monkeypatch, attempts=1, failure=RuntimeError("boom"))
+
+    assert statements[0][1] == ("boom", 2, 7)
+    assert "release:o-1" not in events
+
+
+def test_payment_stage_cancels_a_declined_payment_in_one_transaction(monkeypatch: pytest.MonkeyPatch) -> None:
+    failure = gateway.HTTPException(status_code=402, detail="Insufficient balance")
+    statements, events = _payment_stage(monkeypatch, attempts=1, failure=failure)
+
+    assert "SET status = 'CANCELLED'" in statements[0][0] and statements[0][1] == ("o-1",)
+    assert "published_at = NOW()" in statements[1][0] and statements[1][1] == ("Insufficient balance", 7)
+    assert events[-2:] == ["refund:o-1", "release:o-1"]
+
+
+def test_payment_stage_cancels_after_the_last_attempt(monkeypatch: pytest.MonkeyPatch) -> None:
+    failure = gateway.HTTPException(status_code=503, detail="Payment service unavailable")
+    statements, events = _payment_stage(monkeypatch, attempts=3, failure=failure)
+
+    assert "SET status = 'CANCELLED'" in statements[0][0]
+    assert "published_at = NOW()" in statements[1][0]
+    assert events[-2:] == ["refund:o-1", "release:o-1"]
+
+
+def test_payment_stage_refunds_a_paid_order_whose_stock_confirm_is_refused(monkeypatch: pytest.MonkeyPatch) -> None:
+    failure = gateway.HTTPException(status_code=409, detail="Stock reservation expired")
+    statements, events = _payment_stage(monkeypatch, attempts=1, failure=None, confirm_failure=failure)
+
+    assert events == ["pay:open=0", "confirm:o-1", "refund:o-1", "release:o-1"]
+    assert "SET status = 'CANCELLED'" in statements[0][0]
+    assert statements[1][1] == ("Stock reservation expired", 7)
+
+
+def test_payment_stage_keeps_the_job_when_the_refund_fails(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setitem(gateway.metrics, "payment_stage_refund_failed_total", 0)
+    confirm_failure = gateway.HTTPException(status_code=409, detail="Stock reservation expired")
+    refund_failure = gateway.HTTPException(status_code=503, detail="Payment refund failed")
+    statements, events = _payment_stage(
+        monkeypatch, attempts=3, failure=None, confirm_failure=confirm_failure, refund_failure=refund_failure
+    )
+
+    # Neither cancelled nor released: the next lease retries the refund.
+    assert events == ["pay:open=0", "confirm:o-1", "refund:o-1"]
+    assert len(statements) == 1 and "CANCELLED" not in statements[0][0]
+    assert statements[0][1] == ("Refund failed: Payment refund failed", 6, 7)
+    assert gateway.metrics["payment_stage_refund_failed_total"] == 1
+
+
+def test_failed_stock_release_is_counted(monkeypatch: pytest.MonkeyPatch) -> None:
+    class FailingClient:
+        def post(self, *_args, **_kwargs):
+            raise gateway.httpx.ConnectError("stock down")
+
+    monkeypatch.setitem(gateway.metrics, "stock_release_failed_total", 0)
+    monkeypatch.setattr(gateway, "_upstream_client", lambda _name: FailingClient())
+
+    gateway._release_order_reservations("o-1")
+    assert gateway.metrics["stock_release_failed_total"] == 1
+
+
+def test_async_order_is_acknowledged_with_202(monkeypatch: pytest.MonkeyPatch) -> None:
+    async def admit() -> None:
+        return None
+
+    async def pending_order(*_args) -> dict:
+        return {"order_id": "o-1", "status": "PENDING_PAYMENT", "payment_status": "PENDING"}
+
+    async def replayed_order(*_args) -> dict:
+        return {"order_id": "o-1", "status": "QUEUED", "payment_status": "PENDING", "idempotent_replay": True}
+
+    monkeypatch.setattr(gateway, "_admit_order", admit)
+    monkeypatch.setattr(gateway, "_release_order", admit)
+    payload = gateway.CreateOrderRequest(items=[{"id": "1", "qty": 1}])
+
+    monkeypatch.setattr(gateway, "_create_order", pending_order)
+    response = gateway.Response()
+    asyncio.run(gateway.create_order(payload, None, None, "tap", response))
+    assert response.status_code == 202
+
+    monkeypatch.setattr(gateway, "_create_order", replayed_order)
+    response = gateway.Response()
+    asyncio.run(gateway.create_order(payload, None, None, "tap", response))
+    assert response.status_code == 200
+
+
+def test_place_order_prices_and_prechecks_stock_concurrently(monkeypatch: pytest.MonkeyPatch) -> None:
+    events: list[str] = []
+
+    async def price_map(ids: list[str]) -> dict:
+        events.append("price:start")
+        await asyncio.sleep(0.05)
+        events.append("price:done")
+        return {"1": {"id": "1", "name": "Khichuri", "price": 120, "available": True}}
+
+    async def precheck(ids: list[str]) -> list[str]:
+        events.append("stock:start")
+        await asyncio.sleep(0.05)
+        events.append("stock:done")
+        return ["1"]
+
+    monkeypatch.setattr(gateway, "_menu_price_map", price_map)
+    monkeypatch.setattr(gateway, "_unavailable_items_cached", precheck)
+    payload = gateway.CreateOrderRequest(items=[{"id": "1", "qty": 1}])
+
+    with pytest.raises(gateway.HTTPException) as exc:
+        asyncio.run(gateway._place_order(payload, "2100001", "", 0.0))
+    assert exc.value.status_code == 409
+    assert events[:2] == ["price:start", "stock:start"]
+
+
+class FakeAsyncCursor:
+    def __init__(self, conn: "FakeAsyncConn") -> None:
+        self.conn = conn
+        self.rowcount = 1
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *_exc):
+        return False
+
+    async def execute(self, sql: str, params: tuple = ()) -> None:
+        sql = " ".join(sql.split())
+        self.conn.statements.append(sql)
+        self.rowcount = 0 if sql.startswith("INSERT INTO order_idempotency") and self.conn.key_taken else 1
+
+    async def fetchone(self):
+        return (1001, 1)
+
+
+class FakeAsyncConn:
+    def __init__(self, key_taken: bool) -> None:
+        self.key_taken = key_taken
+        self.statements: list[str] = []
+        self.committed = False
+        self.rolled_back = False
+
+    def cursor(self) -> FakeAsyncCursor:
+        return FakeAsyncCursor(self)
+
+    async def commit(self) -> None:
+        self.committed = True
+
+    async def rollback(self) -> None:
+        self.rolled_back = True
+
+
+def _fake_order_db(monkeypatch: pytest.MonkeyPatch, key_taken: bool) -> tuple[FakeAsyncConn, list[str]]:
+    conn = FakeAsyncConn(key_taken)
+    released: list[str] = []
+
+    @gateway.asynccontextmanager
+    async def db_conn():
+        yield conn
+
+    async def price_map(_ids: list[str]) -> dict:
+        return {"1": {"id": "1", "name": "Khichuri", "price": 120, "available": True}}
+
+    async def nothing_unavailable(_ids: list[str]) -> list[str]:
+        return []
+
+    async def reserve(_order_id: str, _items) -> None:
+        return None
+
+    async def release(order_id: str) -> None:
+        released.append(order_id)
+
+    async def existing_order(_student_id: str, _key: str) -> dict:
+        return {"order_id": "o-first", "status": "QUEUED", "idempotent_replay": True}
+
+    monkeypatch.setenv("ORDER_PIPELINE_MODE", "async")
+    monkeypatch.setattr(gateway, "_async_db_conn", db_conn)
+    monkeypatch.setattr(gateway, "_menu_price_map", price_map)
+    monkeypatch.setattr(gateway, "_unavailable_items_cached", nothing_unavailable)
+    monkeypatch.setattr(gateway, "_reserve_items", reserve)
+    monkeypatch.setattr(gateway, "_release_order_reservations_async", release)
+    monkeypatch.setattr(gateway, "_find_idempotent_order", existing_order)
+    return conn, released
+
+
+def test_place_order_undoes_a_duplicate_of_an_already_placed_key(monkeypatch: pytest.MonkeyPatch) -> None:
+    conn, released = _fake_order_db(monkeypatch, key_taken=True)
+    payload = gateway.CreateOrderRequest(items=[{"id": "1", "qty": 1}])
+
+    result = asyncio.run(gateway._place_order(payload, "2100001", "tap", 0.0))
+
+    assert result == {"order_id": "o-first", "status": "QUEUED", "idempotent_replay": True}
+    assert conn.rolled_back and not conn.committed
+    assert len(released) == 1
+    # Nothing reached the payment stage.
+    assert not any("event_outbox" in sql for sql in conn.statements)
+
+
+def test_place_order_records_the_key_with_the_order_before_payment(monkeypatch: pytest.MonkeyPatch) -> None:
+    conn, released = _fake_order_db(monkeypatch, key_taken=False)
+    payload = gateway.CreateOrderRequest(items=[{"id": "1", "qty": 1}])
+
+    result = asyncio.run(gateway._place_order(payload, "2100001", "tap", 0.0))
+
+    assert result["status"] == "PENDING_PAYMENT"
+    assert conn.committed and released == []
+    tables = [sql.split()[2].split("(")[0] for sql in conn.statements if sql.startswith("INSERT INTO")]
+    assert tables == ["orders", "order_items", "order_idempotency", "event_outbox"]
+
+
+class FakeOutboxConn:
+    def __init__(self, rows: list[tuple]) -> None:
+        self.cur = FakeCursor(rowcount=0)
+        self.cur.fetchall = lambda: rows
+
+    @gateway.contextmanager
+    def cursor(self):
+        yield self.cur
+
+    def commit(self) -> None:
+        pass
+
+
+def test_outbox_drain_publishes_its_rows_as_one_batch(monkeypatch: pytest.MonkeyPatch) -> None:
+    rows = [(1, "kitchen.jobs", '{"order_id": "o-1"}'), (2, "kitchen.jobs", "{bad"), (3, "order.status", {"order_id": "o-2"})]
+    conn = FakeOutboxConn(rows)
+    batches: list[list] = []
+    monkeypatch.setattr(gateway, "_db_conn", gateway.contextmanager(lambda: iter([conn])))
+    monkeypatch.setattr(gateway.rabbit_publisher, "publish_queue_batch", batches.append)
+
+    assert gateway._process_outbox_once() == 2
+    assert batches == [[("kitchen.jobs", {"order_id": "o-1"}), ("order.status", {"order_id": "o-2"})]]
+    failed, published = conn.cur.statements[1:]
+    assert "last_error = %s" in failed[0] and failed[1][1] == [2]
+    assert "published_at = NOW()" in published[0] and published[1] == ([1, 3],)
+
+
+def test_outbox_drain_keeps_every_row_when_the_batch_fails(monkeypatch: pytest.MonkeyPatch) -> None:
+    conn = FakeOutboxConn([(1, "kitchen.jobs", '{"order_id": "o-1"}'), (3, "order.status", '{"order_id": "o-2"}')])
+
+    def broker_down(_messages) -> None:
+        raise RuntimeError("broker down")
+
+    monkeypatch.setattr(gateway, "_db_conn", gateway.contextmanager(lambda: iter([conn])))
+    monkeypatch.setattr(gateway.rabbit_publisher, "publish_queue_batch", broker_down)
+
+    assert gateway._process_outbox_once() == 0
+    assert [params for _, params in conn.cur.statements[1:]] == [("broker down", [1, 3])]
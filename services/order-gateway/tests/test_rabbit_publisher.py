@@ -0,0 +1,149 @@
+import importlib.util
+from pathlib import Path
+
+import pytest
+
+
+MODULE_PATH = Path(__file__).resolve().parents[1] / "main.py"
+SPEC = importlib.util.spec_from_file_location("order_gateway_main", MODULE_PATH)
+assert SPEC and SPEC.loader
+gateway = importlib.util.module_from_spec(SPEC)
+SPEC.loader.exec_module(gateway)
+
+publisher = gateway.rabbit_publisher
+exceptions = gateway.pika.exceptions
+
+
+class FakeChannel:
+    def __init__(
+        self, fail_declares: int = 0, publish_error: Exception | None = None, commit_error: Exception | None = None
+    ) -> None:
+        self.is_open = True
+        self.fail_declares = fail_declares
+        self.publish_error = publish_error
+        self.commit_error = commit_error
+        self.declared: list[str] = []
+        self.published: list[str] = []
+        self.commits: list[int] = []
+
+    def confirm_delivery(self) -> None:
+        pass
+
+    def tx_select(self) -> None:
+        pass
+
+    def tx_commit(self) -> None:
+        if self.commit_error is not None:
+            raise self.commit_error
+        self.commits.append(len(self.published))
+
+    def queue_declare(self, queue: str, durable: bool) -> None:
+        if self.fail_declares:
+            self.fail_declares -= 1
+            self.is_open = False
+            raise exceptions.StreamLostError("connection reset")
+        self.declared.append(queue)
+
+    def basic_publish(self, exchange: str, routing_key: str, body: str, properties) -> None:
+        if self.publish_error is not None:
+            error, self.publish_error = self.publish_error, None
+            raise error
+        self.published.append(routing_key)
+
+
+class FakeConnection:
+    def __init__(self, channel: FakeChannel) -> None:
+        self._channel = channel
+        self.is_open = True
+        self.data_events = 0
+
+    def channel(self) -> FakeChannel:
+        return self._channel
+
+    def process_data_events(self, time_limit: float) -> None:
+        self.data_events += 1
+
+    def close(self) -> None:
+        self.is_open = False
+
+
+@pytest.fixture
+def fake_broker(monkeypatch: pytest.MonkeyPatch):
+    broker: dict = {"channels": [], "connections": [], "next": []}
+
+    def connect(_params):
+        channel = broker["next"].pop(0) if broker["next"] else FakeChannel()
+        connection = FakeConnection(channel)
+        broker["channels"].append(channel)
+        broker["connections"].append(connection)
+        return connection
+
+    monkeypatch.setattr(gateway.pika, "BlockingConnection", connect)
+    publisher.reset()
+    yield broker
+    publisher.reset()
+    publisher.close_all()
+
+
+def test_publish_reconnects_once_when_connection_is_stale_before_publish(fake_broker) -> None:
+    fake_broker["next"] = [FakeChannel(fail_declares=1)]
+    publisher.publish_queue("kitchen.jobs", {"order_id": "o-1"})
+    assert len(fake_broker["channels"]) == 2
+    assert fake_broker["channels"][1].published == ["kitchen.jobs"]
+
+
+def test_publish_does_not_retry_after_message_was_handed_over(fake_broker) -> None:
+    fake_broker["next"] = [FakeChannel(publish_error=exceptions.StreamLostError("lost confirm"))]
+    with pytest.raises(exceptions.StreamLostError):
+        publisher.publish_queue("kitchen.jobs", {"order_id": "o-1"})
+    assert len(fake_broker["channels"]) == 1
+    assert fake_broker["connections"][0].is_open is False
+
+
+def test_nack_propagates_and_keeps_connection(fake_broker) -> None:
+    fake_broker["next"] = [FakeChannel(publish_error=exceptions.NackError([]))]
+    with pytest.raises(exceptions.NackError):
+        publisher.publish_queue("kitchen.jobs", {"order_id": "o-1"})
+    publisher.publish_queue("kitchen.jobs", {"order_id": "o-2"})
+    assert len(fake_broker["channels"]) == 1
+    assert fake_broker["channels"][0].published == ["kitchen.jobs"]
+
+
+def test_publish_reuses_channel_and_declares_queue_once(fake_broker) -> None:
+    publisher.publish_queue("kitchen.jobs", {"order_id": "o-1"})
+    publisher.publish_queue("kitchen.jobs", {"order_id": "o-2"})
+    publisher.publish_queue("order.status", {"order_id": "o-2"})
+    assert len(fake_broker["channels"]) == 1
+    assert fake_broker["channels"][0].declared == ["kitchen.jobs", "order.status"]
+    assert fake_broker["channels"][0].published == ["kitchen.jobs", "kitchen.jobs", "order.status"]
+
+
+def test_idle_connection_services_heartbeats_before_publishing(fake_broker, monkeypatch) -> None:
+    publisher.publish_queue("kitchen.jobs", {"order_id": "o-1"})
+    connection = fake_broker["connections"][0]
+    assert connection.data_events == 0
+    publisher._local.last_used -= 600
+    publisher.publish_queue("kitchen.jobs", {"order_id": "o-2"})
+    assert connection.data_events == 1
+    assert len(fake_broker["connections"]) == 1
+
+
+def test_batch_is_committed_in_one_round_trip(fake_broker) -> None:
+    publisher.publish_queue_batch(
+        [("kitchen.jobs", {"order_id": "o-1"}), ("order.status", {"order_id": "o-1"}), ("kitchen.jobs", {"order_id": "o-2"})]
+    )
+    channel = fake_broker["channels"][0]
+    assert channel.declared == ["kitchen.jobs", "order.status"]
+    assert channel.published == ["kitchen.jobs", "order.status", "kitchen.jobs"]
+    assert channel.commits == [3]
+
+
+def test_failed_batch_commit_propagates_and_reconnects(fake_broker) -> None:
+    fake_broker["next"] = [FakeChannel(commit_error=exceptions.StreamLostError("lost commit"))]
+    with pytest.raises(exceptions.StreamLostError):
+        publisher.publish_queue_batch([("kitchen.jobs", {"order_id": "o-1"})])
+    assert fake_broker["connections"][0].is_open is False
+
+    publisher.publish_queue_batch([("kitchen.jobs", {"order_id": "o-1"})])
+    assert len(fake_broker["channels"]) == 2
+    assert fake_broker["channels"][1].commits == [1]
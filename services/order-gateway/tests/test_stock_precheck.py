@@ -0,0 +1,165 @@
+import asyncio
+import importlib.util
+from pathlib import Path
+
+import pytest
+
+
+MODULE_PATH = Path(__file__).resolve().parents[1] / "main.py"
+SPEC = importlib.util.spec_from_file_location("order_gateway_main", MODULE_PATH)
+assert SPEC and SPEC.loader
+gateway = importlib.util.module_from_spec(SPEC)
+SPEC.loader.exec_module(gateway)
+
+
+class FakePipeline:
+    def __init__(self, store: dict[str, str]):
+        self.store = store
+
+    def setex(self, key: str, _ttl: int, value: str) -> None:
+        self.store[key] = value
+
+    def delete(self, *keys: str) -> None:
+        for key in keys:
+            self.store.pop(key, None)
+
+    async def execute(self) -> None:
+        pass
+
+
+class FakeRedis:
+    def __init__(self, store: dict[str, str]):
+        self.store = store
+        self.mget_calls = 0
+
+    async def mget(self, keys: list[str]) -> list[str | None]:
+        self.mget_calls += 1
+        return [self.store.get(key) for key in keys]
+
+    def pipeline(self, transaction: bool = True) -> FakePipeline:
+        return FakePipeline(self.store)
+
+
+class FakeResponse:
+    def __init__(self, status_code: int, body: dict):
+        self.status_code = status_code
+        self._body = body
+
+    def json(self) -> dict:
+        return self._body
+
+
+class FakeStockClient:
+    def __init__(self, levels: dict[str, int]):
+        self.levels = levels
+        self.calls: list[str] = []
+
+    async def get(self, url: str, params: dict[str, str], timeout: float) -> FakeResponse:
+        assert timeout == gateway.STOCK_CALL_TIMEOUTS["availability"]
+        self.calls.append(params["ids"])
+        ids = params["ids"].split(",")
+        return FakeResponse(
+            200,
+            {
+                "items": [
+                    {"id": item_id, "available": self.levels[item_id] > 0, "stock_quantity": self.levels[item_id]}
+                    for item_id in ids
+                    if item_id in self.levels
+                ],
+                "missing": [item_id for item_id in ids if item_id not in self.levels],
+            },
+        )
+
+
+def test_precheck_uses_one_mget_and_one_bulk_call(monkeypatch: pytest.MonkeyPatch) -> None:
+    store = {gateway._stock_zero_cache_key("c"): "1"}
+    fake_redis = FakeRedis(store)
+    client = FakeStockClient({"a": 3, "b": 0, "c": 5})
+    monkeypatch.setattr(gateway, "async_redis_client", fake_redis)
+    monkeypatch.setattr(gateway, "_async_upstream_client", lambda _upstream: client)
+
+    assert asyncio.run(gateway._unavailable_items_cached(["a", "b", "c", "a"])) == ["b", "c"]
+    assert fake_redis.mget_calls == 1
+    assert client.calls == ["a,b"]
+    assert store[gateway._stock_zero_cache_key("b")] == "1"
+
+    assert asyncio.run(gateway._unavailable_items_cached(["b"])) == ["b"]
+    assert client.calls == ["a,b"]
+
+
+def test_precheck_rejects_unknown_items(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(gateway, "redis_state", {"retry_at": float("inf"), "backoff_seconds": 0.0})
+    monkeypatch.setattr(gateway, "_async_upstream_client", lambda _upstream: FakeStockClient({"a": 1}))
+
+    with pytest.raises(gateway.HTTPException) as exc:
+        asyncio.run(gateway._unavailable_items_cached(["a", "zz"]))
+    assert exc.value.status_code == 400
+    assert exc.value.detail == "Item zz not found"
+
+
+class FakeReserveClient:
+    def __init__(self, response: FakeResponse | Exception):
+        self.response = response
+        self.calls: list[dict] = []
+
+    async def post(self, url: str, json: dict) -> FakeResponse:
+        assert url.endswith("/stock/reserve-batch")
+        self.calls.append(json)
+        if isinstance(self.response, Exception):
+            raise self.response
+        return self.response
+
+
+LINES = [gateway.OrderLine(id="a", qty=2), gateway.OrderLine(id="b", qty=1)]
+
+
+def _stub_reserve(monkeypatch: pytest.MonkeyPatch, response: FakeResponse | Exception) -> tuple[FakeReserveClient, list[str]]:
+    client = FakeReserveClient(response)
+    released: list[str] = []
+
+    async def release(order_id: str) -> None:
+        released.append(order_id)
+
+    monkeypatch.setattr(gateway, "redis_state", {"retry_at": float("inf"), "backoff_seconds": 0.0})
+    monkeypatch.setattr(gateway, "_async_upstream_client", lambda _upstream: client)
+    monkeypatch.setattr(gateway, "_release_order_reservations_async", release)
+    return client, released
+
+
+def test_reserve_items_sends_every_line_in_one_call(monkeypatch: pytest.MonkeyPatch) -> None:
+    client, released = _stub_reserve(monkeypatch, FakeResponse(200, {"reserved": True}))
+
+    asyncio.run(gateway._reserve_items("o-1", LINES))
+
+    assert client.calls == [{"order_id": "o-1", "items": [{"item_id": "a", "qty": 2}, {"item_id": "b", "qty": 1}]}]
+    assert released == []
+
+
+@pytest.mark.parametrize(
+    ("status_code", "body", "expected"),
+    [
+        (409, {"detail": "Insufficient stock for item b"}, (409, "Insufficient stock for item b")),
+        (404, {"detail": "Item b not found"}, (400, "Item b not found")),
+        (422, {"detail": "qty must be positive"}, (400, "Invalid stock reservation request")),
+        (503, {"detail": "Service in chaos mode"}, (503, "Stock service failure")),
+    ],
+)
+def test_reserve_items_maps_batch_rejections(
+    monkeypatch: pytest.MonkeyPatch, status_code: int, body: dict, expected: tuple[int, str]
+) -> None:
+    _, released = _stub_reserve(monkeypatch, FakeResponse(status_code, body))
+
+    with pytest.raises(gateway.HTTPException) as exc:
+        asyncio.run(gateway._reserve_items("o-1", LINES))
+    assert (exc.value.status_code, exc.value.detail) == expected
+    # A rejected batch committed nothing, so there is nothing to release.
+    assert released == []
+
+
+def test_reserve_items_releases_when_the_batch_outcome_is_unknown(monkeypatch: pytest.MonkeyPatch) -> None:
+    _, released = _stub_reserve(monkeypatch, gateway.httpx.ReadTimeout("timed out"))
+
+    with pytest.raises(gateway.HTTPException) as exc:
+        asyncio.run(gateway._reserve_items("o-1", LINES))
+    assert exc.value.status_code == 503
+    assert released == ["o-1"]
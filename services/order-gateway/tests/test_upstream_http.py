@@ -0,0 +1,37 @@
+import importlib.util
+from pathlib import Path
+
+import pytest
+
+
+MODULE_PATH = Path(__file__).resolve().parents[1] / "main.py"
+SPEC = importlib.util.spec_from_file_location("order_gateway_main", MODULE_PATH)
+assert SPEC and SPEC.loader
+gateway = importlib.util.module_from_spec(SPEC)
+SPEC.loader.exec_module(gateway)
+
+
+def test_upstream_hook_counts_requests_and_new_connections(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setitem(gateway.upstream_http_metrics, "stock", {"requests_total": 0, "connections_opened_total": 0})
+    hook = gateway._upstream_request_hook("stock")
+
+    first = gateway.httpx.Request("GET", "http://stock-service:8000/health")
+    hook(first)
+    first.extensions["trace"]("connection.connect_tcp.started", {})
+    first.extensions["trace"]("connection.connect_tcp.complete", {})
+    hook(gateway.httpx.Request("GET", "http://stock-service:8000/health"))
+
+    stats = gateway._upstream_http_metrics()["stock"]
+    assert stats["requests_total"] == 2
+    assert stats["connections_opened_total"] == 1
+    assert stats["connections_reused_total"] == 1
+
+
+def test_upstream_client_is_shared_per_upstream(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(gateway, "upstream_clients", {})
+    try:
+        assert gateway._upstream_client("payment") is gateway._upstream_client("payment")
+        assert gateway._upstream_client("payment") is not gateway._upstream_client("stock")
+        assert gateway._upstream_client("payment").timeout.read == 4.0
+    finally:
+        gateway._close_upstream_clients()
@@ -10,6 +10,8 @@ import psycopg
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel, Field
 
+import rabbit_publisher
+
 app = FastAPI()
 
 chaos_state = {"enabled": False, "mode": "error"}
@@ -17,6 +19,7 @@ chaos_state = {"enabled": False, "mode": "error"}
 metrics: dict[str, float] = {
     "payments_total": 0,
     "payments_failed_total": 0,
+    "refunds_total": 0,
     "topups_total": 0,
     "topups_failed_total": 0,
     "health_checks_total": 0,
@@ -34,12 +37,6 @@ def _db_conn():
     )
 
 
-def _rabbit_params() -> pika.ConnectionParameters:
-    host = os.getenv("RABBITMQ_HOST", "rabbitmq")
-    port = int(os.getenv("RABBITMQ_PORT", "5672"))
-    return pika.ConnectionParameters(host=host, port=port)
-
-
 def _now_iso() -> str:
     return datetime.now(timezone.utc).replace(microsecond=0).isoformat().replace("+00:00", "Z")
 
@@ -121,16 +118,7 @@ def _publish_payment_completed(payment: dict) -> None:
     }
 
     try:
-        connection = pika.BlockingConnection(_rabbit_params())
-        channel = connection.channel()
-        channel.queue_declare(queue="payment.completed", durable=True)
-        channel.basic_publish(
-            exchange="",
-            routing_key="payment.completed",
-            body=json.dumps(event),
-            properties=pika.BasicProperties(delivery_mode=2),
-        )
-        connection.close()
+        rabbit_publisher.publish_queue("payment.completed", event)
     except Exception as exc:
         metrics["queue_publish_failed_total"] += 1
         raise HTTPException(status_code=503, detail=f"Queue unavailable: {exc}") from exc
@@ -145,6 +133,11 @@ class ProcessPaymentRequest(BaseModel):
     transaction_ref: str | None = None
 
 
+class RefundPaymentRequest(BaseModel):
+    order_id: str
+    reason: str = "order_cancelled"
+
+
 class ChaosRequest(BaseModel):
     enabled: bool
     mode: str = "error"
@@ -270,6 +263,11 @@ def on_startup():
     _ensure_schema()
 
 
+@app.on_event("shutdown")
+def on_shutdown():
+    rabbit_publisher.close_all()
+
+
 @app.get("/health")
 def health():
     metrics["health_checks_total"] += 1
@@ -285,7 +283,7 @@ def health():
         raise HTTPException(status_code=503, detail=f"database unavailable: {exc}") from exc
 
     try:
-        connection = pika.BlockingConnection(_rabbit_params())
+        connection = pika.BlockingConnection(rabbit_publisher.connection_params())
         connection.close()
     except Exception as exc:
         raise HTTPException(status_code=503, detail=f"rabbitmq unavailable: {exc}") from exc
@@ -298,10 +296,13 @@ def get_metrics():
     return {
         "payments_total": metrics["payments_total"],
         "payments_failed_total": metrics["payments_failed_total"],
+        "refunds_total": metrics["refunds_total"],
         "topups_total": metrics["topups_total"],
         "topups_failed_total": metrics["topups_failed_total"],
         "health_checks_total": metrics["health_checks_total"],
         "queue_publish_failed_total": metrics["queue_publish_failed_total"],
+        "rabbit_connections_opened_total": rabbit_publisher.metrics["connections_opened_total"],
+        "rabbit_publish_retries_total": rabbit_publisher.metrics["publish_retries_total"],
     }
 
 
@@ -334,6 +335,10 @@ def process_payment(payload: ProcessPaymentRequest):
                 (payload.order_id,),
             )
             existing = cur.fetchone()
+            if existing and existing[6] == "REFUNDED":
+                # The order was cancelled after paying; a late retry must not revive it.
+                metrics["payments_failed_total"] += 1
+                raise HTTPException(status_code=409, detail="Payment was refunded")
             if existing:
                 return {
                     "ok": True,
@@ -464,6 +469,58 @@ def process_payment(payload: ProcessPaymentRequest):
     return {"ok": True, "already_processed": False, "payment": payment}
 
 
+@app.post("/payments/refund")
+def refund_payment(payload: RefundPaymentRequest):
+    _should_fail()
+    with _db_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT payment_id, student_id, amount, status
+                FROM payments
+                WHERE order_id = %s
+                FOR UPDATE
+                """,
+                (payload.order_id,),
+            )
+            row = cur.fetchone()
+            if not row:
+                raise HTTPException(status_code=404, detail="Payment not found")
+            payment_id, student_id, amount, status = row
+            if status == "REFUNDED":
+                return {"ok": True, "already_processed": True, "payment_id": payment_id, "status": status}
+
+            cur.execute("SELECT account_balance FROM students WHERE student_id = %s FOR UPDATE", (student_id,))
+            balance_before = int(cur.fetchone()[0])
+            balance_after = balance_before + int(amount)
+            cur.execute(
+                "UPDATE students SET account_balance = %s WHERE student_id = %s",
+                (balance_after, student_id),
+            )
+            if int(amount) > 0:
+                cur.execute(
+                    """
+                    INSERT INTO wallet_transactions (
+                        student_id, txn_type, direction, amount, balance_before, balance_after, reference_type, reference_id, metadata
+                    )
+                    VALUES (%s, 'ADJUSTMENT', 'CREDIT', %s, %s, %s, 'order', %s, %s::jsonb)
+                    """,
+                    (
+                        student_id,
+                        int(amount),
+                        balance_before,
+                        balance_after,
+                        payload.order_id,
+                        json.dumps({"refund_of": payment_id, "reason": payload.reason}),
+                    ),
+                )
+            cur.execute("UPDATE payments SET status = 'REFUNDED' WHERE payment_id = %s", (payment_id,))
+            conn.commit()
+
+    metrics["refunds_total"] += 1
+    return {"ok": True, "already_processed": False, "payment_id": payment_id, "status": "REFUNDED"}
+
+
 @app.get("/payments/{payment_id}")
 def get_payment(payment_id: str):
     _should_fail()
@@ -0,0 +1,184 @@
+"""RabbitMQ publishing shared by the services.
+
+Each thread keeps one confirm-mode channel, since pika's BlockingConnection
+is not thread-safe. A publish is retried only when the connection or channel
+fails before the message is handed to the broker. Once basic_publish has
+run, a nack, an unroutable return or a lost confirm propagates: the caller
+cannot tell whether the broker kept the message, and a blind retry would
+duplicate it.
+
+BlockingChannel waits for each confirm in turn, so batches go through a
+second, transactional channel on the same connection instead: one tx_commit
+round trip acknowledges every message in the batch.
+"""
+
+import json
+import os
+import threading
+import time
+from typing import Any, Callable
+
+import pika
+from pika.adapters.blocking_connection import BlockingChannel
+
+metrics: dict[str, float] = {
+    "connections_opened_total": 0,
+    "publish_retries_total": 0,
+}
+
+_local = threading.local()
+_connections: list[pika.BlockingConnection] = []
+_connections_lock = threading.Lock()
+
+
+def _env_int(name: str, default: int, minimum: int = 0) -> int:
+    raw = os.getenv(name, str(default))
+    try:
+        value = int(raw)
+    except ValueError:
+        return default
+    return value if value >= minimum else default
+
+
+def _heartbeat_seconds() -> int:
+    return _env_int("RABBITMQ_HEARTBEAT_SECONDS", 60)
+
+
+def connection_params() -> pika.ConnectionParameters:
+    host = os.getenv("RABBITMQ_HOST", "rabbitmq")
+    port = int(os.getenv("RABBITMQ_PORT", "5672"))
+    return pika.ConnectionParameters(host=host, port=port, heartbeat=_heartbeat_seconds())
+
+
+def _channel() -> BlockingChannel:
+    channel = getattr(_local, "channel", None)
+    connection = getattr(_local, "connection", None)
+    if channel is not None and channel.is_open and connection is not None:
+        # An idle BlockingConnection only answers heartbeats when it is called,
+        # so service them now. A connection the broker dropped meanwhile fails
+        # here, before anything is published, and is replaced.
+        if time.monotonic() - _local.last_used >= max(_heartbeat_seconds() / 2, 1):
+            connection.process_data_events(time_limit=0)
+        if channel.is_open:
+            return channel
+    reset()
+    connection = pika.BlockingConnection(connection_params())
+    channel = connection.channel()
+    channel.confirm_delivery()
+    _local.connection = connection
+    _local.channel = channel
+    _local.tx_channel = None
+    _local.declared = set()
+    _local.last_used = time.monotonic()
+    with _connections_lock:
+        _connections.append(connection)
+    metrics["connections_opened_total"] += 1
+    return channel
+
+
+def reset() -> None:
+    """Drop this thread's connection; the next publish reconnects."""
+    connection = getattr(_local, "connection", None)
+    _local.connection = None
+    _local.channel = None
+    _local.tx_channel = None
+    _local.declared = set()
+    if connection is None:
+        return
+    with _connections_lock:
+        if connection in _connections:
+            _connections.remove(connection)
+    try:
+        if connection.is_open:
+            connection.close()
+    except Exception:
+        pass
+
+
+def close_all() -> None:
+    with _connections_lock:
+        connections = list(_connections)
+        _connections.clear()
+    for connection in connections:
+        try:
+            if connection.is_open:
+                connection.close()
+        except Exception:
+            pass
+
+
+def _ready_channel(declare_key: str, declare: Callable[[BlockingChannel], None]) -> BlockingChannel:
+    for attempt in range(2):
+        try:
+            channel = _channel()
+            if declare_key not in _local.declared:
+                declare(channel)
+                _local.declared.add(declare_key)
+            return channel
+        except (pika.exceptions.AMQPConnectionError, pika.exceptions.AMQPChannelError):
+            # Stale connection (broker restart, missed heartbeats): nothing was sent yet.
+            reset()
+            if attempt:
+                raise
+            metrics["publish_retries_total"] += 1
+    raise RuntimeError("unreachable")
+
+
+def _publish(channel: BlockingChannel, exchange: str, routing_key: str, body: str, properties: Any) -> None:
+    try:
+        # Confirm mode: returns once the broker has accepted the message.
+        channel.basic_publish(exchange=exchange, routing_key=routing_key, body=body, properties=properties)
+    except (pika.exceptions.NackError, pika.exceptions.UnroutableError):
+        _local.last_used = time.monotonic()
+        raise
+    except Exception:
+        reset()
+        raise
+    _local.last_used = time.monotonic()
+
+
+def publish_queue(queue_name: str, payload: dict[str, Any]) -> None:
+    channel = _ready_channel(
+        f"queue:{queue_name}", lambda ch: ch.queue_declare(queue=queue_name, durable=True)
+    )
+    _publish(channel, "", queue_name, json.dumps(payload), pika.BasicProperties(delivery_mode=2))
+
+
+def publish_fanout(exchange_name: str, payload: dict[str, Any]) -> None:
+    channel = _ready_channel(
+        f"exchange:{exchange_name}",
+        lambda ch: ch.exchange_declare(exchange=exchange_name, exchange_type="fanout", durable=True),
+    )
+    # Subscriber queues are per-replica and auto-delete, so persistence buys nothing.
+    _publish(channel, exchange_name, "", json.dumps(payload), None)
+
+
+def publish_queue_batch(messages: list[tuple[str, dict[str, Any]]]) -> None:
+    """Publish (queue name, payload) pairs to durable queues as one transaction.
+
+    Either the broker commits every message or none of them; as with
+    publish_queue, a failure after publishing has started propagates.
+    """
+    if not messages:
+        return
+    for queue_name in dict.fromkeys(queue for queue, _ in messages):
+        _ready_channel(f"queue:{queue_name}", lambda ch, queue=queue_name: ch.queue_declare(queue=queue, durable=True))
+    try:
+        channel = getattr(_local, "tx_channel", None)
+        if channel is None or not channel.is_open:
+            channel = _local.connection.channel()
+            channel.tx_select()
+            _local.tx_channel = channel
+        for queue_name, payload in messages:
+            channel.basic_publish(
+                exchange="",
+                routing_key=queue_name,
+                body=json.dumps(payload),
+                properties=pika.BasicProperties(delivery_mode=2),
+            )
+        channel.tx_commit()
+    except Exception:
+        # Uncommitted messages are discarded with the connection.
+        reset()
+        raise
+    _local.last_used = time.monotonic()
@@ -2,14 +2,16 @@ import json
 import os
 import threading
 import time
+import uuid
 from typing import Any
 
-import pika
 import psycopg
 import redis
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query
 from pydantic import BaseModel
 
+import rabbit_publisher
+
 app = FastAPI()
 
 chaos_state = {"enabled": False, "mode": "error"}
@@ -17,14 +19,26 @@ chaos_state = {"enabled": False, "mode": "error"}
 metrics: dict[str, float] = {
     "reserve_total": 0,
     "reserve_failed_total": 0,
+    "reserve_batch_total": 0,
+    "reserve_batch_failed_total": 0,
     "confirm_total": 0,
     "confirm_failed_total": 0,
     "release_total": 0,
     "release_failed_total": 0,
     "ttl_released_total": 0,
+    "write_behind_applied_total": 0,
+    "write_behind_failed_total": 0,
+    "stock_reconcile_runs_total": 0,
+    "stock_reconcile_adjusted_total": 0,
+    "redis_stock_unavailable_total": 0,
+    "shard_fallback_total": 0,
+    "shard_rebalance_total": 0,
+    "shard_mirror_sync_total": 0,
 }
 reaper_state = {"running": True}
 
+MAX_BULK_STOCK_IDS = 100
+
 
 def _reservation_ttl_seconds() -> int:
     raw = os.getenv("RESERVATION_TTL_SECONDS", "300")
@@ -35,6 +49,47 @@ def _reservation_ttl_seconds() -> int:
         return 300
 
 
+def _stock_reservation_mode() -> str:
+    mode = os.getenv("STOCK_RESERVATION_MODE", "db").strip().lower()
+    return mode if mode in {"db", "redis"} else "db"
+
+
+def _write_behind_batch_size() -> int:
+    raw = os.getenv("STOCK_WRITE_BEHIND_BATCH_SIZE", "200")
+    try:
+        value = int(raw)
+        return value if value > 0 else 200
+    except ValueError:
+        return 200
+
+
+def _stock_reconcile_interval_seconds() -> int:
+    raw = os.getenv("STOCK_RECONCILE_INTERVAL_SECONDS", "30")
+    try:
+        value = int(raw)
+        return value if value > 0 else 30
+    except ValueError:
+        return 30
+
+
+def _stock_shard_rebalance_interval_seconds() -> int:
+    raw = os.getenv("STOCK_SHARD_REBALANCE_INTERVAL_SECONDS", "1")
+    try:
+        value = int(raw)
+        return value if value > 0 else 1
+    except ValueError:
+        return 1
+
+
+def _stock_shard_rebalance_skew() -> float:
+    raw = os.getenv("STOCK_SHARD_REBALANCE_SKEW", "0.5")
+    try:
+        value = float(raw)
+        return value if value >= 0 else 0.5
+    except ValueError:
+        return 0.5
+
+
 def _reservation_reaper_interval_seconds() -> int:
     raw = os.getenv("RESERVATION_REAPER_INTERVAL_SECONDS", "5")
     try:
@@ -54,40 +109,782 @@ def _db_conn():
     )
 
 
-def _redis_client():
-    return redis.Redis(
-        host=os.getenv("REDIS_HOST", "redis"),
-        port=int(os.getenv("REDIS_PORT", "6379")),
-        decode_responses=True,
-    )
+redis_state: dict[str, Any] = {"client": None, "scripts": {}}
+redis_lock = threading.Lock()
+
+
+def _redis_client() -> redis.Redis:
+    # redis.Redis pools its own connections; share one client across requests.
+    with redis_lock:
+        client = redis_state["client"]
+        if client is None:
+            client = redis.Redis(
+                host=os.getenv("REDIS_HOST", "redis"),
+                port=int(os.getenv("REDIS_PORT", "6379")),
+                decode_responses=True,
+            )
+            redis_state["client"] = client
+            redis_state["scripts"] = {}
+        return client
 
 
-def _rabbit_params() -> pika.ConnectionParameters:
-    host = os.getenv("RABBITMQ_HOST", "rabbitmq")
-    port = int(os.getenv("RABBITMQ_PORT", "5672"))
-    return pika.ConnectionParameters(host=host, port=port)
+def _redis_script(name: str) -> Any:
+    rc = _redis_client()
+    with redis_lock:
+        script = redis_state["scripts"].get(name)
+        if script is None:
+            script = rc.register_script(REDIS_STOCK_SCRIPTS[name])
+            redis_state["scripts"][name] = script
+        return script
 
 
 def _publish_cache_invalidation(event: str, item_id: str | None = None) -> None:
-    payload: dict[str, Any] = {"event": event, "ts": int(time.time())}
+    payload: dict[str, Any] = {"event": event, "ts": int(time.time()), "published_at": time.time()}
     if item_id:
         payload["item_id"] = item_id
     try:
-        connection = pika.BlockingConnection(_rabbit_params())
-        channel = connection.channel()
-        channel.queue_declare(queue="cache.invalidate", durable=True)
-        channel.basic_publish(
-            exchange="",
-            routing_key="cache.invalidate",
-            body=json.dumps(payload),
-            properties=pika.BasicProperties(delivery_mode=2),
-        )
-        connection.close()
+        # Fanout: every gateway replica has its own queue bound to this exchange.
+        rabbit_publisher.publish_fanout("cache.events", payload)
     except Exception:
         # Best effort only; stock correctness depends on DB locks/transactions.
         pass
 
 
+# Redis reservation mode: stock counters live in Redis and are decremented by
+# one Lua script per order; Postgres receives the reservation rows write-behind.
+REDIS_STOCK_KEY_PREFIX = "stock:qty:"
+REDIS_ORDER_KEY_PREFIX = "stock:order:"
+REDIS_ORDER_TTL_SECONDS = 86400
+WRITE_BEHIND_KEY = "stock:wb"
+WRITE_BEHIND_PROCESSING_KEY = "stock:wb:processing"
+WRITE_BEHIND_LEASE_KEY = "stock:wb:lease"
+WRITE_BEHIND_LEASE_SECONDS = 30
+WRITE_BEHIND_PUSHED_KEY = "stock:wb:pushed"
+WRITE_BEHIND_APPLIED_KEY = "stock:wb:applied"
+
+REDIS_STOCK_SCRIPTS: dict[str, str] = {
+    # KEYS: order hash, write-behind list, pushed counter, qty keys...
+    # ARGV: order_id, order ttl, then item_id/qty pairs matching the qty keys.
+    "reserve": """
+local n = #KEYS - 3
+local already = {}
+for i = 1, n do
+  local item = ARGV[1 + 2 * i]
+  local qty = tonumber(ARGV[2 + 2 * i])
+  local prior = redis.call('HGET', KEYS[1], item)
+  if prior then
+    if prior == 'R' then return {'released', item} end
+    if tonumber(prior) ~= qty then return {'qty_mismatch', item} end
+    already[i] = true
+  else
+    local have = redis.call('GET', KEYS[3 + i])
+    if not have then return {'missing', item} end
+    if tonumber(have) < qty then return {'insufficient', item} end
+  end
+end
+local result = {'ok'}
+for i = 1, n do
+  local item = ARGV[1 + 2 * i]
+  local qty = tonumber(ARGV[2 + 2 * i])
+  if already[i] then
+    table.insert(result, '1')
+  else
+    redis.call('DECRBY', KEYS[3 + i], qty)
+    redis.call('HSET', KEYS[1], item, qty)
+    redis.call('RPUSH', KEYS[2], cjson.encode({op = 'reserve', order_id = ARGV[1], item_id = item, qty = qty}))
+    redis.call('INCR', KEYS[3])
+    table.insert(result, '0')
+  end
+end
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return result
+""",
+    # KEYS: order hash, write-behind list, pushed counter.
+    # ARGV: order_id, qty key prefix, include hash lines ('1'/'0'), order ttl,
+    # then item_id/qty pairs already written to Postgres.
+    "release": """
+if redis.call('HGET', KEYS[1], '__confirmed') then return {} end
+local candidates = {}
+local items = {}
+if ARGV[3] == '1' then
+  local fields = redis.call('HGETALL', KEYS[1])
+  for i = 1, #fields, 2 do
+    if fields[i] ~= '__confirmed' then
+      candidates[fields[i]] = fields[i + 1]
+      table.insert(items, fields[i])
+    end
+  end
+end
+for i = 5, #ARGV, 2 do
+  local item = ARGV[i]
+  if candidates[item] == nil then
+    candidates[item] = redis.call('HGET', KEYS[1], item) or ARGV[i + 1]
+    table.insert(items, item)
+  end
+end
+local released = {}
+for _, item in ipairs(items) do
+  local qty = candidates[item]
+  if qty ~= 'R' then
+    if redis.call('EXISTS', ARGV[2] .. item) == 1 then
+      redis.call('INCRBY', ARGV[2] .. item, qty)
+    end
+    redis.call('HSET', KEYS[1], item, 'R')
+    redis.call('RPUSH', KEYS[2], cjson.encode({op = 'release', order_id = ARGV[1], item_id = item, qty = tonumber(qty)}))
+    redis.call('INCR', KEYS[3])
+    table.insert(released, item)
+  end
+end
+if #released > 0 then redis.call('EXPIRE', KEYS[1], ARGV[4]) end
+return released
+""",
+    # KEYS: order hash, write-behind list, pushed counter. ARGV: order_id, order ttl.
+    # The confirm rows queue behind this order's own reserve entries, so the
+    # caller never waits on the rest of the backlog.
+    "confirm": """
+if redis.call('EXISTS', KEYS[1]) == 0 then return 'missing' end
+if redis.call('HGET', KEYS[1], '__confirmed') then return 'already' end
+local fields = redis.call('HGETALL', KEYS[1])
+local live = 0
+for i = 1, #fields, 2 do
+  if fields[i + 1] ~= 'R' then
+    redis.call('RPUSH', KEYS[2], cjson.encode({op = 'confirm', order_id = ARGV[1], item_id = fields[i], qty = tonumber(fields[i + 1])}))
+    redis.call('INCR', KEYS[3])
+    live = live + 1
+  end
+end
+if live == 0 then return 'released' end
+redis.call('HSET', KEYS[1], '__confirmed', '1')
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return 'confirmed'
+""",
+    # KEYS: order hash. Marks an order confirmed through Postgres.
+    "mark_confirmed": """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+  redis.call('HSET', KEYS[1], '__confirmed', '1')
+end
+return 1
+""",
+    # KEYS: write-behind list, processing list, lease. ARGV: token, lease ttl, batch size.
+    # Leftovers in the processing list (a drainer died mid-batch) are replayed first.
+    "drain_claim": """
+if not redis.call('SET', KEYS[3], ARGV[1], 'NX', 'EX', ARGV[2]) then return false end
+if redis.call('LLEN', KEYS[2]) == 0 then
+  for i = 1, tonumber(ARGV[3]) do
+    local entry = redis.call('LPOP', KEYS[1])
+    if not entry then break end
+    redis.call('RPUSH', KEYS[2], entry)
+  end
+end
+return redis.call('LRANGE', KEYS[2], 0, -1)
+""",
+    # KEYS: processing list, lease, applied counter. ARGV: token, applied count.
+    "drain_ack": """
+if redis.call('GET', KEYS[2]) ~= ARGV[1] then return 0 end
+redis.call('DEL', KEYS[1])
+redis.call('INCRBY', KEYS[3], ARGV[2])
+redis.call('DEL', KEYS[2])
+return 1
+""",
+    # KEYS: lease. ARGV: token.
+    "lease_release": """
+if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('DEL', KEYS[1]) end
+return 0
+""",
+    # KEYS: write-behind list, processing list, lease.
+    # ARGV: token, qty key prefix, then item_id/db qty pairs. The caller holds the
+    # lease so nothing is applied to Postgres between its read and this script;
+    # entries still queued are netted out of the Postgres quantity.
+    "reconcile": """
+if redis.call('GET', KEYS[3]) ~= ARGV[1] then return -1 end
+if redis.call('LLEN', KEYS[2]) > 0 then return -1 end
+local pending = {}
+for _, raw in ipairs(redis.call('LRANGE', KEYS[1], 0, -1)) do
+  local entry = cjson.decode(raw)
+  local delta = tonumber(entry.qty)
+  if entry.op == 'reserve' then delta = -delta elseif entry.op == 'confirm' then delta = 0 end
+  pending[entry.item_id] = (pending[entry.item_id] or 0) + delta
+end
+local adjusted = 0
+for i = 3, #ARGV, 2 do
+  local item = ARGV[i]
+  local want = tonumber(ARGV[i + 1]) + (pending[item] or 0)
+  if want < 0 then want = 0 end
+  local key = ARGV[2] .. item
+  local have = redis.call('GET', key)
+  if not have or tonumber(have) ~= want then
+    redis.call('SET', key, want)
+    adjusted = adjusted + 1
+  end
+end
+return adjusted
+""",
+}
+
+RESERVE_WRITE_BEHIND_SQL = """
+WITH inserted AS (
+    INSERT INTO stock_reservations(order_id, item_id, qty, status)
+    VALUES (%s, %s, %s, 'RESERVED')
+    ON CONFLICT (order_id, item_id) DO NOTHING
+    RETURNING item_id, qty
+)
+UPDATE menu_items m
+SET stock_quantity = GREATEST(m.stock_quantity - i.qty, 0),
+    available = m.stock_quantity - i.qty > 0
+FROM inserted i
+WHERE m.id = i.item_id
+"""
+
+RELEASE_WRITE_BEHIND_SQL = """
+WITH released AS (
+    UPDATE stock_reservations
+    SET status = 'RELEASED'
+    WHERE order_id = %s
+      AND item_id = %s
+      AND status = 'RESERVED'
+      AND confirmed_at IS NULL
+    RETURNING item_id, qty
+)
+UPDATE menu_items m
+SET stock_quantity = m.stock_quantity + r.qty,
+    available = TRUE
+FROM released r
+WHERE m.id = r.item_id
+"""
+
+CONFIRM_WRITE_BEHIND_SQL = """
+UPDATE stock_reservations
+SET confirmed_at = NOW()
+WHERE order_id = %s
+  AND item_id = %s
+  AND status = 'RESERVED'
+  AND confirmed_at IS NULL
+"""
+
+write_behind_state = {"running": True}
+
+
+def _load_redis_stock(item_ids: list[str]) -> None:
+    with _db_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT id, stock_quantity FROM menu_items WHERE id = ANY(%s)", (item_ids,))
+            rows = cur.fetchall()
+    pipe = _redis_client().pipeline(transaction=False)
+    for item_id, qty in rows:
+        # NX: never clobber a live counter; drift is the reconciler's job.
+        pipe.set(f"{REDIS_STOCK_KEY_PREFIX}{item_id}", int(qty), nx=True)
+    pipe.execute()
+
+
+def _redis_reserve(order_id: str, wanted: dict[str, int]) -> dict[str, bool]:
+    item_ids = sorted(wanted)
+    keys = [f"{REDIS_ORDER_KEY_PREFIX}{order_id}", WRITE_BEHIND_KEY, WRITE_BEHIND_PUSHED_KEY]
+    keys += [f"{REDIS_STOCK_KEY_PREFIX}{item_id}" for item_id in item_ids]
+    args: list[Any] = [order_id, REDIS_ORDER_TTL_SECONDS]
+    for item_id in item_ids:
+        args += [item_id, wanted[item_id]]
+
+    for attempt in range(2):
+        try:
+            result = _redis_script("reserve")(keys=keys, args=args)
+        except redis.RedisError:
+            metrics["redis_stock_unavailable_total"] += 1
+            raise HTTPException(status_code=503, detail="Stock counters unavailable")
+        status = result[0]
+        if status == "ok":
+            return {item_id: flag == "1" for item_id, flag in zip(item_ids, result[1:])}
+        if status == "missing" and attempt == 0:
+            _load_redis_stock(item_ids)
+            continue
+        item_id = result[1]
+        if status == "missing":
+            raise HTTPException(status_code=404, detail=f"Item {item_id} not found")
+        if status == "released":
+            raise HTTPException(status_code=409, detail="Reservation already released")
+        if status == "qty_mismatch":
+            raise HTTPException(status_code=409, detail="Reservation exists with different qty")
+        raise HTTPException(status_code=409, detail=f"Insufficient stock for item {item_id}")
+    raise HTTPException(status_code=503, detail="Stock counters unavailable")
+
+
+def _redis_release(order_id: str, rows: list[tuple[str, int]], include_order_lines: bool) -> list[str]:
+    args: list[Any] = [order_id, REDIS_STOCK_KEY_PREFIX, "1" if include_order_lines else "0", REDIS_ORDER_TTL_SECONDS]
+    for item_id, qty in rows:
+        args += [str(item_id), int(qty)]
+    released = _redis_script("release")(
+        keys=[f"{REDIS_ORDER_KEY_PREFIX}{order_id}", WRITE_BEHIND_KEY, WRITE_BEHIND_PUSHED_KEY],
+        args=args,
+    )
+    for item_id in released:
+        _publish_cache_invalidation("stock.changed", item_id=str(item_id))
+    return list(released)
+
+
+def _redis_confirm(order_id: str) -> str:
+    """Confirm from the order hash: confirmed, already, released, or missing (not reserved in Redis)."""
+    try:
+        return _redis_script("confirm")(
+            keys=[f"{REDIS_ORDER_KEY_PREFIX}{order_id}", WRITE_BEHIND_KEY, WRITE_BEHIND_PUSHED_KEY],
+            args=[order_id, REDIS_ORDER_TTL_SECONDS],
+        )
+    except redis.RedisError:
+        metrics["redis_stock_unavailable_total"] += 1
+        raise HTTPException(status_code=503, detail="Stock counters unavailable")
+
+
+def _redis_mark_confirmed(order_id: str) -> None:
+    try:
+        _redis_script("mark_confirmed")(keys=[f"{REDIS_ORDER_KEY_PREFIX}{order_id}"])
+    except redis.RedisError:
+        # A later release would bump the counter once; the reconciler repairs it.
+        pass
+
+
+def _apply_write_behind(entries: list[str]) -> None:
+    reserves: list[tuple[str, str, int]] = []
+    releases: list[tuple[str, str]] = []
+    confirms: list[tuple[str, str]] = []
+    for raw in entries:
+        entry = json.loads(raw)
+        if entry.get("op") == "release":
+            releases.append((entry["order_id"], entry["item_id"]))
+        elif entry.get("op") == "confirm":
+            confirms.append((entry["order_id"], entry["item_id"]))
+        else:
+            reserves.append((entry["order_id"], entry["item_id"], int(entry["qty"])))
+
+    with _db_conn() as conn:
+        try:
+            with conn.cursor() as cur:
+                # Reserves first: a release or confirm in the same batch always
+                # follows its reserve, and a line is never both released and confirmed.
+                if reserves:
+                    cur.executemany(RESERVE_WRITE_BEHIND_SQL, reserves)
+                if releases:
+                    cur.executemany(RELEASE_WRITE_BEHIND_SQL, releases)
+                if confirms:
+                    cur.executemany(CONFIRM_WRITE_BEHIND_SQL, confirms)
+            conn.commit()
+            return
+        except psycopg.Error:
+            conn.rollback()
+
+        # One bad entry (e.g. an item deleted meanwhile) must not wedge the queue.
+        for sql, params_list in (
+            (RESERVE_WRITE_BEHIND_SQL, reserves),
+            (RELEASE_WRITE_BEHIND_SQL, releases),
+            (CONFIRM_WRITE_BEHIND_SQL, confirms),
+        ):
+            for params in params_list:
+                try:
+                    with conn.cursor() as cur:
+                        cur.execute(sql, params)
+                    conn.commit()
+                except psycopg.Error:
+                    conn.rollback()
+                    metrics["write_behind_failed_total"] += 1
+
+
+def _drain_write_behind_once() -> int | None:
+    token = uuid.uuid4().hex
+    entries = _redis_script("drain_claim")(
+        keys=[WRITE_BEHIND_KEY, WRITE_BEHIND_PROCESSING_KEY, WRITE_BEHIND_LEASE_KEY],
+        args=[token, WRITE_BEHIND_LEASE_SECONDS, _write_behind_batch_size()],
+    )
+    if entries is None:
+        # Another drainer holds the lease.
+        return None
+    if not entries:
+        _redis_script("lease_release")(keys=[WRITE_BEHIND_LEASE_KEY], args=[token])
+        return 0
+    try:
+        _apply_write_behind(entries)
+    except Exception:
+        _redis_script("lease_release")(keys=[WRITE_BEHIND_LEASE_KEY], args=[token])
+        raise
+    _redis_script("drain_ack")(
+        keys=[WRITE_BEHIND_PROCESSING_KEY, WRITE_BEHIND_LEASE_KEY, WRITE_BEHIND_APPLIED_KEY],
+        args=[token, len(entries)],
+    )
+    metrics["write_behind_applied_total"] += len(entries)
+    return len(entries)
+
+
+def _write_behind_backlog() -> int | None:
+    try:
+        rc = _redis_client()
+        return max(int(rc.get(WRITE_BEHIND_PUSHED_KEY) or 0) - int(rc.get(WRITE_BEHIND_APPLIED_KEY) or 0), 0)
+    except redis.RedisError:
+        return None
+
+
+def _reconcile_redis_stock_once() -> int | None:
+    rc = _redis_client()
+    token = uuid.uuid4().hex
+    if not rc.set(WRITE_BEHIND_LEASE_KEY, token, nx=True, ex=WRITE_BEHIND_LEASE_SECONDS):
+        return None
+    try:
+        with _db_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT id, stock_quantity FROM menu_items")
+                rows = cur.fetchall()
+        args: list[Any] = [token, REDIS_STOCK_KEY_PREFIX]
+        for item_id, qty in rows:
+            args += [str(item_id), int(qty)]
+        adjusted = int(
+            _redis_script("reconcile")(
+                keys=[WRITE_BEHIND_KEY, WRITE_BEHIND_PROCESSING_KEY, WRITE_BEHIND_LEASE_KEY],
+                args=args,
+            )
+        )
+    finally:
+        _redis_script("lease_release")(keys=[WRITE_BEHIND_LEASE_KEY], args=[token])
+    if adjusted < 0:
+        return None
+    metrics["stock_reconcile_runs_total"] += 1
+    metrics["stock_reconcile_adjusted_total"] += adjusted
+    return adjusted
+
+
+def _write_behind_loop() -> None:
+    reconcile_interval = _stock_reconcile_interval_seconds()
+    last_reconcile = 0.0
+    while write_behind_state["running"]:
+        try:
+            drained = _drain_write_behind_once()
+        except Exception:
+            drained = None
+        if time.monotonic() - last_reconcile >= reconcile_interval:
+            last_reconcile = time.monotonic()
+            try:
+                _reconcile_redis_stock_once()
+            except Exception:
+                pass
+        if not drained:
+            time.sleep(0.05)
+
+
+# Idempotency check, guarded decrement and reservation insert in one round trip.
+# Every CTE shares one snapshot, so a concurrent insert of the same order+item
+# shows up as taken without inserted; the caller rolls back and re-reads.
+RESERVE_ONE_SQL = """
+WITH existing AS (
+    SELECT qty, status, confirmed_at
+    FROM stock_reservations
+    WHERE order_id = %(order_id)s AND item_id = %(item_id)s
+),
+taken AS (
+    UPDATE menu_items
+    SET stock_quantity = stock_quantity - %(qty)s,
+        available = stock_quantity - %(qty)s > 0
+    WHERE id = %(item_id)s
+      AND stock_quantity >= %(qty)s
+      AND NOT EXISTS (SELECT 1 FROM existing)
+      AND NOT EXISTS (SELECT 1 FROM stock_shards WHERE item_id = %(item_id)s)
+    RETURNING id
+),
+inserted AS (
+    INSERT INTO stock_reservations(order_id, item_id, qty, status)
+    SELECT %(order_id)s, id, %(qty)s, 'RESERVED'
+    FROM taken
+    ON CONFLICT (order_id, item_id) DO NOTHING
+    RETURNING id
+)
+SELECT
+    (SELECT COUNT(*) FROM taken),
+    (SELECT COUNT(*) FROM inserted),
+    (SELECT qty FROM existing),
+    (SELECT status FROM existing),
+    (SELECT confirmed_at IS NOT NULL FROM existing),
+    EXISTS (SELECT 1 FROM menu_items WHERE id = %(item_id)s),
+    EXISTS (SELECT 1 FROM stock_shards WHERE item_id = %(item_id)s)
+"""
+
+
+# Hot-item sharding: a sharded item's stock lives in stock_buckets rows and
+# menu_items.stock_quantity becomes a mirror the rebalancer keeps in sync.
+MAX_STOCK_SHARDS = 64
+
+
+def _sharded_items(cur: Any, item_ids: list[str]) -> set[str]:
+    # FOR SHARE: a sharded item cannot be folded back or re-split until the caller commits.
+    cur.execute(
+        "SELECT item_id FROM stock_shards WHERE item_id = ANY(%s) ORDER BY item_id FOR SHARE",
+        (item_ids,),
+    )
+    return {row[0] for row in cur.fetchall()}
+
+
+def _even_split(total: int, bucket_count: int) -> list[int]:
+    return [total // bucket_count + (1 if i < total % bucket_count else 0) for i in range(bucket_count)]
+
+
+def _take_sharded_stock(cur: Any, item_id: str, qty: int) -> bool:
+    # Fast path: any one unlocked bucket that can cover the whole line.
+    cur.execute(
+        """
+        SELECT bucket_no
+        FROM stock_buckets
+        WHERE item_id = %s AND qty >= %s
+        ORDER BY random()
+        LIMIT 1
+        FOR UPDATE SKIP LOCKED
+        """,
+        (item_id, qty),
+    )
+    row = cur.fetchone()
+    if row:
+        cur.execute(
+            "UPDATE stock_buckets SET qty = qty - %s WHERE item_id = %s AND bucket_no = %s",
+            (qty, item_id, row[0]),
+        )
+        return True
+
+    # Fallback: wait for every bucket in bucket order and take across them.
+    metrics["shard_fallback_total"] += 1
+    cur.execute(
+        """
+        SELECT bucket_no, qty
+        FROM stock_buckets
+        WHERE item_id = %s
+        ORDER BY bucket_no
+        FOR UPDATE
+        """,
+        (item_id,),
+    )
+    buckets = [(int(r[0]), int(r[1])) for r in cur.fetchall()]
+    if sum(have for _, have in buckets) < qty:
+        return False
+    remaining = qty
+    takes: list[tuple[int, int]] = []
+    for bucket_no, have in buckets:
+        if remaining <= 0:
+            break
+        take = min(have, remaining)
+        if take > 0:
+            takes.append((bucket_no, take))
+            remaining -= take
+    cur.execute(
+        """
+        UPDATE stock_buckets b
+        SET qty = b.qty - t.take
+        FROM unnest(%s::int[], %s::int[]) AS t(bucket_no, take)
+        WHERE b.item_id = %s AND b.bucket_no = t.bucket_no
+        """,
+        ([t[0] for t in takes], [t[1] for t in takes], item_id),
+    )
+    return True
+
+
+def _return_stock(cur: Any, item_id: str, qty: int) -> None:
+    cur.execute(
+        """
+        WITH target AS (
+            SELECT item_id, floor(random() * bucket_count)::int AS bucket_no
+            FROM stock_shards
+            WHERE item_id = %s
+        )
+        UPDATE stock_buckets b
+        SET qty = b.qty + %s
+        FROM target t
+        WHERE b.item_id = t.item_id AND b.bucket_no = t.bucket_no
+        """,
+        (item_id, qty),
+    )
+    if cur.rowcount:
+        return
+    cur.execute(
+        """
+        UPDATE menu_items
+        SET stock_quantity = stock_quantity + %s,
+            available = TRUE
+        WHERE id = %s
+        """,
+        (qty, item_id),
+    )
+
+
+def _write_item_shards(cur: Any, item_id: str, bucket_count: int, total: int) -> None:
+    cur.execute(
+        """
+        INSERT INTO stock_shards(item_id, bucket_count, synced_total)
+        VALUES (%s, %s, %s)
+        ON CONFLICT (item_id) DO UPDATE
+        SET bucket_count = EXCLUDED.bucket_count,
+            synced_total = EXCLUDED.synced_total,
+            updated_at = NOW()
+        """,
+        (item_id, bucket_count, total),
+    )
+    cur.execute("DELETE FROM stock_buckets WHERE item_id = %s", (item_id,))
+    cur.execute(
+        """
+        INSERT INTO stock_buckets(item_id, bucket_no, qty)
+        SELECT %s, bucket_no - 1, qty
+        FROM unnest(%s::int[]) WITH ORDINALITY AS split(qty, bucket_no)
+        """,
+        (item_id, _even_split(total, bucket_count)),
+    )
+    cur.execute(
+        "UPDATE menu_items SET stock_quantity = %s, available = %s WHERE id = %s",
+        (total, total > 0, item_id),
+    )
+
+
+def _lock_item_shards(cur: Any, item_id: str) -> tuple[int, int, list[int], int] | None:
+    """Lock an item's stock rows; returns (mirror qty, bucket count, bucket qtys, live total)."""
+    cur.execute("SELECT stock_quantity FROM menu_items WHERE id = %s FOR UPDATE", (item_id,))
+    row = cur.fetchone()
+    if not row:
+        return None
+    mirror = int(row[0])
+    cur.execute("SELECT bucket_count, synced_total FROM stock_shards WHERE item_id = %s FOR UPDATE", (item_id,))
+    shard = cur.fetchone()
+    if not shard:
+        return mirror, 1, [], mirror
+    cur.execute(
+        "SELECT qty FROM stock_buckets WHERE item_id = %s ORDER BY bucket_no FOR UPDATE",
+        (item_id,),
+    )
+    buckets = [int(r[0]) for r in cur.fetchall()]
+    return mirror, int(shard[0]), buckets, _live_shard_total(mirror, int(shard[1]), sum(buckets))
+
+
+def _live_shard_total(mirror: int, synced_total: int, bucket_total: int) -> int:
+    # An admin edit writes an absolute quantity to the mirror. The mirror may
+    # lag the buckets, so the edit replaces the bucket total instead of being
+    # applied to it as a delta.
+    return max(mirror, 0) if mirror != synced_total else bucket_total
+
+
+def _shards_skewed(buckets: list[int], total: int) -> bool:
+    """True once the bucket spread is wide enough to be worth locking every bucket."""
+    if not buckets:
+        return False
+    # An even split never spreads by more than one unit.
+    allowed = max(total / len(buckets) * _stock_shard_rebalance_skew(), 1)
+    return max(buckets) - min(buckets) > allowed
+
+
+SHARD_STATE_SQL = """
+SELECT s.item_id, s.bucket_count, s.synced_total, m.stock_quantity,
+       array_agg(b.qty ORDER BY b.bucket_no) FILTER (WHERE b.bucket_no IS NOT NULL)
+FROM stock_shards s
+JOIN menu_items m ON m.id = s.item_id
+LEFT JOIN stock_buckets b ON b.item_id = s.item_id
+GROUP BY s.item_id, s.bucket_count, s.synced_total, m.stock_quantity
+ORDER BY s.item_id
+"""
+
+
+def _sync_item_mirror(cur: Any, item_id: str) -> tuple[int, int] | None:
+    """Copy the bucket total into menu_items; returns (old mirror, new mirror).
+
+    Only the menu_items and stock_shards rows are locked, so reservations
+    keep taking from the buckets meanwhile.
+    """
+    cur.execute("SELECT stock_quantity FROM menu_items WHERE id = %s FOR UPDATE", (item_id,))
+    row = cur.fetchone()
+    cur.execute("SELECT synced_total FROM stock_shards WHERE item_id = %s FOR UPDATE", (item_id,))
+    shard = cur.fetchone()
+    if not row or not shard or int(row[0]) != int(shard[0]):
+        # Gone, or an admin edit arrived: the locked rebalance folds that in.
+        return None
+    cur.execute("SELECT COALESCE(SUM(qty), 0) FROM stock_buckets WHERE item_id = %s", (item_id,))
+    total = int(cur.fetchone()[0])
+    cur.execute(
+        "UPDATE menu_items SET stock_quantity = %s, available = %s WHERE id = %s",
+        (total, total > 0, item_id),
+    )
+    cur.execute(
+        "UPDATE stock_shards SET synced_total = %s, updated_at = NOW() WHERE item_id = %s",
+        (total, item_id),
+    )
+    return int(row[0]), total
+
+
+def _rebalance_item_buckets(cur: Any, item_id: str, bucket_count: int, total: int) -> None:
+    # Rewrite only the buckets whose quantity changes; rows stay in place.
+    cur.execute(
+        """
+        UPDATE stock_buckets b
+        SET qty = split.qty
+        FROM unnest(%s::int[]) WITH ORDINALITY AS split(qty, bucket_no)
+        WHERE b.item_id = %s AND b.bucket_no = split.bucket_no - 1 AND b.qty <> split.qty
+        """,
+        (_even_split(total, bucket_count), item_id),
+    )
+    cur.execute(
+        "UPDATE stock_shards SET synced_total = %s, updated_at = NOW() WHERE item_id = %s",
+        (total, item_id),
+    )
+    cur.execute(
+        "UPDATE menu_items SET stock_quantity = %s, available = %s WHERE id = %s",
+        (total, total > 0, item_id),
+    )
+
+
+def _rebalance_stock_shards_once() -> int:
+    """Keep sharded items' mirrors current and even out skewed buckets; returns items rebalanced."""
+    # Unlocked snapshot: decides which items need any row locks at all.
+    with _db_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(SHARD_STATE_SQL)
+            states = cur.fetchall()
+
+    rebalanced = 0
+    for item_id, bucket_count, synced_total, mirror, buckets in states:
+        buckets = [int(qty) for qty in buckets or []]
+        pending_edit = int(mirror) != int(synced_total)
+        total = _live_shard_total(int(mirror), int(synced_total), sum(buckets))
+        if (
+            not pending_edit
+            and len(buckets) == int(bucket_count)
+            and not _shards_skewed(buckets, total)
+        ):
+            if sum(buckets) == int(synced_total):
+                continue
+            with _db_conn() as conn:
+                with conn.cursor() as cur:
+                    synced = _sync_item_mirror(cur, item_id)
+                    conn.commit()
+            if synced is None:
+                continue
+            metrics["shard_mirror_sync_total"] += 1
+            before, after = synced
+        else:
+            with _db_conn() as conn:
+                with conn.cursor() as cur:
+                    locked = _lock_item_shards(cur, item_id)
+                    if locked is None:
+                        continue
+                    before, bucket_count, buckets, after = locked
+                    if bucket_count == 1:
+                        # Unsharded since the snapshot.
+                        continue
+                    if len(buckets) != bucket_count:
+                        _write_item_shards(cur, item_id, bucket_count, after)
+                    else:
+                        _rebalance_item_buckets(cur, item_id, bucket_count, after)
+                    conn.commit()
+            rebalanced += 1
+        # The gateway only caches sold-out items, so only a flip needs invalidating.
+        if (before > 0) != (after > 0):
+            _publish_cache_invalidation("stock.changed", item_id=item_id)
+    metrics["shard_rebalance_total"] += rebalanced
+    return rebalanced
+
+
+def _stock_shard_rebalancer_loop() -> None:
+    interval = _stock_shard_rebalance_interval_seconds()
+    while reaper_state["running"]:
+        try:
+            _rebalance_stock_shards_once()
+        except Exception:
+            pass
+        time.sleep(interval)
+
+
 def _should_fail() -> None:
     if not chaos_state["enabled"]:
         return
@@ -102,6 +899,16 @@ class ReserveRequest(BaseModel):
     qty: int
 
 
+class ReserveBatchLine(BaseModel):
+    item_id: str
+    qty: int
+
+
+class ReserveBatchRequest(BaseModel):
+    order_id: str
+    items: list[ReserveBatchLine]
+
+
 class ReleaseRequest(BaseModel):
     order_id: str
 
@@ -110,6 +917,10 @@ class ConfirmRequest(BaseModel):
     order_id: str
 
 
+class ShardConfigRequest(BaseModel):
+    bucket_count: int
+
+
 class ChaosRequest(BaseModel):
     enabled: bool
     mode: str = "error"
@@ -125,11 +936,34 @@ def _ensure_stock_reservation_schema() -> None:
                 ON stock_reservations(status, confirmed_at, created_at)
                 """
             )
+            # Same tables as database/migrations/018_stock_shards.sql.
+            cur.execute(
+                """
+                CREATE TABLE IF NOT EXISTS stock_shards (
+                    item_id TEXT PRIMARY KEY REFERENCES menu_items(id) ON DELETE CASCADE,
+                    bucket_count INTEGER NOT NULL CHECK (bucket_count > 1),
+                    synced_total INTEGER NOT NULL DEFAULT 0,
+                    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+                )
+                """
+            )
+            cur.execute(
+                """
+                CREATE TABLE IF NOT EXISTS stock_buckets (
+                    item_id TEXT NOT NULL REFERENCES stock_shards(item_id) ON DELETE CASCADE,
+                    bucket_no INTEGER NOT NULL CHECK (bucket_no >= 0),
+                    qty INTEGER NOT NULL CHECK (qty >= 0),
+                    PRIMARY KEY (item_id, bucket_no)
+                )
+                """
+            )
             conn.commit()
 
 
 def _release_expired_reservations_once() -> int:
     ttl_seconds = _reservation_ttl_seconds()
+    if _stock_reservation_mode() == "redis":
+        return _release_expired_reservations_redis(ttl_seconds)
     released = 0
     with _db_conn() as conn:
         with conn.cursor() as cur:
@@ -147,15 +981,7 @@ def _release_expired_reservations_once() -> int:
             )
             rows = cur.fetchall()
             for reservation_id, item_id, qty in rows:
-                cur.execute(
-                    """
-                    UPDATE menu_items
-                    SET stock_quantity = stock_quantity + %s,
-                        available = TRUE
-                    WHERE id = %s
-                    """,
-                    (qty, item_id),
-                )
+                _return_stock(cur, item_id, qty)
                 cur.execute(
                     """
                     UPDATE stock_reservations
@@ -172,6 +998,31 @@ def _release_expired_reservations_once() -> int:
     return released
 
 
+def _release_expired_reservations_redis(ttl_seconds: int) -> int:
+    # Counters are returned in Redis; the drainer applies the release rows.
+    with _db_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT order_id, item_id, qty
+                FROM stock_reservations
+                WHERE status = 'RESERVED'
+                  AND confirmed_at IS NULL
+                  AND created_at <= NOW() - (%s || ' seconds')::interval
+                LIMIT 100
+                """,
+                (ttl_seconds,),
+            )
+            rows = cur.fetchall()
+    by_order: dict[str, list[tuple[str, int]]] = {}
+    for order_id, item_id, qty in rows:
+        by_order.setdefault(order_id, []).append((item_id, int(qty)))
+    released = 0
+    for order_id, lines in by_order.items():
+        released += len(_redis_release(order_id, lines, include_order_lines=False))
+    return released
+
+
 def _reservation_reaper_loop() -> None:
     interval = _reservation_reaper_interval_seconds()
     while reaper_state["running"]:
@@ -188,11 +1039,16 @@ def _reservation_reaper_loop() -> None:
 def on_startup() -> None:
     _ensure_stock_reservation_schema()
     threading.Thread(target=_reservation_reaper_loop, daemon=True).start()
+    threading.Thread(target=_stock_shard_rebalancer_loop, daemon=True).start()
+    if _stock_reservation_mode() == "redis":
+        threading.Thread(target=_write_behind_loop, daemon=True).start()
 
 
 @app.on_event("shutdown")
 def on_shutdown() -> None:
     reaper_state["running"] = False
+    write_behind_state["running"] = False
+    rabbit_publisher.close_all()
 
 
 @app.get("/health")
@@ -222,11 +1078,25 @@ def get_metrics():
     return {
         "reserve_total": metrics["reserve_total"],
         "reserve_failed_total": metrics["reserve_failed_total"],
+        "reserve_batch_total": metrics["reserve_batch_total"],
+        "reserve_batch_failed_total": metrics["reserve_batch_failed_total"],
         "confirm_total": metrics["confirm_total"],
         "confirm_failed_total": metrics["confirm_failed_total"],
         "release_total": metrics["release_total"],
         "release_failed_total": metrics["release_failed_total"],
         "ttl_released_total": metrics["ttl_released_total"],
+        "rabbit_connections_opened_total": rabbit_publisher.metrics["connections_opened_total"],
+        "rabbit_publish_retries_total": rabbit_publisher.metrics["publish_retries_total"],
+        "stock_reservation_mode": _stock_reservation_mode(),
+        "write_behind_applied_total": metrics["write_behind_applied_total"],
+        "write_behind_failed_total": metrics["write_behind_failed_total"],
+        "write_behind_backlog": _write_behind_backlog() if _stock_reservation_mode() == "redis" else 0,
+        "stock_reconcile_runs_total": metrics["stock_reconcile_runs_total"],
+        "stock_reconcile_adjusted_total": metrics["stock_reconcile_adjusted_total"],
+        "redis_stock_unavailable_total": metrics["redis_stock_unavailable_total"],
+        "shard_fallback_total": metrics["shard_fallback_total"],
+        "shard_rebalance_total": metrics["shard_rebalance_total"],
+        "shard_mirror_sync_total": metrics["shard_mirror_sync_total"],
     }
 
 
@@ -237,17 +1107,128 @@ def chaos_fail(payload: ChaosRequest):
     return {"status": "ok", "chaos": chaos_state}
 
 
+def _stock_levels(item_ids: list[str]) -> dict[str, dict[str, Any]]:
+    with _db_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT m.id, m.name, m.available, m.stock_quantity,
+                       CASE
+                           WHEN s.item_id IS NULL THEN NULL
+                           WHEN m.stock_quantity <> s.synced_total THEN GREATEST(m.stock_quantity, 0)
+                           ELSE COALESCE(b.total, 0)
+                       END
+                FROM menu_items m
+                LEFT JOIN stock_shards s ON s.item_id = m.id
+                LEFT JOIN (
+                    SELECT item_id, SUM(qty) AS total
+                    FROM stock_buckets
+                    WHERE item_id = ANY(%s)
+                    GROUP BY item_id
+                ) b ON b.item_id = m.id
+                WHERE m.id = ANY(%s)
+                """,
+                (item_ids, item_ids),
+            )
+            rows = cur.fetchall()
+
+    levels: dict[str, dict[str, Any]] = {}
+    for item_id, name, available, stock_quantity, sharded_total in rows:
+        level = {"id": item_id, "name": name, "available": bool(available), "stock_quantity": int(stock_quantity)}
+        if sharded_total is not None:
+            level["stock_quantity"] = int(sharded_total)
+            level["available"] = level["stock_quantity"] > 0
+        levels[item_id] = level
+
+    if _stock_reservation_mode() == "redis" and levels:
+        found = list(levels)
+        try:
+            counters = _redis_client().mget([f"{REDIS_STOCK_KEY_PREFIX}{item_id}" for item_id in found])
+        except redis.RedisError:
+            counters = [None] * len(found)
+        for item_id, counter in zip(found, counters):
+            if counter is not None:
+                levels[item_id]["stock_quantity"] = int(counter)
+                levels[item_id]["available"] = levels[item_id]["available"] and int(counter) > 0
+    return levels
+
+
+@app.get("/stock")
+def get_stock_bulk(ids: str = Query(default="")):
+    _should_fail()
+
+    item_ids = list(dict.fromkeys(part.strip() for part in ids.split(",") if part.strip()))
+    if not item_ids:
+        raise HTTPException(status_code=422, detail="ids must not be empty")
+    if len(item_ids) > MAX_BULK_STOCK_IDS:
+        raise HTTPException(status_code=422, detail=f"At most {MAX_BULK_STOCK_IDS} ids per request")
+
+    levels = _stock_levels(item_ids)
+    return {
+        "items": [levels[item_id] for item_id in item_ids if item_id in levels],
+        "missing": [item_id for item_id in item_ids if item_id not in levels],
+    }
+
+
 @app.get("/stock/{item_id}")
 def get_stock(item_id: str):
     _should_fail()
 
+    level = _stock_levels([item_id]).get(item_id)
+    if not level:
+        raise HTTPException(status_code=404, detail="Item not found")
+    return level
+
+
+@app.get("/stock/{item_id}/shards")
+def get_stock_shards(item_id: str):
+    _should_fail()
+
     with _db_conn() as conn:
         with conn.cursor() as cur:
-            cur.execute("SELECT id, name, available, stock_quantity FROM menu_items WHERE id = %s", (item_id,))
-            row = cur.fetchone()
-            if not row:
+            cur.execute("SELECT 1 FROM menu_items WHERE id = %s", (item_id,))
+            if not cur.fetchone():
                 raise HTTPException(status_code=404, detail="Item not found")
-            return {"id": row[0], "name": row[1], "available": bool(row[2]), "stock_quantity": int(row[3])}
+            cur.execute(
+                "SELECT bucket_no, qty FROM stock_buckets WHERE item_id = %s ORDER BY bucket_no",
+                (item_id,),
+            )
+            buckets = [{"bucket_no": int(row[0]), "qty": int(row[1])} for row in cur.fetchall()]
+    return {
+        "item_id": item_id,
+        "bucket_count": len(buckets) or 1,
+        "buckets": buckets,
+        "stock_quantity": sum(bucket["qty"] for bucket in buckets) if buckets else None,
+    }
+
+
+@app.put("/stock/{item_id}/shards")
+def set_stock_shards(item_id: str, payload: ShardConfigRequest):
+    _should_fail()
+    if payload.bucket_count < 1 or payload.bucket_count > MAX_STOCK_SHARDS:
+        raise HTTPException(status_code=422, detail=f"bucket_count must be between 1 and {MAX_STOCK_SHARDS}")
+    if _stock_reservation_mode() == "redis" and payload.bucket_count > 1:
+        raise HTTPException(status_code=409, detail="Stock sharding requires STOCK_RESERVATION_MODE=db")
+
+    with _db_conn() as conn:
+        with conn.cursor() as cur:
+            locked = _lock_item_shards(cur, item_id)
+            if locked is None:
+                raise HTTPException(status_code=404, detail="Item not found")
+            _, _, _, total = locked
+            if payload.bucket_count == 1:
+                # Fold the buckets back into the menu_items row.
+                cur.execute("DELETE FROM stock_shards WHERE item_id = %s", (item_id,))
+                cur.execute(
+                    "UPDATE menu_items SET stock_quantity = %s, available = %s WHERE id = %s",
+                    (total, total > 0, item_id),
+                )
+            else:
+                _write_item_shards(cur, item_id, payload.bucket_count, total)
+            conn.commit()
+
+    _publish_cache_invalidation("stock.changed", item_id=item_id)
+    return {"item_id": item_id, "bucket_count": payload.bucket_count, "stock_quantity": total}
 
 
 @app.post("/stock/reserve")
@@ -259,92 +1240,197 @@ def reserve_stock(payload: ReserveRequest):
         metrics["reserve_failed_total"] += 1
         raise HTTPException(status_code=422, detail="qty must be positive")
 
-    rc = None
-    try:
-        rc = _redis_client()
-    except Exception:
-        rc = None
-    lock_key = f"lock:reserve:{payload.order_id}:{payload.item_id}"
-    got_lock = True
-    if rc is not None:
+    if _stock_reservation_mode() == "redis":
         try:
-            got_lock = bool(rc.set(lock_key, "1", ex=10, nx=True))
-        except Exception:
-            # Redis lock degraded; continue with DB transactional lock as source of truth.
-            got_lock = True
-    if not got_lock:
-        metrics["reserve_failed_total"] += 1
-        raise HTTPException(status_code=409, detail="Reservation already in progress")
+            already = _redis_reserve(payload.order_id, {payload.item_id: payload.qty})[payload.item_id]
+        except HTTPException:
+            metrics["reserve_failed_total"] += 1
+            raise
+        if not already:
+            _publish_cache_invalidation("stock.changed", item_id=payload.item_id)
+        return {
+            "reserved": True,
+            "already_reserved": already,
+            "order_id": payload.order_id,
+            "item_id": payload.item_id,
+            "qty": payload.qty,
+        }
 
+    params = {"order_id": payload.order_id, "item_id": payload.item_id, "qty": payload.qty}
     try:
-        with _db_conn() as conn:
-            with conn.cursor() as cur:
-                # Idempotency: same order+item repeated should not deduct again.
-                cur.execute(
-                    """
-                    SELECT qty, status, confirmed_at
-                    FROM stock_reservations
-                    WHERE order_id = %s AND item_id = %s
-                    """,
-                    (payload.order_id, payload.item_id),
-                )
-                reservation = cur.fetchone()
-                if reservation:
-                    reserved_qty, status, confirmed_at = reservation
-                    if status == "RESERVED":
-                        if int(reserved_qty) != payload.qty:
-                            metrics["reserve_failed_total"] += 1
-                            raise HTTPException(status_code=409, detail="Reservation exists with different qty")
+        for _ in range(2):
+            with _db_conn() as conn:
+                with conn.cursor() as cur:
+                    cur.execute(RESERVE_ONE_SQL, params)
+                    taken, inserted, prior_qty, prior_status, prior_confirmed, item_exists, sharded = cur.fetchone()
+                    if sharded and not taken and prior_status is None:
+                        # Sharded items take from their buckets instead of the menu_items row.
+                        if not _take_sharded_stock(cur, payload.item_id, payload.qty):
+                            raise HTTPException(status_code=409, detail="Insufficient stock")
+                        cur.execute(
+                            """
+                            INSERT INTO stock_reservations(order_id, item_id, qty, status)
+                            VALUES (%(order_id)s, %(item_id)s, %(qty)s, 'RESERVED')
+                            ON CONFLICT (order_id, item_id) DO NOTHING
+                            """,
+                            params,
+                        )
+                        taken, inserted = 1, cur.rowcount
+                    if inserted:
+                        conn.commit()
+                        _publish_cache_invalidation("stock.changed", item_id=payload.item_id)
                         return {
                             "reserved": True,
-                            "already_reserved": True,
-                            "already_confirmed": confirmed_at is not None,
+                            "already_reserved": False,
                             "order_id": payload.order_id,
                             "item_id": payload.item_id,
                             "qty": payload.qty,
                         }
-                    metrics["reserve_failed_total"] += 1
-                    raise HTTPException(status_code=409, detail="Reservation already released")
+                    if taken:
+                        # A concurrent request inserted the same order+item first; undo and re-read it.
+                        conn.rollback()
+                        continue
+
+            # Idempotency: same order+item repeated should not deduct again.
+            if prior_status == "RESERVED":
+                if int(prior_qty) != payload.qty:
+                    raise HTTPException(status_code=409, detail="Reservation exists with different qty")
+                return {
+                    "reserved": True,
+                    "already_reserved": True,
+                    "already_confirmed": bool(prior_confirmed),
+                    "order_id": payload.order_id,
+                    "item_id": payload.item_id,
+                    "qty": payload.qty,
+                }
+            if prior_status is not None:
+                raise HTTPException(status_code=409, detail="Reservation already released")
+            if not item_exists:
+                raise HTTPException(status_code=404, detail="Item not found")
+            raise HTTPException(status_code=409, detail="Insufficient stock")
+        raise HTTPException(status_code=409, detail="Reservation already in progress")
+    except HTTPException:
+        metrics["reserve_failed_total"] += 1
+        raise
 
-                cur.execute("SELECT stock_quantity FROM menu_items WHERE id = %s FOR UPDATE", (payload.item_id,))
-                row = cur.fetchone()
-                if not row:
-                    metrics["reserve_failed_total"] += 1
-                    raise HTTPException(status_code=404, detail="Item not found")
 
-                current_qty = int(row[0])
-                if current_qty < payload.qty:
-                    metrics["reserve_failed_total"] += 1
-                    raise HTTPException(status_code=409, detail="Insufficient stock")
+@app.post("/stock/reserve-batch")
+def reserve_stock_batch(payload: ReserveBatchRequest):
+    _should_fail()
+    metrics["reserve_batch_total"] += 1
+
+    if not payload.items:
+        metrics["reserve_batch_failed_total"] += 1
+        raise HTTPException(status_code=422, detail="items must not be empty")
 
-                new_qty = current_qty - payload.qty
+    wanted: dict[str, int] = {}
+    for line in payload.items:
+        if line.qty <= 0:
+            metrics["reserve_batch_failed_total"] += 1
+            raise HTTPException(status_code=422, detail="qty must be positive")
+        wanted[line.item_id] = wanted.get(line.item_id, 0) + line.qty
+    item_ids = sorted(wanted)
+
+    if _stock_reservation_mode() == "redis":
+        try:
+            flags = _redis_reserve(payload.order_id, wanted)
+        except HTTPException:
+            metrics["reserve_batch_failed_total"] += 1
+            raise
+        for item_id in item_ids:
+            if not flags[item_id]:
+                _publish_cache_invalidation("stock.changed", item_id=item_id)
+        return {
+            "reserved": True,
+            "order_id": payload.order_id,
+            "items": [{"item_id": item_id, "qty": wanted[item_id], "already_reserved": flags[item_id]} for item_id in item_ids],
+        }
+
+    try:
+        with _db_conn() as conn:
+            with conn.cursor() as cur:
+                # Sharded items take from their buckets and never lock the menu_items row.
+                sharded = _sharded_items(cur, item_ids)
+                # Lock every other item row in id order so concurrent batches cannot deadlock.
                 cur.execute(
-                    "UPDATE menu_items SET stock_quantity = %s, available = %s WHERE id = %s",
-                    (new_qty, new_qty > 0, payload.item_id),
+                    """
+                    SELECT id, stock_quantity
+                    FROM menu_items
+                    WHERE id = ANY(%s)
+                    ORDER BY id
+                    FOR UPDATE
+                    """,
+                    ([item_id for item_id in item_ids if item_id not in sharded],),
                 )
+                stock = {row[0]: int(row[1]) for row in cur.fetchall()}
+                # Sharding an item locks its menu_items row first, so an item
+                # sharded while this batch waited for the rows shows up now.
+                sharded = _sharded_items(cur, item_ids)
+                missing = [item_id for item_id in item_ids if item_id not in stock and item_id not in sharded]
+                if missing:
+                    raise HTTPException(status_code=404, detail=f"Item {missing[0]} not found")
+
                 cur.execute(
                     """
-                    INSERT INTO stock_reservations(order_id, item_id, qty, status)
-                    VALUES (%s, %s, %s, 'RESERVED')
+                    SELECT item_id, qty, status
+                    FROM stock_reservations
+                    WHERE order_id = %s AND item_id = ANY(%s)
                     """,
-                    (payload.order_id, payload.item_id, payload.qty),
+                    (payload.order_id, item_ids),
                 )
+                existing = {row[0]: (int(row[1]), row[2]) for row in cur.fetchall()}
+
+                # Validate the whole order first; any failure rolls back every line.
+                to_reserve: list[tuple[str, int]] = []
+                results: list[dict[str, Any]] = []
+                for item_id in item_ids:
+                    qty = wanted[item_id]
+                    prior = existing.get(item_id)
+                    if prior:
+                        reserved_qty, status = prior
+                        if status != "RESERVED":
+                            raise HTTPException(status_code=409, detail="Reservation already released")
+                        if reserved_qty != qty:
+                            raise HTTPException(status_code=409, detail="Reservation exists with different qty")
+                        results.append({"item_id": item_id, "qty": qty, "already_reserved": True})
+                        continue
+                    if item_id not in sharded and stock[item_id] < qty:
+                        raise HTTPException(status_code=409, detail=f"Insufficient stock for item {item_id}")
+                    to_reserve.append((item_id, qty))
+                    results.append({"item_id": item_id, "qty": qty, "already_reserved": False})
+
+                for item_id, qty in to_reserve:
+                    if item_id in sharded:
+                        if not _take_sharded_stock(cur, item_id, qty):
+                            raise HTTPException(status_code=409, detail=f"Insufficient stock for item {item_id}")
+                        continue
+                    cur.execute(
+                        """
+                        UPDATE menu_items
+                        SET stock_quantity = stock_quantity - %s,
+                            available = stock_quantity - %s > 0
+                        WHERE id = %s
+                        """,
+                        (qty, qty, item_id),
+                    )
+                if to_reserve:
+                    cur.execute(
+                        """
+                        INSERT INTO stock_reservations(order_id, item_id, qty, status)
+                        SELECT %s, item_id, qty, 'RESERVED'
+                        FROM unnest(%s::text[], %s::int[]) AS lines(item_id, qty)
+                        """,
+                        (payload.order_id, [x[0] for x in to_reserve], [x[1] for x in to_reserve]),
+                    )
                 conn.commit()
-                _publish_cache_invalidation("stock.changed", item_id=payload.item_id)
+    except HTTPException:
+        metrics["reserve_batch_failed_total"] += 1
+        raise
 
-        return {
-            "reserved": True,
-            "already_reserved": False,
-            "order_id": payload.order_id,
-            "item_id": payload.item_id,
-            "qty": payload.qty,
-        }
-    finally:
-        if rc is not None:
-            try:
-                rc.delete(lock_key)
-            except Exception:
-                pass
+    for item_id, _ in to_reserve:
+        _publish_cache_invalidation("stock.changed", item_id=item_id)
+
+    return {"reserved": True, "order_id": payload.order_id, "items": results}
 
 
 @app.post("/stock/confirm")
@@ -352,6 +1438,25 @@ def confirm_stock(payload: ConfirmRequest):
     _should_fail()
     metrics["confirm_total"] += 1
 
+    redis_mode = _stock_reservation_mode() == "redis"
+    if redis_mode:
+        try:
+            outcome = _redis_confirm(payload.order_id)
+        except HTTPException:
+            metrics["confirm_failed_total"] += 1
+            raise
+        if outcome in ("confirmed", "already"):
+            # Postgres gets confirmed_at when the drainer reaches this order's entries.
+            return {
+                "confirmed": True,
+                "already_confirmed": outcome == "already",
+                "order_id": payload.order_id,
+            }
+        if outcome == "released":
+            metrics["confirm_failed_total"] += 1
+            raise HTTPException(status_code=409, detail="Reservation already released")
+        # missing: reserved before the counters held it; Postgres has every line.
+
     with _db_conn() as conn:
         with conn.cursor() as cur:
             cur.execute(
@@ -372,6 +1477,8 @@ def confirm_stock(payload: ConfirmRequest):
 
             if pending_count == 0:
                 if confirmed_count > 0:
+                    if redis_mode:
+                        _redis_mark_confirmed(payload.order_id)
                     return {
                         "confirmed": True,
                         "already_confirmed": True,
@@ -395,6 +1502,8 @@ def confirm_stock(payload: ConfirmRequest):
             )
             conn.commit()
 
+    if redis_mode:
+        _redis_mark_confirmed(payload.order_id)
     return {
         "confirmed": True,
         "already_confirmed": False,
@@ -407,6 +1516,9 @@ def release_stock(payload: ReleaseRequest):
     _should_fail()
     metrics["release_total"] += 1
 
+    if _stock_reservation_mode() == "redis":
+        return _release_stock_redis(payload.order_id)
+
     with _db_conn() as conn:
         with conn.cursor() as cur:
             cur.execute(
@@ -426,15 +1538,7 @@ def release_stock(payload: ReleaseRequest):
                 return {"released": True, "already_released": True, "order_id": payload.order_id}
 
             for item_id, qty in rows:
-                cur.execute(
-                    """
-                    UPDATE menu_items
-                    SET stock_quantity = stock_quantity + %s,
-                        available = TRUE
-                    WHERE id = %s
-                    """,
-                    (qty, item_id),
-                )
+                _return_stock(cur, item_id, qty)
                 _publish_cache_invalidation("stock.changed", item_id=str(item_id))
 
             cur.execute(
@@ -450,3 +1554,27 @@ def release_stock(payload: ReleaseRequest):
             conn.commit()
 
     return {"released": True, "already_released": False, "order_id": payload.order_id}
+
+
+def _release_stock_redis(order_id: str) -> dict[str, Any]:
+    # Lines already written behind are looked up in Postgres; queued ones live in the order hash.
+    with _db_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT item_id, qty
+                FROM stock_reservations
+                WHERE order_id = %s
+                  AND status = 'RESERVED'
+                  AND confirmed_at IS NULL
+                """,
+                (order_id,),
+            )
+            rows = [(str(row[0]), int(row[1])) for row in cur.fetchall()]
+    try:
+        released = _redis_release(order_id, rows, include_order_lines=True)
+    except redis.RedisError:
+        metrics["release_failed_total"] += 1
+        metrics["redis_stock_unavailable_total"] += 1
+        raise HTTPException(status_code=503, detail="Stock counters unavailable")
+    return {"released": True, "already_released": not released, "order_id": order_id}
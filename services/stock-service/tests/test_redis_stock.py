@@ -0,0 +1,117 @@
+import importlib.util
+import json
+from pathlib import Path
+
+import fakeredis
+import pytest
+
+
+MODULE_PATH = Path(__file__).resolve().parents[1] / "main.py"
+SPEC = importlib.util.spec_from_file_location("stock_service_main", MODULE_PATH)
+assert SPEC and SPEC.loader
+stock = importlib.util.module_from_spec(SPEC)
+SPEC.loader.exec_module(stock)
+
+
+@pytest.fixture
+def fake_redis(monkeypatch: pytest.MonkeyPatch):
+    client = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setitem(stock.redis_state, "client", client)
+    monkeypatch.setitem(stock.redis_state, "scripts", {})
+    monkeypatch.setattr(stock, "_publish_cache_invalidation", lambda *_args, **_kwargs: None)
+    return client
+
+
+def _qty(client, item_id: str) -> int:
+    return int(client.get(f"{stock.REDIS_STOCK_KEY_PREFIX}{item_id}"))
+
+
+def _queued(client) -> list[dict]:
+    return [json.loads(raw) for raw in client.lrange(stock.WRITE_BEHIND_KEY, 0, -1)]
+
+
+def test_reserve_decrements_counters_and_queues_write_behind(fake_redis) -> None:
+    fake_redis.set(f"{stock.REDIS_STOCK_KEY_PREFIX}1", 10)
+    fake_redis.set(f"{stock.REDIS_STOCK_KEY_PREFIX}2", 5)
+
+    assert stock._redis_reserve("o-1", {"1": 3, "2": 5}) == {"1": False, "2": False}
+
+    assert _qty(fake_redis, "1") == 7
+    assert _qty(fake_redis, "2") == 0
+    assert [(e["op"], e["item_id"], e["qty"]) for e in _queued(fake_redis)] == [
+        ("reserve", "1", 3),
+        ("reserve", "2", 5),
+    ]
+    assert fake_redis.get(stock.WRITE_BEHIND_PUSHED_KEY) == "2"
+
+
+def test_reserve_replay_does_not_deduct_again(fake_redis) -> None:
+    fake_redis.set(f"{stock.REDIS_STOCK_KEY_PREFIX}1", 10)
+    stock._redis_reserve("o-1", {"1": 3})
+
+    assert stock._redis_reserve("o-1", {"1": 3}) == {"1": True}
+    assert _qty(fake_redis, "1") == 7
+    assert len(_queued(fake_redis)) == 1
+
+    with pytest.raises(stock.HTTPException) as exc:
+        stock._redis_reserve("o-1", {"1": 4})
+    assert exc.value.status_code == 409
+
+
+def test_reserve_is_all_or_nothing(fake_redis) -> None:
+    fake_redis.set(f"{stock.REDIS_STOCK_KEY_PREFIX}1", 10)
+    fake_redis.set(f"{stock.REDIS_STOCK_KEY_PREFIX}2", 1)
+
+    with pytest.raises(stock.HTTPException) as exc:
+        stock._redis_reserve("o-1", {"1": 3, "2": 2})
+
+    assert exc.value.status_code == 409
+    assert "2" in exc.value.detail
+    assert _qty(fake_redis, "1") == 10
+    assert _queued(fake_redis) == []
+
+
+def test_reserve_loads_missing_counters_once(fake_redis, monkeypatch: pytest.MonkeyPatch) -> None:
+    loads: list[list[str]] = []
+
+    def load(item_ids: list[str]) -> None:
+        loads.append(item_ids)
+        fake_redis.set(f"{stock.REDIS_STOCK_KEY_PREFIX}1", 4, nx=True)
+
+    monkeypatch.setattr(stock, "_load_redis_stock", load)
+
+    assert stock._redis_reserve("o-1", {"1": 4}) == {"1": False}
+    assert loads == [["1"]]
+    assert _qty(fake_redis, "1") == 0
+
+
+def test_release_returns_stock_once(fake_redis) -> None:
+    fake_redis.set(f"{stock.REDIS_STOCK_KEY_PREFIX}1", 10)
+    stock._redis_reserve("o-1", {"1": 3})
+
+    assert stock._redis_release("o-1", [], include_order_lines=True) == ["1"]
+    assert stock._redis_release("o-1", [], include_order_lines=True) == []
+
+    assert _qty(fake_redis, "1") == 10
+    assert [e["op"] for e in _queued(fake_redis)] == ["reserve", "release"]
+    with pytest.raises(stock.HTTPException) as exc:
+        stock._redis_reserve("o-1", {"1": 3})
+    assert exc.value.detail == "Reservation already released"
+
+
+def test_release_skips_confirmed_orders(fake_redis) -> None:
+    fake_redis.set(f"{stock.REDIS_STOCK_KEY_PREFIX}1", 10)
+    stock._redis_reserve("o-1", {"1": 3})
+    stock._redis_mark_confirmed("o-1")
+
+    assert stock._redis_release("o-1", [], include_order_lines=True) == []
+    assert _qty(fake_redis, "1") == 7
+
+
+def test_release_of_postgres_only_lines_uses_their_qty(fake_redis) -> None:
+    # The order hash expired, but Postgres still lists the line.
+    fake_redis.set(f"{stock.REDIS_STOCK_KEY_PREFIX}1", 6)
+
+    assert stock._redis_release("o-1", [("1", 4)], include_order_lines=False) == ["1"]
+    assert _qty(fake_redis, "1") == 10
+    assert _queued(fake_redis)[0]["qty"] == 4
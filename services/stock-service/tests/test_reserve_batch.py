@@ -0,0 +1,166 @@
+import importlib.util
+from pathlib import Path
+
+import pytest
+
+
+MODULE_PATH = Path(__file__).resolve().parents[1] / "main.py"
+SPEC = importlib.util.spec_from_file_location("stock_service_main", MODULE_PATH)
+assert SPEC and SPEC.loader
+stock = importlib.util.module_from_spec(SPEC)
+SPEC.loader.exec_module(stock)
+
+
+class FakeCursor:
+    """Serves the statements reserve_stock_batch issues from the FakeDb tables."""
+
+    def __init__(self, db: "FakeDb") -> None:
+        self.db = db
+        self.rows: list[tuple] = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_exc):
+        return False
+
+    def execute(self, sql: str, params=None) -> None:
+        sql = " ".join(sql.split())
+        self.db.executed.append((sql, params))
+        if sql.startswith("SELECT item_id FROM stock_shards"):
+            self.rows = [(item_id,) for item_id in sorted(set(params[0]) & self.db.sharded)]
+        elif sql.startswith("SELECT id, stock_quantity FROM menu_items"):
+            self.rows = [(item_id, self.db.stock[item_id]) for item_id in sorted(params[0]) if item_id in self.db.stock]
+        elif sql.startswith("SELECT item_id, qty, status FROM stock_reservations"):
+            order_id, item_ids = params
+            self.rows = [
+                (item_id, qty, status)
+                for (order, item_id), (qty, status) in self.db.reservations.items()
+                if order == order_id and item_id in item_ids
+            ]
+        elif sql.startswith("UPDATE menu_items"):
+            qty, _, item_id = params
+            self.db.pending_stock[item_id] = self.db.pending_stock.get(item_id, self.db.stock[item_id]) - qty
+        elif sql.startswith("INSERT INTO stock_reservations"):
+            order_id, item_ids, qtys = params
+            for item_id, qty in zip(item_ids, qtys):
+                self.db.pending_reservations[(order_id, item_id)] = (qty, "RESERVED")
+
+    def fetchall(self):
+        return self.rows
+
+
+class FakeDb:
+    def __init__(self, stock_levels: dict[str, int]) -> None:
+        self.stock = dict(stock_levels)
+        self.sharded: set[str] = set()
+        self.reservations: dict[tuple[str, str], tuple[int, str]] = {}
+        self.pending_stock: dict[str, int] = {}
+        self.pending_reservations: dict[tuple[str, str], tuple[int, str]] = {}
+        self.executed: list[tuple[str, object]] = []
+        self.commits = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_exc):
+        # Leaving without commit rolls back, as psycopg does on an exception.
+        self.pending_stock = {}
+        self.pending_reservations = {}
+        return False
+
+    def cursor(self) -> FakeCursor:
+        return FakeCursor(self)
+
+    def commit(self) -> None:
+        self.stock.update(self.pending_stock)
+        self.reservations.update(self.pending_reservations)
+        self.commits += 1
+
+
+@pytest.fixture
+def db(monkeypatch: pytest.MonkeyPatch) -> FakeDb:
+    fake = FakeDb({"a": 5, "b": 1, "c": 9})
+    monkeypatch.setenv("STOCK_RESERVATION_MODE", "db")
+    monkeypatch.setattr(stock, "_db_conn", lambda: fake)
+    monkeypatch.setattr(stock, "_publish_cache_invalidation", lambda *_args, **_kwargs: None)
+    return fake
+
+
+def _reserve(*lines: tuple[str, int], order_id: str = "o-1") -> dict:
+    items = [{"item_id": item_id, "qty": qty} for item_id, qty in lines]
+    return stock.reserve_stock_batch(stock.ReserveBatchRequest(order_id=order_id, items=items))
+
+
+def test_batch_rejects_every_line_when_one_is_short(db: FakeDb) -> None:
+    with pytest.raises(stock.HTTPException) as exc:
+        _reserve(("a", 2), ("b", 3))
+
+    assert (exc.value.status_code, exc.value.detail) == (409, "Insufficient stock for item b")
+    assert db.stock == {"a": 5, "b": 1, "c": 9}
+    assert db.reservations == {} and db.commits == 0
+    assert not any(sql.startswith("UPDATE") for sql, _ in db.executed)
+
+
+def test_batch_merges_duplicate_item_ids(db: FakeDb) -> None:
+    result = _reserve(("a", 1), ("c", 4), ("a", 2))
+
+    assert result["items"] == [
+        {"item_id": "a", "qty": 3, "already_reserved": False},
+        {"item_id": "c", "qty": 4, "already_reserved": False},
+    ]
+    assert db.stock == {"a": 2, "b": 1, "c": 5}
+    assert db.reservations == {("o-1", "a"): (3, "RESERVED"), ("o-1", "c"): (4, "RESERVED")}
+
+
+def test_batch_locks_item_rows_in_id_order(db: FakeDb) -> None:
+    _reserve(("c", 1), ("a", 1), ("b", 1))
+
+    locks = [(sql, params) for sql, params in db.executed if sql.startswith("SELECT id, stock_quantity FROM menu_items")]
+    assert len(locks) == 1
+    sql, params = locks[0]
+    assert sql.endswith("ORDER BY id FOR UPDATE")
+    assert params == (["a", "b", "c"],)
+    updates = [params[2] for sql, params in db.executed if sql.startswith("UPDATE menu_items")]
+    assert updates == ["a", "b", "c"]
+
+
+def test_batch_replay_returns_the_original_lines_without_deducting_again(db: FakeDb) -> None:
+    first = _reserve(("a", 2), ("b", 1))
+    replay = _reserve(("b", 1), ("a", 2))
+
+    assert [(line["item_id"], line["qty"]) for line in replay["items"]] == [
+        (line["item_id"], line["qty"]) for line in first["items"]
+    ]
+    assert all(line["already_reserved"] for line in replay["items"])
+    assert db.stock == {"a": 3, "b": 0, "c": 9}
+
+
+def test_batch_replay_with_a_different_qty_is_rejected(db: FakeDb) -> None:
+    _reserve(("a", 2))
+
+    with pytest.raises(stock.HTTPException) as exc:
+        _reserve(("a", 3))
+    assert (exc.value.status_code, exc.value.detail) == (409, "Reservation exists with different qty")
+    assert db.stock["a"] == 3
+
+
+def test_batch_takes_an_item_sharded_while_it_waited_from_its_buckets(db: FakeDb, monkeypatch: pytest.MonkeyPatch) -> None:
+    taken: list[tuple[str, int]] = []
+    monkeypatch.setattr(stock, "_take_sharded_stock", lambda _cur, item_id, qty: taken.append((item_id, qty)) or True)
+    reads = {"count": 0}
+    sharded_items = stock._sharded_items
+
+    def sharded_after_first_read(cur, item_ids):
+        # "c" is sharded by an admin between the first read and the row locks.
+        reads["count"] += 1
+        if reads["count"] == 2:
+            db.sharded.add("c")
+        return sharded_items(cur, item_ids)
+
+    monkeypatch.setattr(stock, "_sharded_items", sharded_after_first_read)
+
+    _reserve(("a", 1), ("c", 2))
+
+    assert taken == [("c", 2)]
+    assert db.stock == {"a": 4, "b": 1, "c": 9}
@@ -0,0 +1,157 @@
+import importlib.util
+from pathlib import Path
+
+import pytest
+
+
+MODULE_PATH = Path(__file__).resolve().parents[1] / "main.py"
+SPEC = importlib.util.spec_from_file_location("stock_service_main", MODULE_PATH)
+assert SPEC and SPEC.loader
+stock = importlib.util.module_from_spec(SPEC)
+SPEC.loader.exec_module(stock)
+
+
+class FakeCursor:
+    def __init__(self, conn: "FakeConn") -> None:
+        self.conn = conn
+        self.rowcount = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_exc):
+        return False
+
+    def execute(self, sql: str, params=None) -> None:
+        self.conn.executed.append(sql)
+        if sql == stock.RESERVE_ONE_SQL:
+            self.row = self.conn.rows.pop(0)
+        else:
+            self.rowcount = 1
+
+    def fetchone(self):
+        return self.row
+
+
+class FakeConn:
+    def __init__(self, rows: list[tuple]) -> None:
+        self.rows = rows
+        self.executed: list[str] = []
+        self.commits = 0
+        self.rollbacks = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_exc):
+        return False
+
+    def cursor(self) -> FakeCursor:
+        return FakeCursor(self)
+
+    def commit(self) -> None:
+        self.commits += 1
+
+    def rollback(self) -> None:
+        self.rollbacks += 1
+
+
+@pytest.fixture
+def db(monkeypatch: pytest.MonkeyPatch):
+    holder: dict = {}
+
+    def connect():
+        return holder["conn"]
+
+    monkeypatch.setenv("STOCK_RESERVATION_MODE", "db")
+    monkeypatch.setattr(stock, "_db_conn", connect)
+    monkeypatch.setattr(stock, "_publish_cache_invalidation", lambda *_args, **_kwargs: None)
+
+    def use(*rows: tuple) -> FakeConn:
+        holder["conn"] = FakeConn(list(rows))
+        return holder["conn"]
+
+    return use
+
+
+def _reserve(qty: int = 2) -> dict:
+    return stock.reserve_stock(stock.ReserveRequest(order_id="o-1", item_id="1", qty=qty))
+
+
+# RESERVE_ONE_SQL columns: taken, inserted, prior qty, prior status, prior confirmed, item exists, sharded.
+
+
+def test_reserve_one_sql_guards_the_decrement() -> None:
+    sql = " ".join(stock.RESERVE_ONE_SQL.split())
+    assert "AND stock_quantity >= %(qty)s" in sql
+    assert "AND NOT EXISTS (SELECT 1 FROM existing)" in sql
+    assert "AND NOT EXISTS (SELECT 1 FROM stock_shards WHERE item_id = %(item_id)s)" in sql
+    assert "ON CONFLICT (order_id, item_id) DO NOTHING" in sql
+
+
+def test_reserve_takes_stock_in_one_statement(db) -> None:
+    conn = db((1, 1, None, None, None, True, False))
+
+    assert _reserve()["already_reserved"] is False
+    assert conn.executed == [stock.RESERVE_ONE_SQL]
+    assert conn.commits == 1
+
+
+def test_reserve_replay_reports_existing_reservation(db) -> None:
+    db((0, 0, 2, "RESERVED", True, True, False))
+
+    result = _reserve()
+
+    assert result["already_reserved"] is True
+    assert result["already_confirmed"] is True
+
+
+def test_reserve_replay_with_other_qty_conflicts(db) -> None:
+    db((0, 0, 3, "RESERVED", False, True, False))
+    with pytest.raises(stock.HTTPException) as exc:
+        _reserve()
+    assert exc.value.detail == "Reservation exists with different qty"
+
+
+@pytest.mark.parametrize(
+    ("row", "status", "detail"),
+    [
+        ((0, 0, None, None, None, True, False), 409, "Insufficient stock"),
+        ((0, 0, None, None, None, False, False), 404, "Item not found"),
+        ((0, 0, 2, "RELEASED", False, True, False), 409, "Reservation already released"),
+    ],
+)
+def test_reserve_failures(db, row: tuple, status: int, detail: str) -> None:
+    db(row)
+    with pytest.raises(stock.HTTPException) as exc:
+        _reserve()
+    assert (exc.value.status_code, exc.value.detail) == (status, detail)
+
+
+def test_reserve_rereads_after_losing_an_insert_race(db) -> None:
+    conn = db((1, 0, None, None, None, True, False), (0, 0, 2, "RESERVED", False, True, False))
+
+    assert _reserve()["already_reserved"] is True
+    assert conn.rollbacks == 1
+    assert conn.commits == 0
+
+
+def test_reserve_takes_sharded_items_from_buckets(db, monkeypatch: pytest.MonkeyPatch) -> None:
+    taken: list[tuple[str, int]] = []
+    monkeypatch.setattr(stock, "_take_sharded_stock", lambda _cur, item_id, qty: taken.append((item_id, qty)) or True)
+    conn = db((0, 0, None, None, None, True, True))
+
+    assert _reserve()["already_reserved"] is False
+    assert taken == [("1", 2)]
+    assert "INSERT INTO stock_reservations" in conn.executed[1]
+    assert conn.commits == 1
+
+
+def test_reserve_sharded_item_out_of_stock(db, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(stock, "_take_sharded_stock", lambda _cur, _item_id, _qty: False)
+    conn = db((0, 0, None, None, None, True, True))
+
+    with pytest.raises(stock.HTTPException) as exc:
+        _reserve()
+    assert exc.value.status_code == 409
+    assert conn.commits == 0
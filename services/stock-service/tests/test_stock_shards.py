@@ -0,0 +1,169 @@
+import importlib.util
+from pathlib import Path
+
+import pytest
+
+
+MODULE_PATH = Path(__file__).resolve().parents[1] / "main.py"
+SPEC = importlib.util.spec_from_file_location("stock_service_main", MODULE_PATH)
+assert SPEC and SPEC.loader
+stock = importlib.util.module_from_spec(SPEC)
+SPEC.loader.exec_module(stock)
+
+
+class ScriptedCursor:
+    """Answers each execute() with the next scripted result (rows for fetchone/fetchall)."""
+
+    def __init__(self, results: list) -> None:
+        self.results = list(results)
+        self.executed: list[str] = []
+        self.current: list = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_exc):
+        return False
+
+    def execute(self, sql: str, params=None) -> None:
+        self.executed.append(" ".join(sql.split()))
+        self.current = self.results.pop(0) if self.results else []
+
+    def fetchone(self):
+        return self.current[0] if self.current else None
+
+    def fetchall(self):
+        return self.current
+
+
+class FakeConn:
+    def __init__(self, cursor: ScriptedCursor) -> None:
+        self._cursor = cursor
+        self.commits = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_exc):
+        return False
+
+    def cursor(self) -> ScriptedCursor:
+        return self._cursor
+
+    def commit(self) -> None:
+        self.commits += 1
+
+
+def test_even_split_spreads_remainder_over_first_buckets() -> None:
+    assert stock._even_split(10, 4) == [3, 3, 2, 2]
+    assert stock._even_split(3, 4) == [1, 1, 1, 0]
+    assert sum(stock._even_split(1001, 7)) == 1001
+
+
+def test_shards_skewed_ignores_an_even_split(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("STOCK_SHARD_REBALANCE_SKEW", "0.5")
+    assert not stock._shards_skewed([1, 1, 1, 0], 3)
+    assert not stock._shards_skewed([25, 25, 25, 25], 100)
+    # Normal reservation traffic inside the allowed spread (11 units here).
+    assert not stock._shards_skewed([25, 20, 25, 18], 88)
+
+
+def test_shards_skewed_flags_a_drained_bucket(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("STOCK_SHARD_REBALANCE_SKEW", "0.5")
+    assert stock._shards_skewed([25, 25, 25, 0], 75)
+    monkeypatch.setenv("STOCK_SHARD_REBALANCE_SKEW", "2")
+    assert not stock._shards_skewed([25, 25, 25, 0], 75)
+
+
+def test_lock_item_shards_locks_in_order_and_takes_the_admins_quantity() -> None:
+    cur = ScriptedCursor([[(110,)], [(4, 100)], [(20,), (25,), (25,), (25,)]])
+
+    # Mirror says 110 against 100 last synced: an admin set the stock to 110.
+    # The buckets sold 5 since the last sync; that must not come off the edit.
+    assert stock._lock_item_shards(cur, "1") == (110, 4, [20, 25, 25, 25], 110)
+    assert [sql.split(" FROM ")[1].split()[0] for sql in cur.executed] == ["menu_items", "stock_shards", "stock_buckets"]
+    assert all(sql.endswith("FOR UPDATE") for sql in cur.executed)
+
+
+def test_lock_item_shards_without_an_edit_uses_the_buckets() -> None:
+    cur = ScriptedCursor([[(100,)], [(4, 100)], [(20,), (25,), (25,), (25,)]])
+    assert stock._lock_item_shards(cur, "1")[3] == 95
+
+
+def test_lock_item_shards_for_unsharded_and_missing_items() -> None:
+    assert stock._lock_item_shards(ScriptedCursor([[(7,)], []]), "1") == (7, 1, [], 7)
+    assert stock._lock_item_shards(ScriptedCursor([[]]), "404") is None
+
+
+def _run_rebalance(monkeypatch: pytest.MonkeyPatch, state: tuple, locked=None, synced=(10, 9)):
+    calls: list[tuple] = []
+    monkeypatch.setenv("STOCK_SHARD_REBALANCE_SKEW", "0.5")
+    monkeypatch.setattr(stock, "_db_conn", lambda: FakeConn(ScriptedCursor([[state]])))
+    monkeypatch.setattr(stock, "_sync_item_mirror", lambda _cur, item_id: calls.append(("sync", item_id)) or synced)
+    monkeypatch.setattr(stock, "_lock_item_shards", lambda _cur, item_id: calls.append(("lock", item_id)) or locked)
+    monkeypatch.setattr(
+        stock, "_rebalance_item_buckets", lambda _cur, item_id, count, total: calls.append(("even", item_id, count, total))
+    )
+    monkeypatch.setattr(
+        stock, "_write_item_shards", lambda _cur, item_id, count, total: calls.append(("rewrite", item_id, count, total))
+    )
+    monkeypatch.setattr(
+        stock, "_publish_cache_invalidation", lambda event, item_id=None: calls.append(("publish", item_id))
+    )
+    rebalanced = stock._rebalance_stock_shards_once()
+    return rebalanced, calls
+
+
+def test_rebalance_leaves_synced_items_alone(monkeypatch: pytest.MonkeyPatch) -> None:
+    assert _run_rebalance(monkeypatch, ("1", 4, 100, 100, [25, 25, 25, 25])) == (0, [])
+
+
+def test_rebalance_only_syncs_the_mirror_for_small_drift(monkeypatch: pytest.MonkeyPatch) -> None:
+    rebalanced, calls = _run_rebalance(monkeypatch, ("1", 4, 100, 100, [25, 20, 25, 25]), synced=(100, 95))
+    assert rebalanced == 0
+    assert calls == [("sync", "1")]
+
+
+def test_rebalance_evens_out_a_skewed_item_in_place(monkeypatch: pytest.MonkeyPatch) -> None:
+    rebalanced, calls = _run_rebalance(
+        monkeypatch, ("1", 4, 100, 100, [25, 25, 25, 0]), locked=(100, 4, [25, 25, 25, 0], 75)
+    )
+    assert rebalanced == 1
+    assert calls == [("lock", "1"), ("even", "1", 4, 75)]
+
+
+def test_rebalance_folds_admin_edits_into_buckets(monkeypatch: pytest.MonkeyPatch) -> None:
+    rebalanced, calls = _run_rebalance(
+        monkeypatch, ("1", 4, 0, 40, [0, 0, 0, 0]), locked=(40, 4, [0, 0, 0, 0], 40)
+    )
+    assert rebalanced == 1
+    # The mirror already showed the admin's 40, so availability did not flip.
+    assert calls == [("lock", "1"), ("even", "1", 4, 40)]
+
+
+def test_rebalance_recreates_missing_bucket_rows(monkeypatch: pytest.MonkeyPatch) -> None:
+    rebalanced, calls = _run_rebalance(
+        monkeypatch, ("1", 4, 30, 30, [10, 10, 10]), locked=(30, 4, [10, 10, 10], 30)
+    )
+    assert rebalanced == 1
+    assert calls == [("lock", "1"), ("rewrite", "1", 4, 30)]
+
+
+def test_rebalance_publishes_when_mirror_sync_marks_sold_out(monkeypatch: pytest.MonkeyPatch) -> None:
+    rebalanced, calls = _run_rebalance(monkeypatch, ("1", 2, 2, 2, [0, 0]), synced=(2, 0))
+    assert rebalanced == 0
+    assert calls == [("sync", "1"), ("publish", "1")]
+
+
+def test_sync_item_mirror_backs_off_for_pending_admin_edit() -> None:
+    cur = ScriptedCursor([[(110,)], [(100,)]])
+    assert stock._sync_item_mirror(cur, "1") is None
+    assert len(cur.executed) == 2
+    assert not any("stock_buckets" in sql for sql in cur.executed)
+
+
+def test_sync_item_mirror_copies_bucket_total_without_locking_buckets() -> None:
+    cur = ScriptedCursor([[(100,)], [(100,)], [(93,)], [], []])
+    assert stock._sync_item_mirror(cur, "1") == (100, 93)
+    bucket_reads = [sql for sql in cur.executed if "stock_buckets" in sql]
+    assert bucket_reads and not any("FOR UPDATE" in sql for sql in bucket_reads)
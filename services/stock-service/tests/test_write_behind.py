@@ -0,0 +1,200 @@
+import importlib.util
+import json
+from pathlib import Path
+
+import fakeredis
+import pytest
+
+
+MODULE_PATH = Path(__file__).resolve().parents[1] / "main.py"
+SPEC = importlib.util.spec_from_file_location("stock_service_main", MODULE_PATH)
+assert SPEC and SPEC.loader
+stock = importlib.util.module_from_spec(SPEC)
+SPEC.loader.exec_module(stock)
+
+
+class FakeCursor:
+    def __init__(self, conn: "FakeConn") -> None:
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_exc):
+        return False
+
+    def execute(self, sql: str, params=None) -> None:
+        if params in self.conn.failing:
+            raise stock.psycopg.Error("item deleted")
+        self.conn.pending.append((sql, params))
+
+    def executemany(self, sql: str, params_seq) -> None:
+        for params in params_seq:
+            self.execute(sql, params)
+
+    def fetchall(self):
+        return self.conn.rows
+
+
+class FakeConn:
+    def __init__(self, rows=None, failing=()) -> None:
+        self.rows = rows or []
+        self.failing = list(failing)
+        self.pending: list[tuple[str, object]] = []
+        self.committed: list[tuple[str, object]] = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_exc):
+        return False
+
+    def cursor(self) -> FakeCursor:
+        return FakeCursor(self)
+
+    def commit(self) -> None:
+        self.committed += self.pending
+        self.pending = []
+
+    def rollback(self) -> None:
+        self.pending = []
+
+
+@pytest.fixture
+def fake_redis(monkeypatch: pytest.MonkeyPatch):
+    client = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setitem(stock.redis_state, "client", client)
+    monkeypatch.setitem(stock.redis_state, "scripts", {})
+    monkeypatch.setattr(stock, "_publish_cache_invalidation", lambda *_args, **_kwargs: None)
+    client.set(f"{stock.REDIS_STOCK_KEY_PREFIX}1", 10)
+    client.set(f"{stock.REDIS_STOCK_KEY_PREFIX}2", 10)
+    return client
+
+
+def test_apply_write_behind_runs_reserves_before_releases_and_confirms(monkeypatch: pytest.MonkeyPatch) -> None:
+    conn = FakeConn()
+    monkeypatch.setattr(stock, "_db_conn", lambda: conn)
+
+    stock._apply_write_behind(
+        [
+            '{"op": "reserve", "order_id": "o-1", "item_id": "1", "qty": 2}',
+            '{"op": "release", "order_id": "o-1", "item_id": "1", "qty": 2}',
+            '{"op": "reserve", "order_id": "o-2", "item_id": "2", "qty": 1}',
+            '{"op": "confirm", "order_id": "o-2", "item_id": "2", "qty": 1}',
+        ]
+    )
+
+    assert [params for _, params in conn.committed] == [("o-1", "1", 2), ("o-2", "2", 1), ("o-1", "1"), ("o-2", "2")]
+    assert [sql for sql, _ in conn.committed[2:]] == [stock.RELEASE_WRITE_BEHIND_SQL, stock.CONFIRM_WRITE_BEHIND_SQL]
+
+
+def test_apply_write_behind_skips_a_bad_entry(monkeypatch: pytest.MonkeyPatch) -> None:
+    conn = FakeConn(failing=[("o-1", "gone", 1)])
+    monkeypatch.setattr(stock, "_db_conn", lambda: conn)
+    failed_before = stock.metrics["write_behind_failed_total"]
+
+    stock._apply_write_behind(
+        [
+            '{"op": "reserve", "order_id": "o-1", "item_id": "gone", "qty": 1}',
+            '{"op": "reserve", "order_id": "o-1", "item_id": "1", "qty": 2}',
+        ]
+    )
+
+    assert [params for _, params in conn.committed] == [("o-1", "1", 2)]
+    assert stock.metrics["write_behind_failed_total"] == failed_before + 1
+
+
+def test_drain_applies_queue_and_advances_applied_counter(fake_redis, monkeypatch: pytest.MonkeyPatch) -> None:
+    applied: list[list[str]] = []
+    monkeypatch.setattr(stock, "_apply_write_behind", applied.append)
+    stock._redis_reserve("o-1", {"1": 2, "2": 3})
+
+    assert stock._drain_write_behind_once() == 2
+    assert len(applied[0]) == 2
+    assert stock._write_behind_backlog() == 0
+    assert fake_redis.get(stock.WRITE_BEHIND_LEASE_KEY) is None
+    assert stock._drain_write_behind_once() == 0
+
+
+def test_drain_replays_a_dead_drainers_batch_first(fake_redis, monkeypatch: pytest.MonkeyPatch) -> None:
+    applied: list[list[str]] = []
+    stock._redis_reserve("o-1", {"1": 2})
+
+    def crash(_entries: list[str]) -> None:
+        raise RuntimeError("worker died")
+
+    monkeypatch.setattr(stock, "_apply_write_behind", crash)
+    with pytest.raises(RuntimeError):
+        stock._drain_write_behind_once()
+    stock._redis_reserve("o-2", {"2": 1})
+
+    monkeypatch.setattr(stock, "_apply_write_behind", applied.append)
+    assert stock._drain_write_behind_once() == 1
+    assert '"o-1"' in applied[0][0]
+    assert stock._drain_write_behind_once() == 1
+    assert '"o-2"' in applied[1][0]
+    assert stock._write_behind_backlog() == 0
+
+
+def test_drain_backs_off_while_another_drainer_holds_the_lease(fake_redis) -> None:
+    fake_redis.set(stock.WRITE_BEHIND_LEASE_KEY, "other", ex=30)
+    stock._redis_reserve("o-1", {"1": 2})
+
+    assert stock._drain_write_behind_once() is None
+    assert stock._write_behind_backlog() == 1
+
+
+def test_confirm_answers_from_redis_without_waiting_on_the_backlog(fake_redis, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("STOCK_RESERVATION_MODE", "redis")
+    # Another drainer holds the lease, so nothing queued reaches Postgres meanwhile.
+    fake_redis.set(stock.WRITE_BEHIND_LEASE_KEY, "other", ex=30)
+    monkeypatch.setattr(stock, "_db_conn", lambda: pytest.fail("confirm must not read Postgres"))
+    stock._redis_reserve("o-0", {"2": 1})
+    stock._redis_reserve("o-1", {"1": 2, "2": 3})
+
+    result = stock.confirm_stock(stock.ConfirmRequest(order_id="o-1"))
+
+    assert result == {"confirmed": True, "already_confirmed": False, "order_id": "o-1"}
+    queued = fake_redis.lrange(stock.WRITE_BEHIND_KEY, 0, -1)
+    confirms = [entry for entry in map(json.loads, queued) if entry["op"] == "confirm"]
+    assert sorted((entry["order_id"], entry["item_id"], entry["qty"]) for entry in confirms) == [
+        ("o-1", "1", 2),
+        ("o-1", "2", 3),
+    ]
+    assert stock._write_behind_backlog() == len(queued)
+    again = stock.confirm_stock(stock.ConfirmRequest(order_id="o-1"))
+    assert again["already_confirmed"] is True
+    assert stock._redis_release("o-1", [], include_order_lines=True) == []
+
+
+def test_confirm_of_a_released_reservation_is_409(fake_redis, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("STOCK_RESERVATION_MODE", "redis")
+    stock._redis_reserve("o-1", {"1": 2})
+    stock._redis_release("o-1", [], include_order_lines=True)
+
+    with pytest.raises(stock.HTTPException) as exc:
+        stock.confirm_stock(stock.ConfirmRequest(order_id="o-1"))
+    assert exc.value.status_code == 409
+
+
+def test_reconcile_nets_out_queued_entries(fake_redis, monkeypatch: pytest.MonkeyPatch) -> None:
+    # Postgres has not seen o-1 yet, so its reservation is still queued.
+    stock._redis_reserve("o-1", {"1": 2})
+    assert stock._redis_confirm("o-1") == "confirmed"
+    fake_redis.set(f"{stock.REDIS_STOCK_KEY_PREFIX}2", 99)
+    monkeypatch.setattr(stock, "_db_conn", lambda: FakeConn(rows=[("1", 10), ("2", 4), ("3", 6)]))
+
+    assert stock._reconcile_redis_stock_once() == 2
+
+    assert fake_redis.get(f"{stock.REDIS_STOCK_KEY_PREFIX}1") == "8"
+    assert fake_redis.get(f"{stock.REDIS_STOCK_KEY_PREFIX}2") == "4"
+    assert fake_redis.get(f"{stock.REDIS_STOCK_KEY_PREFIX}3") == "6"
+    assert fake_redis.get(stock.WRITE_BEHIND_LEASE_KEY) is None
+
+
+def test_reconcile_waits_for_an_unacked_batch(fake_redis, monkeypatch: pytest.MonkeyPatch) -> None:
+    fake_redis.rpush(stock.WRITE_BEHIND_PROCESSING_KEY, '{"op": "reserve", "order_id": "o-1", "item_id": "1", "qty": 2}')
+    monkeypatch.setattr(stock, "_db_conn", lambda: FakeConn(rows=[("1", 3)]))
+
+    assert stock._reconcile_redis_stock_once() is None
+    assert fake_redis.get(f"{stock.REDIS_STOCK_KEY_PREFIX}1") == "10"